@@ -0,0 +1,47 @@
+"""Shared fixtures of the ezpadova benchmarks.
+
+Grids span 10^3 rows up to `EZPADOVA_BENCH_MAX_ROWS` rows (default 10^5).
+Set it to 10^7 to run the full-scale suite, e.g. before a release::
+
+    EZPADOVA_BENCH_MAX_ROWS=10000000 pytest benchmarks --benchmark-json=bench.json
+"""
+import os
+from functools import cache
+
+import pytest
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    # the suite requires pytest-benchmark: pip install ".[benchmark]"
+    collect_ignore_glob = ["test_*.py"]
+
+from ezpadova.config import configuration
+from ezpadova.testing import format_cmd_output, make_isochrone_grid
+
+MAX_ROWS = int(float(os.environ.get("EZPADOVA_BENCH_MAX_ROWS", "1e5")))
+SIZES = [n for n in (10**3, 10**4, 10**5, 10**6, 10**7) if n <= MAX_ROWS]
+
+
+@cache
+def synthetic_grid(n_rows: int):
+    """Synthetic isochrone grid of `n_rows` rows (cached across benchmarks)"""
+    return make_isochrone_grid(n_rows)
+
+
+@cache
+def synthetic_output(n_rows: int) -> bytes:
+    """Synthetic CMD output of `n_rows` rows (cached across benchmarks)"""
+    return format_cmd_output(synthetic_grid(n_rows))
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"{n:.0e}rows")
+def n_rows(request) -> int:
+    """Number of rows of the synthetic grids"""
+    return request.param
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    """Benchmarks measure actual queries: disable the local cache"""
+    monkeypatch.setitem(configuration["cache"], "enabled", False)
@@ -0,0 +1,28 @@
+"""Benchmarks of :class:`ezpadova.interpolate.QuickInterpolator`"""
+from conftest import synthetic_grid
+
+from ezpadova.interpolate import QuickInterpolator
+
+
+def test_quickinterpolator_init(benchmark, n_rows):
+    grid = synthetic_grid(n_rows)
+    benchmark.extra_info["rows"] = n_rows
+    benchmark(QuickInterpolator, grid)
+
+
+def test_quickinterpolator_call(benchmark, n_rows):
+    interp = QuickInterpolator(synthetic_grid(n_rows))
+    benchmark.extra_info["rows"] = n_rows
+    logAge = 0.5 * (interp.coords["logAge"][0] + interp.coords["logAge"][-1]) + 0.01
+    MH = 0.5 * (interp.coords["MH"][0] + interp.coords["MH"][-1]) + 0.01
+    res = benchmark(interp, logAge, MH, what=["logL", "logTe", "Vmag"])
+    assert len(res) > 0
+
+
+def test_get_bracket_coordinates(benchmark, n_rows):
+    interp = QuickInterpolator(synthetic_grid(n_rows))
+    benchmark.extra_info["rows"] = n_rows
+    logAge = 0.5 * (interp.coords["logAge"][0] + interp.coords["logAge"][-1]) + 0.01
+    MH = 0.5 * (interp.coords["MH"][0] + interp.coords["MH"][-1]) + 0.01
+    res = benchmark(interp.get_bracket_coordinates, logAge, MH)
+    assert len(res) == 4
@@ -0,0 +1,31 @@
+"""Benchmarks of the query and parsing hot paths of :mod:`ezpadova.parsec`"""
+import pytest
+from conftest import synthetic_grid, synthetic_output
+
+from ezpadova.parsec import get_isochrones, parse_result, resample_evolution_label
+from ezpadova.testing import FakeCMDServer
+
+
+def test_parse_result(benchmark, n_rows):
+    data = synthetic_output(n_rows)
+    benchmark.extra_info["rows"] = n_rows
+    benchmark.extra_info["bytes"] = len(data)
+    df = benchmark(parse_result, data)
+    assert len(df) == len(synthetic_grid(n_rows))
+
+
+def test_resample_evolution_label(benchmark, n_rows):
+    grid = synthetic_grid(n_rows)
+    benchmark.extra_info["rows"] = n_rows
+    df = benchmark(resample_evolution_label, grid)
+    assert "evol" in df.columns
+
+
+@pytest.mark.parametrize("compress", [True, False], ids=["gzip", "plain"])
+def test_get_isochrones_end_to_end(benchmark, n_rows, compress):
+    data = synthetic_output(n_rows)
+    benchmark.extra_info["rows"] = n_rows
+    benchmark.extra_info["bytes"] = len(data)
+    with FakeCMDServer(payload=data, compress=compress):
+        df = benchmark(get_isochrones, logage=(6, 10, 0.1), MH=(-2, 0.3, 0.1))
+    assert len(df) == len(synthetic_grid(n_rows))
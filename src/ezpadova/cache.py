@@ -0,0 +1,465 @@
+"""Local cache of the isochrone tables downloaded from the CMD website.
+
+Tables are stored gzip-compressed in `configuration['cache']['directory']`
+(default `~/.cache/ezpadova`, or the `EZPADOVA_CACHE_DIR` environment
+variable), next to a JSON file describing the query that produced them.
+Entries are identified by the normalized query parameters
+(see :func:`ezpadova.parsec.normalize_query`).
+
+The cache is opt-in: it is used transparently by
+:func:`ezpadova.parsec.get_isochrones` when `configuration['cache']['enabled']`
+is set (disabled by default), and can be filled ahead of time with
+:func:`ezpadova.parsec.prefetch`. Entries never expire unless
+`configuration['cache']['max_age']` is set.
+
+With `configuration['cache']['layout'] = "normalized"`, parsed tables are
+stored instead of the raw website outputs, split in two column groups: the
+physical columns (`Mini`, `int_IMF`, `logL`, `label`, ...) are stored once per
+photometry-independent query (see :func:`physical_query`), and the magnitudes
+of each photometric system are stored separately. Tables are assembled on
+read, so a grid cached for many photometric systems only stores its physical
+block once. This layout only serves parsed tables (`return_df=True`), and
+does not read the entries of the default `"raw"` layout.
+"""
+
+from __future__ import annotations
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import time
+import zipfile
+from collections.abc import Iterator
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from .config import configuration
+from .tools import write_atomic
+
+#: query parameters that only change the magnitude columns of the tables
+PHOTOMETRY_KEYS = (
+    "photsys_file",
+    "photsys_version",
+    "dust_sourceM",
+    "dust_sourceC",
+    "extinction_av",
+    "extinction_coeff",
+    "extinction_curve",
+)
+
+LAYOUTS = ("raw", "normalized")
+
+#: query parameters describing the (age, metallicity) nodes of a query
+GRID_KEYS = (
+    "isoc_isagelog",
+    "isoc_agelow",
+    "isoc_ageupp",
+    "isoc_dage",
+    "isoc_lagelow",
+    "isoc_lageupp",
+    "isoc_dlage",
+    "isoc_ismetlog",
+    "isoc_zlow",
+    "isoc_zupp",
+    "isoc_dz",
+    "isoc_metlow",
+    "isoc_metupp",
+    "isoc_dmet",
+)
+
+#: tolerance of the node comparisons, in dex for log(age) and [M/H], relative for Z
+NODE_TOLERANCE = 1e-4
+
+
+def cache_directory() -> str:
+    """Return the cache directory from the configuration"""
+    return os.path.expanduser(configuration["cache"]["directory"])
+
+
+def layout() -> str:
+    """Return the cache layout from the configuration (`"raw"` or `"normalized"`)"""
+    name = configuration["cache"].get("layout", "raw")
+    if name not in LAYOUTS:
+        raise ValueError(f"Unknown cache layout {name!r}, expecting one of {LAYOUTS}.")
+    return name
+
+
+def entry_name(query: dict) -> str:
+    """Return the name of the cache entry of a normalized query"""
+    text = json.dumps(query, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _paths(query: dict) -> tuple:
+    """Return the (data, metadata) file paths of a normalized query"""
+    base = os.path.join(cache_directory(), entry_name(query))
+    return base + ".dat.gz", base + ".json"
+
+
+def _read_metadata(path: str) -> dict | None:
+    """Return the metadata of an entry if it exists, is readable, and has not expired"""
+    try:
+        with open(path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    max_age = configuration["cache"].get("max_age")
+    if max_age is not None and time.time() - meta.get("created", 0) > float(max_age):
+        return None
+    return meta
+
+
+def get(query: dict) -> bytes | None:
+    """
+    Return the cached table of a query.
+
+    Parameters
+    ----------
+    query : dict
+        The normalized query parameters.
+
+    Returns
+    -------
+    bytes | None
+        The (uncompressed) table, or None if the query is not cached, expired,
+        or its entry is corrupted.
+    """
+    data_path, meta_path = _paths(query)
+    meta = _read_metadata(meta_path)
+    if meta is None:
+        return None
+    try:
+        with gzip.open(data_path, "rb") as f:
+            data = f.read()
+    except (OSError, EOFError):
+        return None
+    if len(data) != meta.get("size"):
+        return None
+    return data
+
+
+def put(query: dict, data: bytes) -> str:
+    """
+    Store the table of a query in the cache.
+
+    Parameters
+    ----------
+    query : dict
+        The normalized query parameters.
+    data : bytes
+        The (uncompressed) table.
+
+    Returns
+    -------
+    str
+        The path of the stored table.
+    """
+    data_path, meta_path = _paths(query)
+    write_atomic(data_path, gzip.compress(data, compresslevel=1))
+    meta = {"query": query, "created": time.time(), "size": len(data)}
+    write_atomic(meta_path, json.dumps(meta, indent=1).encode("utf-8"))
+    return data_path
+
+
+def physical_query(query: dict) -> dict:
+    """Return the part of a normalized query that does not depend on the photometry"""
+    return {key: value for key, value in query.items() if key not in PHOTOMETRY_KEYS}
+
+
+def _is_magnitude(name: str) -> bool:
+    """Whether a column belongs to the photometric group of a table"""
+    return name.endswith("mag") and name != "mbolmag"
+
+
+def _table_paths(query: dict) -> tuple:
+    """Return the (physical, magnitude) base paths of a normalized query"""
+    directory = cache_directory()
+    return (
+        os.path.join(directory, "phys-" + entry_name(physical_query(query))),
+        os.path.join(directory, "mags-" + entry_name(query)),
+    )
+
+
+def _checksum(columns: dict) -> str:
+    """Digest of the names, types, and values of a group of columns"""
+    digest = hashlib.sha256()
+    for name, values in columns.items():
+        digest.update(f"{name}:{values.dtype.str}:".encode())
+        digest.update(np.ascontiguousarray(values).data)
+    return digest.hexdigest()
+
+
+def _write_columns(path: str, columns: dict):
+    """Store a group of columns as a compressed npz file"""
+    buf = BytesIO()
+    arrays = {f"c{k}": values for k, values in enumerate(columns.values())}
+    np.savez_compressed(buf, names=np.array(list(columns), dtype=str), **arrays)
+    write_atomic(path, buf.getvalue())
+
+
+def _read_columns(path: str) -> dict:
+    """Read a group of columns written by :func:`_write_columns`"""
+    with np.load(path, allow_pickle=False) as f:
+        return {str(name): f[f"c{k}"] for k, name in enumerate(f["names"])}
+
+
+def get_table(query: dict) -> pd.DataFrame | None:
+    """
+    Return the cached table of a query from the normalized layout.
+
+    Parameters
+    ----------
+    query : dict
+        The normalized query parameters.
+
+    Returns
+    -------
+    pd.DataFrame | None
+        The table assembled from its physical and magnitude columns, or None
+        if the query is not cached, expired, or its entry is corrupted or
+        does not match the stored physical columns.
+    """
+    phys_base, mags_base = _table_paths(query)
+    meta = _read_metadata(mags_base + ".json")
+    if meta is None:
+        return None
+    try:
+        physical = _read_columns(phys_base + ".npz")
+        bands = _read_columns(mags_base + ".npz")
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+    # the physical block is shared, and may have been rewritten by another query
+    if _checksum(physical) != meta.get("physical"):
+        return None
+    columns = {**physical, **bands}
+    names = meta.get("columns", [])
+    if sorted(columns) != sorted(names) or any(len(v) != meta.get("rows") for v in columns.values()):
+        return None
+    df = pd.DataFrame({name: columns[name] for name in names})
+    df.attrs["comment"] = meta.get("comment", "")
+    return df
+
+
+def put_table(query: dict, table: pd.DataFrame) -> str:
+    """
+    Store a parsed table in the normalized layout.
+
+    The physical columns are only written if they differ from the ones
+    already stored for the same photometry-independent query.
+
+    Parameters
+    ----------
+    query : dict
+        The normalized query parameters.
+    table : pd.DataFrame
+        The parsed table (see :func:`ezpadova.parsec.parse_result`).
+
+    Returns
+    -------
+    str
+        The path of the stored magnitude columns.
+    """
+    phys_base, mags_base = _table_paths(query)
+    physical, bands = {}, {}
+    for name in table.columns:
+        values = table[name].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        (bands if _is_magnitude(name) else physical)[name] = values
+    checksum = _checksum(physical)
+
+    phys_meta = _read_metadata(phys_base + ".json")
+    if (phys_meta is None or phys_meta.get("checksum") != checksum
+            or not os.path.isfile(phys_base + ".npz")):
+        _write_columns(phys_base + ".npz", physical)
+        meta = {"query": physical_query(query), "created": time.time(),
+                "rows": len(table), "checksum": checksum}
+        write_atomic(phys_base + ".json", json.dumps(meta, indent=1).encode("utf-8"))
+
+    _write_columns(mags_base + ".npz", bands)
+    meta = {
+        "query": query,
+        "created": time.time(),
+        "rows": len(table),
+        "columns": list(table.columns),
+        "physical": checksum,
+        "comment": table.attrs.get("comment", ""),
+    }
+    write_atomic(mags_base + ".json", json.dumps(meta, indent=1).encode("utf-8"))
+    return mags_base + ".npz"
+
+
+def _arithmetic_nodes(low, high, step) -> np.ndarray:
+    """Nodes of a (low, high, step) range of the CMD form"""
+    low, high, step = float(low), float(high), float(step)
+    if step <= 0 or high <= low:
+        return np.array([low])
+    return low + step * np.arange(int(np.floor((high - low) / step + 1e-6)) + 1)
+
+
+def grid_nodes(query: dict) -> tuple:
+    """
+    Return the grid nodes of a normalized query.
+
+    Parameters
+    ----------
+    query : dict
+        The normalized query parameters.
+
+    Returns
+    -------
+    ages : np.ndarray
+        The log(age/yr) nodes (linear ages are converted).
+    metal_column : str
+        The table column of the metallicity nodes, `MH` or `Zini`.
+    metals : np.ndarray
+        The metallicity nodes.
+    """
+    if float(query["isoc_isagelog"]) == 1:
+        ages = _arithmetic_nodes(query["isoc_lagelow"], query["isoc_lageupp"], query["isoc_dlage"])
+    else:
+        ages = np.log10(_arithmetic_nodes(query["isoc_agelow"], query["isoc_ageupp"], query["isoc_dage"]))
+    if float(query["isoc_ismetlog"]) == 1:
+        return ages, "MH", _arithmetic_nodes(query["isoc_metlow"], query["isoc_metupp"], query["isoc_dmet"])
+    return ages, "Zini", _arithmetic_nodes(query["isoc_zlow"], query["isoc_zupp"], query["isoc_dz"])
+
+
+def node_index(values: np.ndarray, nodes: np.ndarray, relative: bool = False) -> np.ndarray:
+    """
+    Find the nodes of values, within :data:`NODE_TOLERANCE`.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values to look up.
+    nodes : np.ndarray
+        The nodes.
+    relative : bool
+        If set, the tolerance is relative to the values.
+
+    Returns
+    -------
+    np.ndarray
+        The index in `nodes` of the node of each value, or -1.
+    """
+    values = np.asarray(values, dtype=float)
+    nodes = np.asarray(nodes, dtype=float)
+    if len(nodes) == 0:
+        return np.full(values.shape, -1, dtype=np.int64)
+    order = np.argsort(nodes, kind="stable")
+    sorted_nodes = nodes[order]
+    index = np.searchsorted(sorted_nodes, values)
+    lower = np.maximum(index - 1, 0)
+    upper = np.minimum(index, len(nodes) - 1)
+    closest = np.where(
+        np.abs(values - sorted_nodes[lower]) <= np.abs(values - sorted_nodes[upper]), lower, upper
+    )
+    tolerance = NODE_TOLERANCE * (np.abs(values) if relative else 1.0)
+    found = np.abs(values - sorted_nodes[closest]) <= tolerance
+    return np.where(found, order[closest], -1)
+
+
+def match_nodes(values: np.ndarray, nodes: np.ndarray, relative: bool = False) -> np.ndarray:
+    """Check which values are one of the nodes (see :func:`node_index`)"""
+    return node_index(values, nodes, relative) >= 0
+
+
+def related_grids(query: dict) -> list:
+    """
+    Find the cached grids that share nodes with a query.
+
+    Only isochrone tables (`output_kind` 0) are considered, and the entries
+    must have the same parameters as the query except for the grid ranges
+    (see :data:`GRID_KEYS`), and the same kind of metallicity (Z or [M/H]).
+
+    Parameters
+    ----------
+    query : dict
+        The normalized query parameters.
+
+    Returns
+    -------
+    list[dict]
+        The metadata of the matching entries of the configured layout, those with the
+        most nodes of the query first, then the smallest grids. Each has an
+        additional `covered` key: the boolean (n_ages, n_metals) array of the
+        nodes of the query in the grid (see :func:`grid_nodes`).
+    """
+    if float(query.get("output_kind", 0)) != 0:
+        return []
+    fixed = {key: value for key, value in query.items() if key not in GRID_KEYS}
+    ages, metal_column, metals = grid_nodes(query)
+    relative = metal_column == "Zini"
+    normalized = layout() == "normalized"
+    found = []
+    for meta in entries():
+        if ("columns" in meta) != normalized:
+            # the layouts do not read each other's entries
+            continue
+        other = meta.get("query", {})
+        if {key: value for key, value in other.items() if key not in GRID_KEYS} != fixed:
+            continue
+        try:
+            other_ages, other_column, other_metals = grid_nodes(other)
+        except (KeyError, ValueError):
+            continue
+        if other_column != metal_column:
+            continue
+        covered = np.outer(match_nodes(ages, other_ages), match_nodes(metals, other_metals, relative))
+        if covered.any():
+            found.append((-covered.sum(), len(other_ages) * len(other_metals), len(found), {**meta, "covered": covered}))
+    return [item[-1] for item in sorted(found, key=lambda item: item[:3])]
+
+
+def contains(query: dict, verify: bool = False) -> bool:
+    """
+    Check whether a query has a valid cache entry in the configured layout.
+
+    Parameters
+    ----------
+    query : dict
+        The normalized query parameters.
+    verify : bool
+        If set, read the table entirely to check its integrity.
+        Otherwise, only check that the entry exists and has not expired.
+
+    Returns
+    -------
+    bool
+        True if the entry exists and is valid.
+    """
+    if layout() == "normalized":
+        if verify:
+            return get_table(query) is not None
+        phys_base, mags_base = _table_paths(query)
+        return (
+            os.path.isfile(phys_base + ".npz")
+            and os.path.isfile(mags_base + ".npz")
+            and _read_metadata(mags_base + ".json") is not None
+        )
+    if verify:
+        return get(query) is not None
+    data_path, meta_path = _paths(query)
+    return os.path.isfile(data_path) and _read_metadata(meta_path) is not None
+
+
+def entries() -> Iterator[dict]:
+    """Iterate over the metadata of the valid cache entries (of both layouts)"""
+    for path in sorted(glob.glob(os.path.join(cache_directory(), "*.json"))):
+        if os.path.basename(path).startswith("phys-"):
+            # shared physical columns, not an entry on their own
+            continue
+        meta = _read_metadata(path)
+        if meta is not None:
+            yield meta
+
+
+def clear():
+    """Remove all the cache entries"""
+    for pattern in ("*.dat.gz", "*.npz", "*.json", ".tmp-*"):
+        for path in glob.glob(os.path.join(cache_directory(), pattern)):
+            os.remove(path)
@@ -0,0 +1,270 @@
+"""Command line interface of ezpadova.
+
+.. code-block:: none
+
+    ezpadova prefetch specs.json --workers 4
+    ezpadova download specs.yaml --output grids/ --format parquet --workers 4
+
+A specification file is a JSON (or YAML, if PyYAML is installed) list of
+queries, each given as the keyword arguments of
+:func:`ezpadova.parsec.get_isochrones`, e.g.,
+
+.. code-block:: json
+
+    [
+        {"logage": [6, 10, 0.1], "MH": [-2, 0.3, 0.1], "photsys_file": "gaiaEDR3"},
+        {"logage": [6, 10, 0.1], "MH": [-2, 0.3, 0.1], "photsys_file": "2mass"}
+    ]
+
+`download` writes each query to its own file in the output directory, named
+after the optional `name` key of its specification (default `job-0000`,
+`job-0001`, ...). Completed jobs are recorded in `progress.jsonl` in the same
+directory, so that an interrupted download resumes where it stopped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextvars
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import configuration
+from .parsec import _is_node_list, _spec_queries, get_isochrones, prefetch
+from .planner import estimate_query
+
+#: output formats of `download` and their file extensions
+FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "raw": ".dat",
+}
+
+#: name of the progress file of `download`
+PROGRESS_FILE = "progress.jsonl"
+
+
+def load_specs(path: str) -> list[dict]:
+    """
+    Load a list of query specifications from a JSON or YAML file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file. Files ending in `.yml` or `.yaml` are read as YAML.
+
+    Returns
+    -------
+    list[dict]
+        The query specifications.
+
+    Raises
+    ------
+    ValueError
+        If the file does not contain a list of dictionaries.
+    """
+    with open(path) as f:
+        if path.endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError as error:
+                raise ImportError("Reading YAML specifications requires PyYAML.") from error
+            specs = yaml.safe_load(f)
+        else:
+            specs = json.load(f)
+    if not isinstance(specs, list) or not all(isinstance(k, dict) for k in specs):
+        raise ValueError(f"{path} must contain a list of query specifications.")
+    return specs
+
+
+def _prefetch(args: argparse.Namespace) -> int:
+    """Fill the local cache with the queries of a specification file"""
+    if args.cache_dir is not None:
+        configuration["cache"]["directory"] = args.cache_dir
+
+    def _progress(report: dict):
+        print(
+            f"[{report['done']}/{report['total']}] {report['status']:>7s} "
+            f"{report['seconds']:7.1f}s {json.dumps(report['spec'])}",
+            flush=True,
+        )
+
+    # job names of the `download` specifications are not query parameters
+    specs = [{key: value for key, value in spec.items() if key != "name"} for spec in load_specs(args.specs)]
+    reports = prefetch(specs, workers=args.workers, progress=_progress, verify=args.verify)
+    failed = [r for r in reports if r["status"] == "failed"]
+    for report in failed:
+        print(f"failed: {json.dumps(report['spec'])}: {report['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _write_output(data, path: str, fmt: str):
+    """Write a downloaded table, so that a complete file exists only once written"""
+    tmp = path + ".part"
+    try:
+        if fmt == "raw":
+            with open(tmp, "wb") as f:
+                f.write(data)
+        elif fmt in ("csv", "csv.gz"):
+            data.to_csv(tmp, index=False, compression="gzip" if fmt == "csv.gz" else None)
+        elif fmt == "parquet":
+            data.to_parquet(tmp, index=False)
+        else:
+            data.reset_index(drop=True).to_feather(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _read_progress(path: str) -> dict:
+    """Return the last record of each completed job of a progress file"""
+    done = {}
+    if not os.path.isfile(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # interrupted while writing the last line
+                continue
+            if record.get("status") == "done":
+                done[record["name"]] = record
+    return done
+
+
+def _download(args: argparse.Namespace) -> int:
+    """Download the queries of a specification file into separate files"""
+    if args.cache_dir is not None:
+        configuration["cache"].update(directory=args.cache_dir, enabled=True)
+    engines = {"parquet": ("pyarrow", "fastparquet"), "feather": ("pyarrow",)}
+    if args.format in engines and not any(importlib.util.find_spec(name) for name in engines[args.format]):
+        print(f"The {args.format} format requires {' or '.join(engines[args.format])}.", file=sys.stderr)
+        return 2
+
+    # validate all the jobs before any network access
+    jobs, errors = [], []
+    for index, spec in enumerate(load_specs(args.specs)):
+        spec = dict(spec)
+        name = str(spec.pop("name", f"job-{index:04d}"))
+        try:
+            queries = _spec_queries(spec)
+        except (ValueError, TypeError, KeyError) as error:
+            errors.append(f"{name}: {error}")
+            continue
+        if args.format == "raw" and any(_is_node_list(spec.get(k)) for k in ("age_yr", "Z", "logage", "MH")):
+            # lists of nodes are assembled from several tables of the website
+            errors.append(f"{name}: lists of nodes cannot be downloaded in the raw format")
+            continue
+        key = json.dumps({"spec": spec, "format": args.format}, sort_keys=True)
+        path = os.path.join(args.output, name + FORMATS[args.format])
+        size = sum(estimate_query(query)["isochrones"] for query in queries)
+        jobs.append({"name": name, "spec": spec, "key": key, "path": path, "isochrones": size})
+    names = [job["name"] for job in jobs]
+    errors.extend(f"{name}: duplicate job name" for name in sorted({n for n in names if names.count(n) > 1}))
+    if errors:
+        for error in errors:
+            print(f"invalid: {error}", file=sys.stderr)
+        return 2
+
+    progress_path = os.path.join(args.output, PROGRESS_FILE)
+    done = _read_progress(progress_path)
+    pending = [
+        job for job in jobs
+        if not (job["name"] in done and done[job["name"]]["key"] == job["key"] and os.path.isfile(job["path"]))
+    ]
+    if args.dry_run:
+        for job in jobs:
+            status = "pending" if job in pending else "done"
+            print(f"{status:>7s} {job['path']} ({job['isochrones']} isochrones) {json.dumps(job['spec'])}")
+        print(f"{len(pending)} of {len(jobs)} jobs to download, "
+              f"{sum(job['isochrones'] for job in pending)} isochrones")
+        return 0
+
+    os.makedirs(args.output, exist_ok=True)
+    lock = threading.Lock()
+    reports = []
+
+    def _run(job: dict):
+        start = time.perf_counter()
+        try:
+            data = get_isochrones(**job["spec"], return_df=args.format != "raw")
+            _write_output(data, job["path"], args.format)
+        except Exception as error:  # noqa: BLE001 - a failed job is recorded, the others go on
+            status, message = "failed", repr(error)
+        else:
+            status, message = "done", None
+        record = {"name": job["name"], "key": job["key"], "path": job["path"], "status": status,
+                  "seconds": time.perf_counter() - start, "error": message}
+        with lock:
+            reports.append(record)
+            with open(progress_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            print(f"[{len(reports)}/{len(pending)}] {status:>6s} {record['seconds']:7.1f}s {job['path']}", flush=True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for job in pending:
+            pool.submit(contextvars.copy_context().run, _run, job)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in reports if r["status"] == "failed"]
+    for record in failed:
+        print(f"failed: {record['name']}: {record['error']}", file=sys.stderr)
+    seconds = [r["seconds"] for r in reports if r["status"] == "done"]
+    print(f"{len(jobs)} jobs: {len(seconds)} downloaded, {len(jobs) - len(pending)} skipped, "
+          f"{len(failed)} failed in {elapsed:.1f}s with {args.workers} workers")
+    if seconds:
+        print(f"seconds per job: min {min(seconds):.2f}, median {statistics.median(seconds):.2f}, "
+              f"mean {statistics.fmean(seconds):.2f}, max {max(seconds):.2f}")
+    return 1 if failed else 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Entry point of the `ezpadova` command"""
+    parser = argparse.ArgumentParser(
+        prog="ezpadova", description="Download PADOVA/PARSEC isochrones from the CMD website."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sub = subparsers.add_parser("prefetch", help="fill the local isochrone cache")
+    sub.add_argument("specs", help="JSON or YAML file listing the queries")
+    sub.add_argument("-j", "--workers", type=int, default=4,
+                     help="maximum number of concurrent queries (default: %(default)s)")
+    sub.add_argument("--cache-dir", default=None,
+                     help="cache directory (default: configuration['cache']['directory'])")
+    sub.add_argument("--verify", action="store_true",
+                     help="check the integrity of existing cache entries")
+    sub.set_defaults(func=_prefetch)
+
+    sub = subparsers.add_parser("download", help="download many queries into files")
+    sub.add_argument("specs", help="JSON or YAML file listing the queries")
+    sub.add_argument("-o", "--output", default=".",
+                     help="output directory (default: current directory)")
+    sub.add_argument("-f", "--format", choices=sorted(FORMATS), default="csv",
+                     help="output format (default: %(default)s)")
+    sub.add_argument("-j", "--workers", type=int, default=4,
+                     help="maximum number of concurrent queries (default: %(default)s)")
+    sub.add_argument("--cache-dir", default=None,
+                     help="cache directory, enables the cache (default: configuration['cache'])")
+    sub.add_argument("-n", "--dry-run", action="store_true",
+                     help="validate the queries and list the jobs without downloading")
+    sub.set_defaults(func=_download)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -67,6 +67,44 @@ configuration = dict(
         "sim_mtot": "1.0e4",
         "submit_form": "Submit",
     },
+    # network behavior of the queries (timeouts in seconds)
+    network={
+        "connect_timeout": 10.0,
+        "read_timeout": 120.0,
+        "retries": 3,
+        "backoff_factor": 1.0,
+        "backoff_max": 60.0,
+    },
+    # local cache of the downloaded isochrone tables, opt-in (max_age in seconds, None for no
+    # expiry; layout "raw" for the website outputs, "normalized" to share physical columns across systems)
+    cache={
+        "enabled": False,
+        "directory": os.environ.get(
+            "EZPADOVA_CACHE_DIR", os.path.join("~", ".cache", "ezpadova")
+        ),
+        "max_age": None,
+        "layout": "raw",
+    },
+    # host-wide limits of the requests to the website, shared by all the processes using the same
+    # directory (default: "rate-limit" in the cache directory); None for no limit
+    rate_limit={
+        "enabled": False,
+        "requests_per_second": 1.0,
+        "burst": 2,
+        "max_concurrent": 4,
+        "directory": None,
+    },
+    # guardrails on the size of the queries, checked before any network access (None for no
+    # limit): "split" divides larger grids into several queries, "raise" refuses them
+    limits={
+        "max_isochrones": 5000,
+        "max_rows": None,
+        "max_bytes": None,
+        "action": "split",
+        # typical output sizes used by the estimates
+        "rows_per_isochrone": 400,
+        "bytes_per_row": 450,
+    },
 )
 
 
@@ -770,7 +808,7 @@ def validate_query_parameter(**kw):
             "Age, log age, Z, and [M/H] step sizes must be positive or null."
         )
 
-    if len(configuration) <= 2:
+    if "photsys_file" not in configuration:
         reload_configuration()
 
     if kw["photsys_file"] not in configuration["photsys_file"] and not kw[
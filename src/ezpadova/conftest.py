@@ -0,0 +1,10 @@
+import pytest
+
+from .config import configuration
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep the tests away from the user's isochrone cache"""
+    monkeypatch.setitem(configuration["cache"], "directory", str(tmp_path / "cache"))
+    return tmp_path / "cache"
@@ -1,20 +1,32 @@
 """Deprecated functions from previous version that are kept here for backward compatibility."""
 
-from typing import Union
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+
 from .parsec import get_isochrones
 from .tools import deprecated_replacedby
-import pandas as pd
+
+
+def _nodes_or_triplet(value: float | Sequence[float]) -> list | np.ndarray:
+    """Single value as a (value, value, 0) triplet, sequences as an array of nodes"""
+    if np.ndim(value) == 0:
+        return [value, value, 0]
+    return np.asarray(value, dtype=float)
 
 
 @deprecated_replacedby("ezpadova.parsec.get_isochrones")
 def get_one_isochrone(
-    age_yr: float = None,
-    Z: float = None,
-    logage: float = None,
-    MH: float = None,
+    age_yr: float | None = None,
+    Z: float | None = None,
+    logage: float | None = None,
+    MH: float | None = None,
     ret_table: bool = True,
     **kwargs,
-) -> Union[pd.DataFrame, bytes]:
+) -> pd.DataFrame | bytes:
     """
     Get one isochrone at a given time and metallicity content.
 
@@ -66,11 +78,11 @@ def get_Z_isochrones(
     z0: float,
     z1: float,
     dz: float,
-    age_yr: float = None,
-    logage: float = None,
+    age_yr: float | Sequence[float] | None = None,
+    logage: float | Sequence[float] | None = None,
     ret_table: bool = True,
     **kwargs,
-) -> Union[pd.DataFrame, bytes]:
+) -> pd.DataFrame | bytes:
     """
     Retrieve isochrones for a given metallicity range and age.
 
@@ -82,10 +94,10 @@ def get_Z_isochrones(
         Upper bound of the metallicity range in Z units.
     dz : float
         Step size for the metallicity range in Z units.
-    age_yr : float, optional
-        Age in years. Either `age_yr` or `logage` must be provided, but not both.
-    logage : float, optional
-        Logarithm of the age. Either `age_yr` or `logage` must be provided, but not both.
+    age_yr : float or Sequence[float], optional
+        Age(s) in years. Either `age_yr` or `logage` must be provided, but not both.
+    logage : float or Sequence[float], optional
+        Logarithm(s) of the age. Either `age_yr` or `logage` must be provided, but not both.
     ret_table : bool, optional
         If True, return the result as a DataFrame. Default is True.
     kwargs : dict
@@ -110,9 +122,9 @@ def get_Z_isochrones(
     query = {"Z": [z0, z1, dz]}
 
     if age_yr is not None:
-        query["age_yr"] = [age_yr, age_yr, 0]
+        query["age_yr"] = _nodes_or_triplet(age_yr)
     else:
-        query["logage"] = [logage, logage, 0]
+        query["logage"] = _nodes_or_triplet(logage)
 
     return get_isochrones(return_df=ret_table, **query, **kwargs)
 
@@ -122,11 +134,11 @@ def get_t_isochrones(
     logt0: float,
     logt1: float,
     dlogt: float,
-    Z: float = None,
-    MH: float = None,
+    Z: float | Sequence[float] | None = None,
+    MH: float | Sequence[float] | None = None,
     ret_table: bool = True,
     **kwargs,
-) -> Union[pd.DataFrame, bytes]:
+) -> pd.DataFrame | bytes:
     """
     Retrieve isochrones for a given age range and metallicity.
 
@@ -138,10 +150,10 @@ def get_t_isochrones(
         Upper bound of the age range in log10(years).
     dlogt : float
         Step size for the age range in log10(years).
-    Z : float, optional
-        Metallicity. Either `Z` or `MH` must be provided, but not both.
-    MH : float, optional
-        Metallicity in terms of [M/H]. Either `Z` or `MH` must be provided, but not both.
+    Z : float or Sequence[float], optional
+        Metallicity (or metallicities). Either `Z` or `MH` must be provided, but not both.
+    MH : float or Sequence[float], optional
+        Metallicity (or metallicities) in terms of [M/H]. Either `Z` or `MH` must be provided, but not both.
     ret_table : bool, optional
         If True, return the result as a DataFrame. Default is True.
     kwargs : dict
@@ -165,8 +177,8 @@ def get_t_isochrones(
     query = {"logage": [logt0, logt1, dlogt]}
 
     if Z is not None:
-        query["Z"] = [Z, Z, 0]
+        query["Z"] = _nodes_or_triplet(Z)
     else:
-        query["MH"] = [MH, MH, 0]
+        query["MH"] = _nodes_or_triplet(MH)
 
     return get_isochrones(return_df=ret_table, **query, **kwargs)
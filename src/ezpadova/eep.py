@@ -0,0 +1,243 @@
+"""Equal-evolutionary-point (EEP) representation of isochrone grids.
+
+The isochrones of a CMD table have different numbers of rows. As in
+:func:`ezpadova.parsec.resample_evolution_label`, each row of an isochrone can
+be placed on a continuous evolution coordinate `evol = label + i / n`, where
+`i` is its rank among the `n` rows of its evolutionary phase `label`.
+
+:class:`EEPGrid` resamples all the isochrones of a grid onto the same set of
+evolution points, which makes the grid a dense cube indexed by
+(logAge, MH, eep, column). Interpolating an isochrone then only involves the
+4 bracketing isochrones of the cube, and operations over the whole grid are
+array expressions.
+
+>>> iso = get_isochrones(logage=(6, 10, 0.05), MH=(-2, 0.3, 0.1), photsys_file="gaiaEDR3")
+>>> grid = EEPGrid(iso, points_per_label=100)
+>>> grid.values.shape          # (logAge, MH, eep, column)
+>>> cluster = grid(8.32, -0.13)
+>>> colors = grid["G_BPmag"] - grid["G_RPmag"]
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+
+from .population import NODE_KEYS
+
+
+class EEPGrid:
+    """Dense (logAge, MH, eep, column) cube of an isochrone grid.
+
+    Attributes
+    ----------
+    logAge, MH : np.ndarray
+        The sorted coordinates of the grid nodes.
+    eep : np.ndarray
+        The evolution points, `label + k / points_per_label`.
+    columns : list[str]
+        The resampled columns.
+    values : np.ndarray
+        Array of shape (len(logAge), len(MH), len(eep), len(columns)).
+        Missing isochrones and phases are NaN.
+    """
+
+    def __init__(
+        self,
+        isochrones: pd.DataFrame,
+        points_per_label: int | dict[int, int] = 50,
+        columns: Sequence[str] | None = None,
+        dtype: type = float,
+    ):
+        """
+        Resample a grid of isochrones onto equal evolutionary points.
+
+        Parameters
+        ----------
+        isochrones : pd.DataFrame
+            Isochrone table(s), e.g., from :func:`ezpadova.get_isochrones`.
+        points_per_label : int | dict[int, int]
+            Number of evolution points of each phase, or a mapping from labels
+            to numbers of points.
+        columns : Sequence[str], optional
+            Columns to resample. Default to all the numerical columns except
+            the node coordinates, `label` and `evol`.
+        dtype : type
+            The dtype of the cube.
+        """
+        for name in (*NODE_KEYS, "label"):
+            if name not in isochrones.columns:
+                raise KeyError(f"Column {name} is required.")
+        if columns is None:
+            columns = [
+                name for name in isochrones.select_dtypes("number").columns
+                if name not in (*NODE_KEYS, "label", "evol", "index")
+            ]
+        self.columns = list(columns)
+
+        labels = np.unique(isochrones["label"].to_numpy(dtype=int))
+        if isinstance(points_per_label, dict):
+            npts = np.array([points_per_label.get(label, 0) for label in labels], dtype=int)
+        else:
+            npts = np.full(len(labels), int(points_per_label))
+        if np.any(npts < 0) or npts.sum() == 0:
+            raise ValueError("points_per_label must be positive.")
+        self.eep = np.concatenate([label + np.arange(n) / n for label, n in zip(labels, npts)])
+
+        logage = isochrones["logAge"].to_numpy(dtype=float)
+        mh = isochrones["MH"].to_numpy(dtype=float)
+        self.logAge, age_id = np.unique(logage, return_inverse=True)
+        self.MH, mh_id = np.unique(mh, return_inverse=True)
+        label_id = np.searchsorted(labels, isochrones["label"].to_numpy(dtype=int))
+
+        # contiguous (node, label) segments, keeping the order of the rows
+        node_id = age_id * len(self.MH) + mh_id
+        order = np.lexsort((np.arange(len(isochrones)), label_id, node_id))
+        segment = (node_id * len(labels) + label_id)[order]
+        new = np.r_[True, segment[1:] != segment[:-1]]
+        starts = np.flatnonzero(new)
+        counts = np.diff(np.r_[starts, len(order)])
+        seg_node = node_id[order][starts]
+        seg_label = label_id[order][starts]
+
+        # row i of a segment of n rows sits at the fraction i / n of its phase:
+        # the point k / m of the phase falls at the fractional row k * n / m
+        offsets = np.r_[0, np.cumsum(npts)]
+        fractions = np.arange(offsets[-1]) - np.repeat(offsets[:-1], npts)
+        fractions = fractions / np.repeat(npts, npts)
+        eep_label = np.repeat(np.arange(len(labels)), npts)
+
+        table = isochrones[self.columns].to_numpy(dtype=float)[order]
+        self.values = np.full(
+            (len(self.logAge) * len(self.MH), len(self.eep), len(self.columns)), np.nan, dtype=dtype
+        )
+        for k in range(len(labels)):
+            selected = np.flatnonzero(seg_label == k)
+            if len(selected) == 0 or npts[k] == 0:
+                continue
+            points = np.flatnonzero(eep_label == k)
+            position = fractions[points][None, :] * counts[selected][:, None]
+            lower = np.floor(position).astype(np.int64)
+            weight = (position - lower)[:, :, None]
+            last = (counts[selected] - 1)[:, None]
+            i0 = starts[selected][:, None] + np.minimum(lower, last)
+            i1 = starts[selected][:, None] + np.minimum(lower + 1, last)
+            self.values[seg_node[selected][:, None], points[None, :]] = (
+                table[i0] * (1 - weight) + table[i1] * weight
+            )
+        self.values = self.values.reshape(
+            len(self.logAge), len(self.MH), len(self.eep), len(self.columns)
+        )
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        """The (logAge, MH, eep) cube of one column"""
+        return self.values[..., self.columns.index(column)]
+
+    @staticmethod
+    def _weights(value: np.ndarray, nodes: np.ndarray) -> tuple:
+        """Bracketing indices and linear weights, clipped to the grid"""
+        if len(nodes) == 1:
+            zeros = np.zeros(np.shape(value), dtype=np.int64)
+            return zeros, zeros, np.zeros(np.shape(value))
+        value = np.clip(value, nodes[0], nodes[-1])
+        upper = np.clip(np.searchsorted(nodes, value, side="right"), 1, len(nodes) - 1)
+        lower = upper - 1
+        weight = (value - nodes[lower]) / (nodes[upper] - nodes[lower])
+        return lower, upper, weight
+
+    def interpolate(
+        self,
+        logAge: float | Sequence[float],
+        MH: float | Sequence[float],
+        columns: Sequence[str] | None = None,
+    ) -> np.ndarray:
+        """
+        Bilinear interpolation of the cube at many (logAge, MH).
+
+        Values outside the grid are clipped to its edges.
+
+        Parameters
+        ----------
+        logAge, MH : float | Sequence[float]
+            Coordinates of the isochrones (broadcast together).
+        columns : Sequence[str], optional
+            Columns to interpolate. Default to all.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (*broadcast shape, len(eep), len(columns)).
+        """
+        logAge, MH = np.broadcast_arrays(np.asarray(logAge, dtype=float), np.asarray(MH, dtype=float))
+        select = slice(None) if columns is None else [self.columns.index(name) for name in columns]
+        a0, a1, wa = self._weights(logAge, self.logAge)
+        m0, m1, wm = self._weights(MH, self.MH)
+        wa, wm = wa[..., None, None], wm[..., None, None]
+
+        def corner(a, m, weight):
+            # select the isochrones before the columns to avoid copying the cube;
+            # corners without weight do not contribute, even if undefined
+            return np.where(weight > 0, self.values[a, m][..., select] * weight, 0.0)
+
+        return (
+            corner(a0, m0, (1 - wa) * (1 - wm))
+            + corner(a0, m1, (1 - wa) * wm)
+            + corner(a1, m0, wa * (1 - wm))
+            + corner(a1, m1, wa * wm)
+        )
+
+    def __call__(
+        self, logAge: float, MH: float, what: Sequence[str] | None = None
+    ) -> pd.DataFrame:
+        """
+        Interpolate an isochrone at (logAge, MH).
+
+        Parameters
+        ----------
+        logAge : float
+            The logarithm of the age.
+        MH : float
+            The metallicity.
+        what : Sequence[str], optional
+            Columns to interpolate. Default to all.
+
+        Returns
+        -------
+        pd.DataFrame
+            The isochrone with the columns in `what`, and `logAge`, `MH`, and
+            `evol`. Evolution points missing from any bracketing isochrone are
+            dropped.
+        """
+        what = self.columns if what is None else list(what)
+        data = pd.DataFrame(self.interpolate(logAge, MH, what), columns=what)
+        data["logAge"] = logAge
+        data["MH"] = MH
+        data["evol"] = self.eep
+        return data.dropna()
+
+    def to_frame(self) -> pd.DataFrame:
+        """The cube as a long table with `logAge`, `MH`, `evol`, and the columns"""
+        n_age, n_mh, n_eep, _ = self.values.shape
+        data = pd.DataFrame(self.values.reshape(-1, len(self.columns)), columns=self.columns)
+        data.insert(0, "logAge", np.repeat(self.logAge, n_mh * n_eep))
+        data.insert(1, "MH", np.tile(np.repeat(self.MH, n_eep), n_age))
+        data.insert(2, "evol", np.tile(self.eep, n_age * n_mh))
+        return data.dropna(subset=self.columns, how="all").reset_index(drop=True)
+
+    def to_xarray(self):
+        """
+        The cube as an `xarray.DataArray` with dimensions (logAge, MH, eep, column).
+
+        Requires the optional dependency xarray.
+        """
+        try:
+            import xarray as xr
+        except ImportError as error:
+            raise ImportError("Converting an EEPGrid to xarray requires xarray.") from error
+        return xr.DataArray(
+            self.values,
+            dims=("logAge", "MH", "eep", "column"),
+            coords={"logAge": self.logAge, "MH": self.MH, "eep": self.eep, "column": self.columns},
+        )
@@ -0,0 +1,186 @@
+"""Local application of interstellar extinction to isochrone tables.
+
+The CMD website computes a full set of isochrones for each value of
+`extinction_av`. Because the extinction in each band is (to first order)
+proportional to :math:`A_V`, a sweep over :math:`A_V` only needs the
+un-extincted isochrones and one coefficient :math:`A_\\lambda / A_V` per band.
+
+:func:`extinction_coefficients` derives these coefficients once per
+photometric system and extinction law from two single-isochrone queries (at
+:math:`A_V = 0` and :math:`A_V = 1`), and :func:`apply_extinction` applies any
+vector of :math:`A_V` values to a table without further network calls.
+
+>>> iso = get_isochrones(logage=(6, 10, 0.1), MH=(0, 0, 0), photsys_file='gaiaEDR3')
+>>> coeffs = extinction_coefficients(photsys_file='gaiaEDR3')
+>>> reddened = apply_extinction(iso, np.linspace(0, 3, 31), coeffs)
+
+or, equivalently,
+
+>>> reddened = get_reddened_isochrones(np.linspace(0, 3, 31), logage=(6, 10, 0.1),
+...                                    MH=(0, 0, 0), photsys_file='gaiaEDR3')
+
+.. note::
+
+    The CMD website computes the extinction coefficients star by star from
+    their spectra. The median coefficient over the reference isochrone is
+    therefore an approximation, best for stars of spectral types close to
+    those of the reference isochrone. Query the website with
+    `extinction_av` when the exact star-by-star values matter.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+
+from .parsec import _query_parameters, get_isochrones, query_key
+
+_coefficients = {}
+_lock = threading.Lock()
+
+
+def magnitude_columns(isochrones: pd.DataFrame) -> list:
+    """
+    Return the names of the photometric bands of an isochrone table.
+
+    Parameters
+    ----------
+    isochrones : pd.DataFrame
+        Isochrone table as returned by :func:`ezpadova.get_isochrones`.
+
+    Returns
+    -------
+    list[str]
+        The columns ending with `mag`, except the bolometric magnitude `mbolmag`.
+    """
+    return [name for name in isochrones.columns if name.endswith("mag") and name != "mbolmag"]
+
+
+def extinction_coefficients(
+    logage: float = 9.0, MH: float = 0.0, refresh: bool = False, **kwargs
+) -> pd.Series:
+    """
+    Derive the extinction coefficients of a photometric system.
+
+    The coefficients are measured on a single reference isochrone queried at
+    `extinction_av` 0 and 1, and are kept in memory for the lifetime of the
+    process (the queries themselves go through the local cache).
+
+    Parameters
+    ----------
+    logage : float
+        log(age) of the reference isochrone.
+    MH : float
+        [M/H] of the reference isochrone.
+    refresh : bool
+        If True, ignore the coefficients already in memory.
+    kwargs : dict
+        Query parameters, e.g., `photsys_file`, `photsys_version`,
+        `extinction_curve`, `extinction_coeff`, or `track_parsec`, and
+        `use_cache` (see :func:`ezpadova.get_isochrones`). `extinction_av` is ignored.
+
+    Returns
+    -------
+    pd.Series
+        :math:`A_\\lambda / A_V` indexed by the magnitude columns.
+    """
+    kwargs.pop("extinction_av", None)
+    use_cache = kwargs.pop("use_cache", None)
+    nodes = {"logage": (logage, logage, 0), "MH": (MH, MH, 0)}
+    key = query_key(**_query_parameters(**nodes, **kwargs, extinction_av=1.0))
+    with _lock:
+        if not refresh and key in _coefficients:
+            return _coefficients[key].copy()
+
+    base = get_isochrones(**nodes, **kwargs, extinction_av=0.0, use_cache=use_cache)
+    reddened = get_isochrones(**nodes, **kwargs, extinction_av=1.0, use_cache=use_cache)
+    if len(base) != len(reddened):
+        raise RuntimeError("Reference isochrones at Av=0 and Av=1 do not match.")
+    bands = magnitude_columns(base)
+    delta = reddened[bands].to_numpy(dtype=float) - base[bands].to_numpy(dtype=float)
+    coefficients = pd.Series(np.nanmedian(delta, axis=0), index=bands, name="A/Av")
+
+    with _lock:
+        _coefficients[key] = coefficients
+    return coefficients.copy()
+
+
+def apply_extinction(
+    isochrones: pd.DataFrame,
+    av: float | Sequence[float] | np.ndarray,
+    coefficients: pd.Series | dict,
+) -> pd.DataFrame:
+    """
+    Apply one or several extinction values to isochrones.
+
+    Parameters
+    ----------
+    isochrones : pd.DataFrame
+        Isochrone table(s) without extinction (`extinction_av=0`).
+    av : float | Sequence[float]
+        The :math:`A_V` value(s) to apply.
+    coefficients : pd.Series | dict
+        :math:`A_\\lambda / A_V` of the bands, see :func:`extinction_coefficients`.
+        Bands that are not in `isochrones` are ignored.
+
+    Returns
+    -------
+    pd.DataFrame
+        The isochrones repeated for each :math:`A_V` (in the order of `av`),
+        with an `Av` column prepended and the reddened magnitudes.
+    """
+    av = np.atleast_1d(np.asarray(av, dtype=float))
+    if av.ndim != 1:
+        raise ValueError("av must be a scalar or a 1d sequence.")
+    coefficients = pd.Series(coefficients, dtype=float)
+    bands = [name for name in coefficients.index if name in isochrones.columns]
+
+    n_av, n_rows = len(av), len(isochrones)
+    # (Av, row, band) broadcasting of the reddened magnitudes
+    mags = (
+        isochrones[bands].to_numpy(dtype=float)[None, :, :]
+        + av[:, None, None] * coefficients[bands].to_numpy()[None, None, :]
+    )
+    result = pd.DataFrame(
+        {name: np.tile(isochrones[name].to_numpy(), n_av) for name in isochrones.columns}
+    )
+    result[bands] = mags.reshape(n_av * n_rows, len(bands))
+    result.insert(0, "Av", np.repeat(av, n_rows))
+    return result
+
+
+def get_reddened_isochrones(
+    av: float | Sequence[float] | np.ndarray, **kwargs
+) -> pd.DataFrame:
+    """
+    Retrieve isochrones for a set of extinction values with a single query.
+
+    The isochrones are queried (or read from the cache) without extinction,
+    and reddened locally with the coefficients of the same photometric
+    system and extinction law (see :func:`extinction_coefficients`).
+
+    Parameters
+    ----------
+    av : float | Sequence[float]
+        The :math:`A_V` value(s) to apply.
+    kwargs : dict
+        Arguments of :func:`ezpadova.get_isochrones`. `extinction_av` is ignored.
+
+    Returns
+    -------
+    pd.DataFrame
+        See :func:`apply_extinction`.
+    """
+    kwargs.pop("extinction_av", None)
+    kwargs.pop("return_df", None)
+    # the coefficients depend on every option of the models (tracks, dust, ...),
+    # only the grid ranges are those of the reference isochrone
+    options = {
+        key: value for key, value in kwargs.items()
+        if key not in ("age_yr", "Z", "logage", "MH", "default_ranges")
+    }
+    isochrones = get_isochrones(**kwargs, extinction_av=0.0)
+    return apply_extinction(isochrones, av, extinction_coefficients(**options))
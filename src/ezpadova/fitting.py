@@ -0,0 +1,266 @@
+"""Isochrone fitting of star clusters over a whole grid at once.
+
+:func:`grid_likelihood` evaluates the likelihood of a cluster color-magnitude
+diagram for every (logAge, MH) isochrone of a grid, and every combination of
+distance modulus and extinction, without any Python loop over stars or
+isochrone points.
+
+The likelihood of a star given an isochrone is the IMF-weighted mixture of
+Gaussians centered on the isochrone points,
+
+.. math::
+
+    \\mathcal{L}_i = \\sum_j w_j\\, \\mathcal{N}(x_i \\mid m_j + \\mu + A_V k, \\sigma_i),
+
+where the weights :math:`w_j` are the numbers of stars represented by each
+point (from `int_IMF`, normalized per isochrone), :math:`\\mu` is the distance
+modulus, and :math:`k` are the extinction coefficients of the dimensions.
+The chi-square terms of all (star, point) pairs are computed by matrix
+products, by chunks of isochrones to bound the memory.
+
+>>> iso = get_isochrones(logage=(8, 10, 0.05), MH=(-1, 0.3, 0.1), photsys_file="gaiaEDR3")
+>>> surface = grid_likelihood(iso, cluster, ["Gmag", ("G_BPmag", "G_RPmag")],
+...                           errors=cluster[["Gmag_err", "BP_RP_err"]].to_numpy(),
+...                           distance_modulus=np.arange(8, 10, 0.05))
+>>> best = surface.loc[surface.loglike.idxmax()]
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .index import Dimension, table_coordinates
+from .population import NODE_KEYS, _group_isochrones
+
+#: relative contributions below exp(_LOG_NEGLIGIBLE) are not computed exactly
+_LOG_NEGLIGIBLE = -40.0
+
+
+def _star_weights(int_imf: np.ndarray, node_id: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Normalized number of stars represented by each point of each isochrone
+
+    Each point receives half of the `int_IMF` range of both adjacent intervals.
+    """
+    same = node_id[1:] == node_id[:-1]
+    half = 0.5 * np.clip(np.diff(int_imf), 0, None) * same
+    weights = np.zeros_like(int_imf)
+    weights[:-1] += half
+    weights[1:] += half
+    counts = np.diff(np.r_[starts, len(int_imf)])
+    total = np.repeat(np.add.reduceat(weights, starts), counts)
+    return np.where(total > 0, weights / np.where(total > 0, total, 1.0), 1.0 / np.repeat(counts, counts))
+
+
+def _chunk_loglike(
+    model: np.ndarray,
+    log_weights: np.ndarray,
+    bounds: np.ndarray,
+    shifts: np.ndarray,
+    stars: np.ndarray,
+    ivar: np.ndarray,
+    norm: np.ndarray,
+    log_outlier: np.ndarray | None,
+    log_inlier: float,
+) -> np.ndarray:
+    """Log-likelihood of a chunk of isochrones for all the shifts
+
+    Parameters
+    ----------
+    model : np.ndarray
+        (rows, ndim) points of the isochrones of the chunk.
+    log_weights : np.ndarray
+        (rows,) log weights of the points.
+    bounds : np.ndarray
+        (n_nodes + 1,) row bounds of the isochrones in `model`.
+    shifts : np.ndarray
+        (n_shifts, ndim) offsets applied to the model points.
+    stars, ivar : np.ndarray
+        (n_stars, ndim) observations (0 where missing) and inverse variances.
+    norm : np.ndarray
+        (n_stars,) log normalization of the Gaussians.
+    log_outlier : np.ndarray | None
+        (n_stars,) log density of the outlier component, including its fraction.
+    log_inlier : float
+        log of the fraction of members.
+
+    Returns
+    -------
+    np.ndarray
+        (n_nodes, n_shifts) total log-likelihoods.
+    """
+    starts, counts = bounds[:-1], np.diff(bounds)
+    # points without weight (e.g., missing values) are left out of the sums, and
+    # isochrones without any point cannot produce the observations
+    finite = np.isfinite(log_weights)
+    masked = np.flatnonzero(~finite)
+    empty = np.add.reduceat(finite, starts) == 0
+    log_weights = np.where(finite, log_weights, 0.0)
+    # -0.5 chi2 + log(w) = -0.5 |x|^2 + [x, -0.5, 1] . [m, m^2, log(w)] with per-star
+    # variances, i.e. a single matrix product up to a per-star constant
+    weighted = stars * ivar
+    left = np.hstack([weighted, -0.5 * ivar, np.ones((len(stars), 1))])
+    const = norm - 0.5 * np.sum(stars * weighted, axis=1)
+    logp = np.empty((len(stars), len(model)))
+    result = np.empty((len(starts), len(shifts)))
+    for s, shift in enumerate(shifts):
+        points = model + shift
+        np.matmul(left, np.hstack([points, points**2, log_weights[:, None]]).T, out=logp)
+        logp[:, masked] = -np.inf
+        # per-isochrone logsumexp over the points; negligible terms are clipped
+        # to avoid the slow underflow of exp
+        peak = np.maximum.reduceat(logp, starts, axis=1)
+        peak[:, empty] = 0.0
+        logp -= np.repeat(peak, counts, axis=1)
+        np.maximum(logp, _LOG_NEGLIGIBLE, out=logp)
+        np.exp(logp, out=logp)
+        logp[:, masked] = 0.0
+        with np.errstate(divide="ignore"):
+            loglike = peak + np.log(np.add.reduceat(logp, starts, axis=1)) + const[:, None]
+        if log_outlier is not None:
+            loglike = np.logaddexp(loglike + log_inlier, log_outlier[:, None])
+        result[:, s] = loglike.sum(axis=0)
+    result[empty] = -np.inf
+    return result
+
+
+def grid_likelihood(
+    isochrones: pd.DataFrame,
+    catalog: pd.DataFrame | np.ndarray,
+    columns: Sequence[Dimension],
+    errors: float | Sequence[float] | np.ndarray = 0.05,
+    distance_modulus: float | Sequence[float] = 0.0,
+    av: float | Sequence[float] = 0.0,
+    coefficients: pd.Series | dict | None = None,
+    outlier_fraction: float = 0.0,
+    max_elements: int = 2**24,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Evaluate the likelihood of a cluster over a whole isochrone grid.
+
+    Parameters
+    ----------
+    isochrones : pd.DataFrame | QuickInterpolator
+        Isochrone grid with `logAge`, `MH`, `int_IMF`, and the columns used.
+    catalog : pd.DataFrame | np.ndarray
+        The cluster stars, with the columns of `columns` (colors can be given
+        as `a-b` columns), or an array of shape (n_stars, ndim). Missing (NaN)
+        values are ignored.
+    columns : Sequence[str | tuple[str, str]]
+        Dimensions of the fit: absolute magnitudes (shifted by the distance
+        modulus) or `(a, b)` pairs for colors.
+    errors : float | Sequence[float] | np.ndarray
+        Uncertainties: a scalar, one per dimension, or an (n_stars, ndim) array.
+    distance_modulus : float | Sequence[float]
+        Distance modulus value(s) to evaluate.
+    av : float | Sequence[float]
+        Extinction value(s) to evaluate, requires `coefficients` if not 0.
+    coefficients : pd.Series | dict
+        Extinction coefficients :math:`A_\\lambda / A_V` of the bands
+        (see :func:`ezpadova.extinction.extinction_coefficients`).
+    outlier_fraction : float
+        Fraction of field stars, modeled as a uniform density over the range of
+        the catalog.
+    max_elements : int
+        Maximum number of (star, point) pairs evaluated at once, which bounds
+        the memory use (8 bytes per pair and a few temporaries).
+    workers : int
+        Number of processes evaluating chunks of isochrones in parallel.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per (logAge, MH, distance_modulus, Av) combination, with the
+        total log-likelihood `loglike` and the `posterior` probability of each
+        combination for flat priors over the grid.
+    """
+    if hasattr(isochrones, "interpolation_keys"):
+        # QuickInterpolator; a LazyInterpolator does not hold the whole grid
+        if not hasattr(isochrones, "data"):
+            raise TypeError(
+                f"{type(isochrones).__name__} has no in-memory grid, pass the isochrones as a table instead."
+            )
+        isochrones = isochrones.data.reset_index()
+    columns = [c if isinstance(c, str) else tuple(c) for c in columns]
+    ndim = len(columns)
+    if not 0 <= outlier_fraction < 1:
+        raise ValueError("outlier_fraction must be in [0, 1).")
+
+    # observations
+    stars = table_coordinates(catalog, columns)
+    sigma = np.broadcast_to(np.asarray(errors, dtype=float), stars.shape)
+    if np.any(sigma <= 0):
+        raise ValueError("errors must be positive.")
+    valid = np.isfinite(stars) & np.isfinite(sigma)
+    ivar = np.where(valid, 1.0 / np.where(valid, sigma, 1.0) ** 2, 0.0)
+    stars = np.where(valid, stars, 0.0)
+    norm = -0.5 * np.sum(np.where(valid, np.log(2 * np.pi * np.where(valid, sigma, 1.0) ** 2), 0.0), axis=1)
+
+    log_outlier, log_inlier = None, 0.0
+    if outlier_fraction > 0:
+        span = np.nanmax(np.where(valid, stars, np.nan), axis=0) - np.nanmin(np.where(valid, stars, np.nan), axis=0)
+        log_density = -np.log(np.where(span > 0, span, 1.0))
+        log_outlier = np.log(outlier_fraction) + np.sum(np.where(valid, log_density, 0.0), axis=1)
+        log_inlier = np.log1p(-outlier_fraction)
+
+    # model grid
+    data, starts, stops, node_id, nodes = _group_isochrones(isochrones)
+    model = table_coordinates(data, columns)
+    log_weights = np.log(_star_weights(data["int_IMF"].to_numpy(dtype=float), node_id, starts))
+    # points with missing values do not contribute
+    missing = ~np.all(np.isfinite(model), axis=1)
+    model[missing] = 0.0
+    log_weights[missing] = -np.inf
+
+    # offsets of each dimension for each (distance modulus, Av)
+    mu = np.atleast_1d(np.asarray(distance_modulus, dtype=float))
+    av = np.atleast_1d(np.asarray(av, dtype=float))
+    is_mag = np.array([isinstance(dim, str) for dim in columns], dtype=float)
+    if np.any(av != 0):
+        if coefficients is None:
+            raise ValueError("Extinction coefficients are required when av is not 0.")
+        coefficients = pd.Series(coefficients, dtype=float)
+        k = np.array([
+            coefficients[dim] if isinstance(dim, str) else coefficients[dim[0]] - coefficients[dim[1]]
+            for dim in columns
+        ])
+    else:
+        k = np.zeros(ndim)
+    shifts = (mu[:, None, None] * is_mag + av[None, :, None] * k).reshape(-1, ndim)
+
+    # chunks of isochrones with at most max_elements (star, point) pairs
+    max_rows = max(1, max_elements // max(1, len(stars)))
+    chunks, first = [], 0
+    while first < len(starts):
+        last = first + 1
+        while last < len(starts) and stops[last] - starts[first] <= max_rows:
+            last += 1
+        chunks.append((first, last))
+        first = last
+
+    def _arguments(first, last):
+        lo, hi = starts[first], stops[last - 1]
+        bounds = np.r_[starts[first:last], hi] - lo
+        return (model[lo:hi], log_weights[lo:hi], bounds, shifts,
+                stars, ivar, norm, log_outlier, log_inlier)
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_chunk_loglike, *_arguments(*c)) for c in chunks]
+            loglike = np.concatenate([f.result() for f in futures])
+    else:
+        loglike = np.concatenate([_chunk_loglike(*_arguments(*c)) for c in chunks])
+
+    result = pd.DataFrame({
+        key: np.repeat(nodes[key].to_numpy(), len(shifts)) for key in NODE_KEYS
+    })
+    result["distance_modulus"] = np.tile(np.repeat(mu, len(av)), len(nodes))
+    result["Av"] = np.tile(av, len(nodes) * len(mu))
+    result["loglike"] = loglike.ravel()
+    posterior = np.exp(result["loglike"] - result["loglike"].max())
+    result["posterior"] = posterior / posterior.sum()
+    return result
@@ -0,0 +1,280 @@
+"""Nearest-isochrone lookup of star catalogs in color-magnitude space.
+
+:class:`CMDIndex` builds a single KD-tree over all the rows of an isochrone
+grid, in a chosen set of magnitudes and colors, and keeps the grid node of
+each row. It answers vectorized nearest-point and within-radius queries for
+whole catalogs, in O(stars x log(rows)) instead of O(stars x rows).
+
+>>> iso = get_isochrones(logage=(8, 10, 0.05), MH=(-1, 0.3, 0.1), photsys_file="gaiaEDR3")
+>>> index = CMDIndex(iso, ["Gmag", ("G_BPmag", "G_RPmag")])
+>>> matches = index.nearest(catalog)                 # catalog has Gmag, G_BPmag, G_RPmag
+>>> per_node = index.nearest_per_node(catalog)       # best row of each isochrone
+
+The index can be pickled and reused across catalogs.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from typing import Union
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from .population import NODE_KEYS, _group_isochrones
+
+#: columns returned for each match
+MATCH_COLUMNS = ("Mini", "label")
+
+Dimension = Union[str, tuple[str, str]]  # evaluated at runtime, `|` needs Python 3.10
+
+
+def _dimension_name(dim: Dimension) -> str:
+    """Name of a magnitude or color (`a-b`) dimension"""
+    return dim if isinstance(dim, str) else f"{dim[0]}-{dim[1]}"
+
+
+def table_coordinates(table: pd.DataFrame | np.ndarray, columns: Sequence[Dimension]) -> np.ndarray:
+    """
+    Coordinates of a table in a color-magnitude space.
+
+    Parameters
+    ----------
+    table : pd.DataFrame | np.ndarray
+        Either a table with the given columns (colors can be given as `a-b`
+        columns), or an array of shape (n, ndim) of coordinates.
+    columns : Sequence[str | tuple[str, str]]
+        Dimensions of the space: column names or `(a, b)` pairs for colors.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n, ndim).
+    """
+    if not isinstance(table, pd.DataFrame):
+        points = np.atleast_2d(np.asarray(table, dtype=float))
+        if points.shape[1] != len(columns):
+            raise ValueError(f"Expecting {len(columns)} coordinates, got {points.shape[1]}.")
+        return points
+
+    points = np.empty((len(table), len(columns)), dtype=float)
+    for k, dim in enumerate(columns):
+        name = _dimension_name(dim)
+        if name in table.columns:
+            points[:, k] = table[name].to_numpy(dtype=float)
+        elif not isinstance(dim, str):
+            points[:, k] = table[dim[0]].to_numpy(dtype=float) - table[dim[1]].to_numpy(dtype=float)
+        else:
+            raise KeyError(f"Column {name} not found.")
+    return points
+
+
+class CMDIndex:
+    """KD-tree index of an isochrone grid in color-magnitude space.
+
+    Each dimension of the index is either a column (e.g., a magnitude) or a
+    color given as a pair of columns `(a, b)` for `a - b`. Distances are
+    Euclidean after dividing each dimension by `scale`.
+    """
+
+    def __init__(
+        self,
+        isochrones: pd.DataFrame,
+        columns: Sequence[Dimension],
+        scale: float | Sequence[float] = 1.0,
+        extra_columns: Sequence[str] = (),
+        leafsize: int = 16,
+    ):
+        """
+        Build the index.
+
+        Parameters
+        ----------
+        isochrones : pd.DataFrame
+            Isochrone grid, e.g., from :func:`ezpadova.get_isochrones`.
+        columns : Sequence[str | tuple[str, str]]
+            Dimensions of the index: column names or `(a, b)` pairs for colors.
+        scale : float | Sequence[float]
+            Scale of each dimension (e.g., typical uncertainties).
+        extra_columns : Sequence[str]
+            Columns returned with each match in addition to `Mini` and `label`.
+        leafsize : int
+            Leaf size of the KD-tree.
+
+        Attributes
+        ----------
+        nodes : pd.DataFrame
+            The (logAge, MH) coordinates of each isochrone.
+        data : pd.DataFrame
+            The indexed rows (sorted by isochrone), with a `node` column.
+        tree : scipy.spatial.cKDTree
+            The KD-tree of the scaled coordinates of `data`.
+        """
+        self.columns = [c if isinstance(c, str) else tuple(c) for c in columns]
+        if not self.columns:
+            raise ValueError("At least one column is required.")
+        self.scale = np.broadcast_to(np.asarray(scale, dtype=float), (len(self.columns),)).copy()
+        if np.any(self.scale <= 0):
+            raise ValueError("scale must be positive.")
+
+        data, _, _, node_id, self.nodes = _group_isochrones(isochrones)
+        keep = [*NODE_KEYS, *MATCH_COLUMNS, *extra_columns]
+        missing = [name for name in keep if name not in data.columns]
+        if missing:
+            raise KeyError(f"Columns {missing} are required.")
+        points = self.coordinates(data)
+        finite = np.all(np.isfinite(points), axis=1)
+
+        self.data = data.loc[finite, keep].reset_index(drop=True)
+        self.data.insert(0, "node", node_id[finite])
+        self.tree = cKDTree(points[finite], leafsize=leafsize)
+        self._node_trees = None
+
+    @property
+    def names(self) -> list:
+        """Names of the dimensions of the index"""
+        return [_dimension_name(dim) for dim in self.columns]
+
+    def coordinates(self, table: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """
+        Scaled coordinates of a table in the space of the index.
+
+        Parameters
+        ----------
+        table : pd.DataFrame | np.ndarray
+            Either a table with the columns of the index (colors can be given
+            as `a-b` columns), or an array of shape (n, ndim) of unscaled coordinates.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (n, ndim).
+        """
+        return table_coordinates(table, self.columns) / self.scale
+
+    def _matches(self, star: np.ndarray, row: np.ndarray, distance: np.ndarray) -> pd.DataFrame:
+        """Assemble the matched rows of the grid (`row == len(data)` for no match)"""
+        found = row < len(self.data)
+        safe = np.where(found, row, 0)
+        node = np.where(found, self.data["node"].to_numpy()[safe], -1)
+        result = pd.DataFrame({
+            "star": star, "distance": distance, "row": np.where(found, row, -1), "node": node
+        })
+        for key in NODE_KEYS:
+            result[key] = np.where(found, self.nodes[key].to_numpy()[np.maximum(node, 0)], np.nan)
+        for name in self.data.columns[len(NODE_KEYS) + 1:]:
+            values = self.data[name].to_numpy()[safe]
+            result[name] = values if found.all() else np.where(found, values, np.nan)
+        return result
+
+    def nearest(
+        self,
+        catalog: pd.DataFrame | np.ndarray,
+        k: int = 1,
+        max_distance: float = np.inf,
+        workers: int = 1,
+    ) -> pd.DataFrame:
+        """
+        Find the closest grid points of each star, over all isochrones.
+
+        Parameters
+        ----------
+        catalog : pd.DataFrame | np.ndarray
+            The stars (see :meth:`coordinates`).
+        k : int
+            Number of neighbors of each star.
+        max_distance : float
+            Maximum (scaled) distance of the neighbors. Stars without any
+            neighbor have `row` and `node` set to -1 and NaN values.
+        workers : int
+            Number of threads of the query (-1 for all the CPUs).
+
+        Returns
+        -------
+        pd.DataFrame
+            `k` rows per star, sorted by star and distance, with the columns
+            `star` (position in the catalog), `distance`, `row` (row of
+            :attr:`data`), `node`, `logAge`, `MH`, `Mini`, `label`, and the
+            extra columns.
+        """
+        points = self.coordinates(catalog)
+        distance, row = self.tree.query(
+            points, k=k, distance_upper_bound=max_distance, workers=workers
+        )
+        distance = np.asarray(distance).reshape(len(points), -1)
+        row = np.asarray(row).reshape(len(points), -1)
+        star = np.repeat(np.arange(len(points)), distance.shape[1])
+        return self._matches(star, row.ravel(), distance.ravel())
+
+    def within(
+        self,
+        catalog: pd.DataFrame | np.ndarray,
+        radius: float,
+        workers: int = 1,
+    ) -> pd.DataFrame:
+        """
+        Find all the grid points within a (scaled) radius of each star.
+
+        Parameters
+        ----------
+        catalog : pd.DataFrame | np.ndarray
+            The stars (see :meth:`coordinates`).
+        radius : float
+            The search radius.
+        workers : int
+            Number of threads of the query (-1 for all the CPUs).
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per (star, grid point) pair, sorted by star and row, with
+            the columns of :meth:`nearest`. Stars without neighbors are absent.
+        """
+        points = self.coordinates(catalog)
+        neighbors = self.tree.query_ball_point(points, radius, workers=workers, return_sorted=True)
+        counts = np.fromiter((len(n) for n in neighbors), dtype=np.int64, count=len(points))
+        star = np.repeat(np.arange(len(points)), counts)
+        row = np.concatenate([*neighbors, []]).astype(np.int64)
+        distance = np.sqrt(np.sum((self.tree.data[row] - points[star]) ** 2, axis=1))
+        return self._matches(star, row, distance)
+
+    def nearest_per_node(
+        self,
+        catalog: pd.DataFrame | np.ndarray,
+        workers: int = 1,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the closest point of every isochrone for each star.
+
+        The per-isochrone trees are built on the first call.
+
+        Parameters
+        ----------
+        catalog : pd.DataFrame | np.ndarray
+            The stars (see :meth:`coordinates`).
+        workers : int
+            Number of threads of the queries (-1 for all the CPUs).
+
+        Returns
+        -------
+        distance : np.ndarray
+            Array of shape (n_stars, n_nodes) of the (scaled) distances.
+        row : np.ndarray
+            Array of shape (n_stars, n_nodes) of the matched rows of :attr:`data`.
+        """
+        if self._node_trees is None:
+            node = self.data["node"].to_numpy()
+            bounds = np.searchsorted(node, np.arange(len(self.nodes) + 1))
+            self._node_trees = [
+                (start, cKDTree(self.tree.data[start:stop]) if stop > start else None)
+                for start, stop in zip(bounds[:-1], bounds[1:])  # pairwise needs Python 3.10
+            ]
+        points = self.coordinates(catalog)
+        distance = np.full((len(points), len(self.nodes)), np.inf)
+        row = np.full((len(points), len(self.nodes)), -1, dtype=np.int64)
+        for k, (start, tree) in enumerate(self._node_trees):
+            if tree is not None:
+                distance[:, k], local = tree.query(points, workers=workers)
+                row[:, k] = start + local
+        return distance, row
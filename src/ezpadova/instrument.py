@@ -0,0 +1,142 @@
+"""Timing and instrumentation hooks of the queries to the CMD website.
+
+Each request to the CMD website goes through the following stages:
+
+- ``submit``: submission of the form, until the response page is received,
+- ``server_wait``: time until the first byte of the response page, i.e., mostly
+  the server-side computation (included in ``submit``),
+- ``download``: transfer of the ``outputNNN.dat`` table,
+- ``decompress``: decompression of the table (if compressed),
+- ``parse``: parsing of the table into a DataFrame.
+
+Each stage emits an event, a dictionary with at least the keys ``stage``,
+``request`` (an identifier shared by all the events of one request),
+``seconds``, and ``status``, plus stage-specific information such as byte
+counts. Events are logged at DEBUG level on the ``ezpadova.instrument`` logger
+and sent to the callbacks registered with :func:`instrumentation`.
+
+>>> events = []
+>>> with instrumentation(events.append):
+...     df = get_isochrones(logage=(6, 7, 0.1), MH=(0, 0, 0))
+>>> pd.DataFrame(events).groupby("stage")["seconds"].sum()
+
+.. note::
+
+    Callbacks are attached to the current context (see :mod:`contextvars`).
+    They are not inherited by threads started from the context, unless the
+    context is explicitly copied (e.g., with :func:`contextvars.copy_context`).
+"""
+
+import itertools
+import logging
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+_callbacks: ContextVar = ContextVar("ezpadova_instrumentation", default=())
+_current_request: ContextVar = ContextVar("ezpadova_request", default=None)
+_request_counter = itertools.count(1)
+
+
+@contextmanager
+def instrumentation(callback: Callable[[dict], None]) -> Iterator[Callable]:
+    """Register a callback receiving the events emitted within the context.
+
+    Parameters
+    ----------
+    callback : Callable[[dict], None]
+        Function called with each event dictionary.
+        Exceptions raised by the callback propagate to the caller.
+
+    Yields
+    ------
+    Callable
+        The registered callback.
+    """
+    token = _callbacks.set(_callbacks.get() + (callback,))
+    try:
+        yield callback
+    finally:
+        _callbacks.reset(token)
+
+
+@contextmanager
+def request_scope() -> Iterator[int]:
+    """Attach all the events emitted within the context to a single request.
+
+    Nested scopes share the identifier of the outermost one.
+
+    Yields
+    ------
+    int
+        The request identifier.
+    """
+    current = _current_request.get()
+    if current is not None:
+        yield current
+        return
+    token = _current_request.set(next(_request_counter))
+    try:
+        yield _current_request.get()
+    finally:
+        _current_request.reset(token)
+
+
+def emit(stage: str, seconds: float, **info) -> dict:
+    """Emit an event to the logger and the registered callbacks.
+
+    Parameters
+    ----------
+    stage : str
+        The name of the stage.
+    seconds : float
+        The duration of the stage.
+    info : dict
+        Additional information attached to the event.
+
+    Returns
+    -------
+    dict
+        The emitted event.
+    """
+    event = {"stage": stage, "request": _current_request.get(), "seconds": seconds}
+    event.setdefault("status", "ok")
+    event.update(info)
+    logger.debug("%s", event)
+    for callback in _callbacks.get():
+        callback(event)
+    return event
+
+
+@contextmanager
+def timed(stage: str, **info) -> Iterator[dict]:
+    """Time the enclosed code and emit the corresponding event.
+
+    The yielded dictionary can be updated within the context to attach
+    information to the event (e.g., byte counts).
+    If an exception is raised, the event status is ``"error"``.
+
+    Parameters
+    ----------
+    stage : str
+        The name of the stage.
+    info : dict
+        Additional information attached to the event.
+
+    Yields
+    ------
+    dict
+        The information attached to the event.
+    """
+    start = time.perf_counter()
+    try:
+        yield info
+    except BaseException as error:
+        info.setdefault("status", "error")
+        info.setdefault("error", repr(error))
+        raise
+    finally:
+        emit(stage, time.perf_counter() - start, **info)
@@ -1,22 +1,62 @@
 """
 A quick isochrone interpolator from PARSEC cmd input file.
 
->>> iso = QuickIsochrone("filename.txt")
+>>> iso = QuickIsochrone("filename.txt")      # or compressed, e.g., "filename.txt.gz"
 >>> cluster_logAge = 8.3
 >>> cluster_mh = -0.2
 >>> cluster_isochrone = iso(cluster_logAge, cluster_mh)
+
+Individual stars of any (Mini, logAge, MH) are interpolated at once with
+
+>>> stars = iso.interpolate_stars(Mini, logAge, MH, what=["Gmag", "logTe", "logg"])
+
+Large batches of (logAge, MH) can be spread over processes sharing the grid:
+
+>>> with SharedInterpolatorPool(iso, workers=8) as pool:
+...     isochrones = pool.map([(8.3, -0.2), (8.4, -0.1)], what=["Gmag"])
 """
 
+from __future__ import annotations
+
+import os
+import sys
+import threading
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from itertools import chain
+from multiprocessing import shared_memory
 from numbers import Number
-from typing import Sequence, Union
+from typing import BinaryIO, final
 
 import numpy as np
 import pandas as pd
 from scipy.interpolate import LinearNDInterpolator
 
+from .nodestore import NodeStore
 from .parsec import parse_result
 
+#: evolution points at which :meth:`QuickInterpolator.__call__` evaluates the isochrones
+_PHASE = np.arange(0, 9, 1e-3)
+_PHASE.setflags(write=False)
+
+# per-thread scratch buffers of QuickInterpolator.__call__
+_scratch = threading.local()
+
+
+def _read_only(values: np.ndarray) -> np.ndarray:
+    """A read-only view of an array, which cannot be modified by mistake from any thread"""
+    view = values.view()
+    view.setflags(write=False)
+    return view
+
+
+def _column(lookup: dict, name: str) -> np.ndarray:
+    """The values of a column in a lookup (see :meth:`QuickInterpolator._build_lookup`)"""
+    try:
+        return lookup["columns"][name]
+    except KeyError:
+        raise KeyError(f"Column {name} is not a numeric column of the isochrones.") from None
+
 
 class QuickInterpolator:
     """Quick and "no so dirty" isochrone interpolation
@@ -31,18 +71,27 @@ class QuickInterpolator:
 
     Finally, using the 4 isochrones we interpolate any quantity from (logAge, MH, evol) input dimensions.
     The interpolation uses `LinearNDInterpolator`.
+
+    The interpolator is immutable after construction: the per-row arrays used
+    by the interpolation are built once, read-only, and every call only
+    allocates its own outputs (and reuses per-thread scratch buffers). A single
+    instance can therefore be shared by any number of threads, e.g., in a web
+    service, and :meth:`map` evaluates batches with a thread pool. The `data`
+    table must not be modified after construction.
     """
 
-    def __init__(self, fname: Union[str, pd.DataFrame]):
+    def __init__(self, fname: str | os.PathLike | BinaryIO | pd.DataFrame):
         """
         Initialize the interpolation object with isochrone data.
 
         Parameters
         ----------
-        fname : Union[str, pd.DataFrame]
-            If a string is provided, it should be the file path to a file containing
-            isochrone data. If a pandas DataFrame is provided, it should contain
-            the isochrone data directly.
+        fname : Union[str, os.PathLike, BinaryIO, pd.DataFrame]
+            If a path or a binary stream is provided, it should contain an
+            isochrone table as returned by the CMD website, possibly compressed
+            with gzip, bzip2, or zip (decompressed on the fly, see
+            :func:`ezpadova.parsec.parse_result`). If a pandas DataFrame is
+            provided, it should contain the isochrone data directly.
 
         Attributes
         ----------
@@ -57,6 +106,8 @@ class QuickInterpolator:
         """
         if isinstance(fname, pd.DataFrame):
             isochrones = fname
+        elif hasattr(fname, "read"):
+            isochrones = parse_result(fname)
         else:
             with open(fname, "rb") as f:
                 isochrones = parse_result(f)
@@ -70,6 +121,45 @@ class QuickInterpolator:
         self.ndim = len(self.coords)
 
         self.interpolation_keys = "logAge", "MH", "evol"
+        self._prepare()
+
+    def _prepare(self):
+        """Build the read-only arrays of the interpolation, once per instance"""
+        self.coords = {key: _read_only(np.asarray(values)) for key, values in self.coords.items()}
+        self._lookup = self._build_lookup(self.data)
+
+    def __getstate__(self) -> dict:
+        """Compact state made of contiguous NumPy buffers
+
+        The columns are stored as 1d arrays (views of the DataFrame, without
+        copy), and the (logAge, MH) index as its levels and integer codes, so
+        that the interpolator is rebuilt without re-indexing. With pickle
+        protocol 5, the arrays can be transferred out-of-band (see
+        :class:`pickle.PickleBuffer`).
+        """
+        index = self.data.index
+        return {
+            "columns": {name: self.data[name].to_numpy() for name in self.data.columns},
+            "index_names": list(index.names),
+            "index_levels": [level.to_numpy() for level in index.levels],
+            "index_codes": [np.asarray(codes) for codes in index.codes],
+            "coords": self.coords,
+            "interpolation_keys": self.interpolation_keys,
+        }
+
+    def __setstate__(self, state: dict):
+        """Rebuild the interpolator from :meth:`__getstate__`"""
+        index = pd.MultiIndex(
+            levels=state["index_levels"],
+            codes=state["index_codes"],
+            names=state["index_names"],
+            verify_integrity=False,
+        )
+        self.data = pd.DataFrame(state["columns"], index=index, copy=False)
+        self.coords = state["coords"]
+        self.ndim = len(self.coords)
+        self.interpolation_keys = state["interpolation_keys"]
+        self._prepare()
 
     def get_closest_coordinates(self, *args) -> Sequence[Number]:
         """returns the closest (logAge, MH) from the input coordinates"""
@@ -101,9 +191,23 @@ class QuickInterpolator:
         final_quadrupole = [[(val0, val1) for val1 in where[1]] for val0 in where[0]]
         return list(chain(*final_quadrupole))
 
+    @property
+    def columns(self) -> pd.Index:
+        """The columns of the isochrones, without the (logAge, MH) index"""
+        return self.data.columns
+
+    @property
+    def _numeric_columns(self) -> list[str]:
+        """The columns interpolated by default, i.e., the numeric :attr:`columns`"""
+        return list(self.data.select_dtypes("number").columns)
+
+    def _nodes(self, nodes: Sequence[tuple[Number, Number]]) -> pd.DataFrame:
+        """The isochrones of (logAge, MH) grid nodes, indexed as :attr:`data`"""
+        return self.data.loc[nodes]
+
     def get_closest(self, logAge: float, MH: float) -> pd.DataFrame:
         """Returns the table corresponding to the closest isochrone from (logAge, MH)"""
-        return self.data.loc[self.get_closest_coordinates(logAge, MH)]
+        return self._nodes([tuple(self.get_closest_coordinates(logAge, MH))])
 
     @staticmethod
     def add_evolution_phase(iso: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
@@ -132,7 +236,7 @@ class QuickInterpolator:
         return values
 
     def __call__(
-        self, logAge: Number, MH: Number, what: Sequence[str] = None
+        self, logAge: Number, MH: Number, what: Sequence[str] | None = None
     ) -> pd.DataFrame:
         """
         Interpolate isochrones at given (logAge, MH).
@@ -144,28 +248,29 @@ class QuickInterpolator:
         MH: Number
             The metallicity for interpolation.
         what: Sequence[str], optional
-            Specific columns to interpolate. If None, all columns are used.
+            Specific numeric columns to interpolate. If None, all numeric columns are used.
 
         Returns
         -------
         pd.DataFrame: A DataFrame containing the interpolated isochrones with columns specified in `what`,
                   along with 'logAge', 'MH', and 'evol' columns.
         """
-        # make sure we get unique isochrones
-        bracket = list(set(self.get_bracket_coordinates(logAge, MH)))
-
-        # get individual isochrones with continuous evolution phases
-        iso_ = [
-            self.add_evolution_phase(k[1]).reset_index()
-            for k in self.data.loc[bracket].groupby(["logAge", "MH"])
-        ]
-
-        interp_points = np.vstack([self.get_interp_data(isok) for isok in iso_])
+        # make sure we get unique isochrones, in the order of the grid
+        bracket = sorted(set(self.get_bracket_coordinates(logAge, MH)))
+        lookup = self._nodes_lookup(bracket)
+        if "evol" not in lookup:
+            raise KeyError("Column label is required.")
+        rows = np.concatenate([
+            np.arange(lookup["starts"][k], lookup["stops"][k]) for k in self._node_ids(lookup, bracket)
+        ])
+
+        # interpolation dimensions: (logAge, MH, evol), with continuous evolution phases
+        interp_points = np.column_stack([lookup["logAge"][rows], lookup["MH"][rows], lookup["evol"][rows]])
 
         if what is None:
-            what = self.data.columns
+            what = self._numeric_columns
 
-        targets = np.vstack([np.vstack([k[what_] for what_ in what]).T for k in iso_])
+        targets = np.column_stack([_column(lookup, name)[rows] for name in what])
 
         # dimensions without dispersion are not useful for interpolation
         # e.g, single age, or single MH.
@@ -173,14 +278,472 @@ class QuickInterpolator:
 
         interp_fn = LinearNDInterpolator(interp_points[:, useful_dim], targets)
 
-        phase = np.arange(0, 9, 1e-3)
-        values = np.array(
-            [np.ones_like(phase) * logAge, np.ones_like(phase) * MH, phase]
-        ).T
+        # evaluation points, in a buffer owned by the current thread
+        values = getattr(_scratch, "values", None)
+        if values is None:
+            values = _scratch.values = np.column_stack([_PHASE, _PHASE, _PHASE])
+        values[:, 0] = logAge
+        values[:, 1] = MH
 
         res = interp_fn(values[:, useful_dim])
         data = pd.DataFrame.from_records(res, columns=what)
         data["logAge"] = logAge
         data["MH"] = MH
-        data["evol"] = phase
-        return data.dropna()
\ No newline at end of file
+        data["evol"] = _PHASE
+        return data.dropna()
+
+    def map(
+        self,
+        points: Iterable[tuple[float, float]],
+        what: Sequence[str] | None = None,
+        workers: int | None = None,
+    ) -> list[pd.DataFrame]:
+        """
+        Interpolate isochrones at many (logAge, MH) with a pool of threads.
+
+        All the threads share this instance without copy. The Delaunay
+        triangulations and the evaluations of `LinearNDInterpolator` release
+        the GIL, so that they run in parallel. For a grid shared between
+        processes, see :class:`SharedInterpolatorPool`.
+
+        Parameters
+        ----------
+        points : Iterable[tuple[float, float]]
+            The (logAge, MH) values.
+        what : Sequence[str], optional
+            Columns to interpolate (see :meth:`__call__`).
+        workers : int, optional
+            Number of threads. Default to that of :class:`concurrent.futures.ThreadPoolExecutor`.
+
+        Returns
+        -------
+        list[pd.DataFrame]
+            The isochrones, in the order of `points`.
+        """
+        points = list(points)
+        if not points:
+            return []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda point: self(*point, what=what), points))
+
+    def _build_lookup(self, data: pd.DataFrame) -> dict:
+        """Read-only per-row arrays of the isochrones of a table indexed by (logAge, MH)
+
+        The rows are grouped by isochrone, keeping their order within each
+        (without copy if they already are). `evol` expands the integer `label`
+        of each row into continuous values as :meth:`add_evolution_phase`.
+
+        For :meth:`interpolate_stars`, all isochrones are concatenated into a
+        single increasing array `key = node + f(Mini)`, where `f` maps the
+        `Mini` range of each isochrone onto [0, 1), so that stars are located
+        in every isochrone with a single `np.searchsorted` call.
+
+        Only the numeric columns are kept, as views of `data` when possible.
+        """
+        logage = data.index.get_level_values("logAge").to_numpy(dtype=float)
+        mh = data.index.get_level_values("MH").to_numpy(dtype=float)
+        order = np.lexsort((mh, logage))
+        if np.array_equal(order, np.arange(len(order))):
+            order = slice(None)
+        logage, mh = logage[order], mh[order]
+        new_node = np.r_[True, (logage[1:] != logage[:-1]) | (mh[1:] != mh[:-1])]
+        starts = np.flatnonzero(new_node)
+        stops = np.r_[starts[1:], len(logage)]
+        node_id = np.cumsum(new_node) - 1
+        numeric = data.select_dtypes("number").columns
+        columns = {name: data[name].to_numpy(dtype=float)[order] for name in numeric}
+
+        # (logAge, MH) cell -> node, -1 for missing isochrones
+        age_id = np.searchsorted(self.coords["logAge"], logage[starts])
+        mh_id = np.searchsorted(self.coords["MH"], mh[starts])
+        node_map = np.full((len(self.coords["logAge"]), len(self.coords["MH"])), -1)
+        node_map[age_id, mh_id] = np.arange(len(starts))
+
+        lookup = {
+            "logAge": logage, "MH": mh, "starts": starts, "stops": stops, "node_map": node_map,
+        }
+        if "label" in columns:
+            # rank of each row among the rows of its label in its isochrone
+            label = columns["label"]
+            by_label = np.lexsort((label, node_id))
+            node, phase = node_id[by_label], label[by_label]
+            first = np.flatnonzero(np.r_[True, (node[1:] != node[:-1]) | (phase[1:] != phase[:-1])])
+            counts = np.diff(np.r_[first, len(label)])
+            evol = np.empty(len(label))
+            rank = np.arange(len(label)) - np.repeat(first, counts)
+            evol[by_label] = phase + rank * np.repeat(1.0 / counts, counts)
+            lookup["evol"] = evol
+        if "Mini" in columns and len(starts):
+            mini = columns["Mini"]
+            low, high = mini[starts], np.maximum.reduceat(mini, starts)
+            width = np.where(high > low, high - low, 1.0)
+            frac = np.clip((mini - low[node_id]) / width[node_id], 0.0, 1.0) * (1 - 1e-12)
+            # enforce monotonicity against rounding noise in the tables
+            lookup.update(low=low, high=high, key=np.maximum.accumulate(node_id + frac))
+
+        lookup = {key: _read_only(values) for key, values in lookup.items()}
+        lookup["columns"] = {name: _read_only(values) for name, values in columns.items()}
+        return lookup
+
+    def _node_ids(self, lookup: dict, nodes: Sequence[tuple[Number, Number]]) -> np.ndarray:
+        """The positions of (logAge, MH) grid nodes in the arrays of a lookup"""
+        age_id = np.searchsorted(self.coords["logAge"], [node[0] for node in nodes])
+        mh_id = np.searchsorted(self.coords["MH"], [node[1] for node in nodes])
+        ids = lookup["node_map"][age_id, mh_id]
+        if np.any(ids < 0):
+            raise KeyError(f"{[node for node, k in zip(nodes, ids) if k < 0]} not in index")
+        return ids
+
+    def _nodes_lookup(self, nodes: Sequence[tuple[Number, Number]]) -> dict:
+        """The lookup arrays (see :meth:`_build_lookup`) covering (logAge, MH) grid nodes"""
+        return self._lookup
+
+    def _stars_lookup(self, logAge: np.ndarray, MH: np.ndarray) -> dict:
+        """The lookup arrays (see :meth:`_build_lookup`) covering a chunk of stars"""
+        return self._lookup
+
+    @staticmethod
+    def _bracket_many(value: np.ndarray, sorted_seq: np.ndarray) -> Sequence[np.ndarray]:
+        """Vectorized :meth:`_bracket`: lower and upper indices, and the weight of the upper one"""
+        upper = np.clip(np.searchsorted(sorted_seq, value, side="right"), 0, len(sorted_seq) - 1)
+        lower = np.where(value >= sorted_seq[-1], upper, np.maximum(upper - 1, 0))
+        span = sorted_seq[upper] - sorted_seq[lower]
+        weight = np.where(span > 0, (value - sorted_seq[lower]) / np.where(span > 0, span, 1.0), 0.0)
+        return lower, upper, weight
+
+    def interpolate_stars(
+        self,
+        Mini: Number | Sequence[Number],
+        logAge: Number | Sequence[Number],
+        MH: Number | Sequence[Number],
+        what: Sequence[str] | None = None,
+        chunk_size: int = 1_000_000,
+    ) -> pd.DataFrame:
+        """
+        Interpolate isochrone quantities for individual stars.
+
+        Each star is located by its initial mass in the (up to) 4 isochrones
+        bracketing its (logAge, MH), and the quantities are linearly
+        interpolated in `Mini` within each isochrone, then bilinearly in
+        (logAge, MH). Stars are processed by chunks, without any loop over
+        stars or isochrones.
+
+        Parameters
+        ----------
+        Mini : Number | Sequence[Number]
+            The initial masses of the stars.
+        logAge : Number | Sequence[Number]
+            The logarithm of the ages of the stars.
+        MH : Number | Sequence[Number]
+            The metallicities of the stars.
+        what : Sequence[str], optional
+            Numeric columns to interpolate. If None, all numeric columns are used.
+        chunk_size : int
+            Maximum number of stars processed at once.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per star with the columns in `what`. Stars outside of the
+            `Mini` range of a contributing isochrone (e.g., dead stars) are NaN.
+            `label` is taken from the closest isochrone, at the lower row.
+        """
+        Mini, logAge, MH = (
+            np.ravel(k).astype(float) for k in np.broadcast_arrays(Mini, logAge, MH)
+        )
+        if what is None:
+            what = self._numeric_columns
+        what = list(what)
+        lookup = values = None
+        discrete = [k for k, name in enumerate(what) if name == "label"]
+
+        result = np.empty((len(Mini), len(what)))
+        for first in range(0, len(Mini), max(1, int(chunk_size))):
+            chunk = slice(first, first + max(1, int(chunk_size)))
+            # grouping the stars by grid cell and mass makes the lookups contiguous
+            cell = (np.searchsorted(self.coords["logAge"], logAge[chunk]) * (len(self.coords["MH"]) + 1)
+                    + np.searchsorted(self.coords["MH"], MH[chunk]))
+            order = np.lexsort((Mini[chunk], cell))
+            current = self._stars_lookup(logAge[chunk], MH[chunk])
+            if "key" not in current:
+                raise KeyError("Column Mini is required.")
+            if current is not lookup:
+                lookup, values = current, np.column_stack([_column(current, name) for name in what])
+            result[first + order] = self._interpolate_stars(
+                lookup, values, discrete, Mini[chunk][order], logAge[chunk][order], MH[chunk][order]
+            )
+        return pd.DataFrame(result, columns=what)
+
+    def _interpolate_stars(self, lookup, values, discrete, mini, logage, mh) -> np.ndarray:
+        """Interpolate a chunk of stars (see :meth:`interpolate_stars`)"""
+        a0, a1, wa = self._bracket_many(logage, self.coords["logAge"])
+        m0, m1, wm = self._bracket_many(mh, self.coords["MH"])
+        corners = (
+            (a0, m0, (1 - wa) * (1 - wm)),
+            (a0, m1, (1 - wa) * wm),
+            (a1, m0, wa * (1 - wm)),
+            (a1, m1, wa * wm),
+        )
+        key, starts, stops = lookup["key"], lookup["starts"], lookup["stops"]
+        low, high = lookup["low"], lookup["high"]
+
+        total = np.zeros((len(mini), values.shape[1]))
+        label, best = np.full((len(mini), len(discrete)), np.nan), np.full(len(mini), -1.0)
+        for age_id, mh_id, weight in corners:
+            node = lookup["node_map"][age_id, mh_id]
+            missing = node < 0
+            node = np.maximum(node, 0)
+            width = np.where(high[node] > low[node], high[node] - low[node], 1.0)
+            frac = (mini - low[node]) / width
+            outside = missing | (mini < low[node]) | (mini > high[node])
+            target = node + np.clip(frac, 0.0, 1.0) * (1 - 1e-12)
+
+            idx = np.searchsorted(key, target, side="right") - 1
+            idx = np.clip(idx, starts[node], np.maximum(starts[node], stops[node] - 2))
+            nxt = np.minimum(idx + 1, stops[node] - 1)
+            delta = key[nxt] - key[idx]
+            t = np.where(delta > 0, (target - key[idx]) / np.where(delta > 0, delta, 1.0), 0.0)
+            corner = values[idx] + t[:, None] * (values[nxt] - values[idx])
+            corner[outside] = np.nan
+
+            # corners without weight do not contribute, even if undefined
+            total += np.where(weight[:, None] > 0, weight[:, None] * corner, 0.0)
+            if discrete:
+                closer = weight > best
+                label = np.where(closer[:, None], corner[:, discrete], label)
+                label[closer & ~outside] = values[idx][closer & ~outside][:, discrete]
+                best = np.maximum(best, weight)
+        total[:, discrete] = label
+        return total
+
+
+class LazyInterpolator(QuickInterpolator):
+    """:class:`QuickInterpolator` over an on-disk grid, loaded node by node.
+
+    Only the (logAge, MH) coordinates of the grid are read at startup. The
+    isochrones bracketing each request are loaded from a
+    :class:`~ezpadova.nodestore.NodeStore` and kept in its byte-bounded LRU
+    cache, so that grids larger than the memory are interpolated with a
+    bounded footprint.
+
+    >>> NodeStore.build("parsec_full.dat.gz", "parsec_full")   # once
+    >>> iso = LazyInterpolator("parsec_full", max_bytes=2**30)
+    >>> cluster_isochrone = iso(8.3, -0.2)
+
+    There is no :attr:`data` table: use :meth:`get_closest` or the store to
+    access the isochrones.
+    """
+
+    def __init__(self, store: str | os.PathLike | NodeStore, max_bytes: int = 2**30):
+        """
+        Open an on-disk grid.
+
+        Parameters
+        ----------
+        store : str | os.PathLike | NodeStore
+            The store of the grid, or its directory.
+        max_bytes : int
+            The maximum size of the cached isochrones when opening a directory.
+
+        Attributes
+        ----------
+        store : NodeStore
+            The store of the isochrones.
+        coords : dict
+            A dictionary containing unique values of 'logAge' and 'MH' of the grid.
+        """
+        if not isinstance(store, NodeStore):
+            store = NodeStore(store, max_bytes=max_bytes)
+        self.store = store
+        self.coords = {key: _read_only(values) for key, values in store.coords.items()}
+        self.ndim = len(self.coords)
+        self.interpolation_keys = "logAge", "MH", "evol"
+
+    def __getstate__(self) -> dict:
+        """The location of the store only, the isochrones are reloaded on demand"""
+        return {"store": self.store}
+
+    def __setstate__(self, state: dict):
+        """Rebuild the interpolator from :meth:`__getstate__`"""
+        self.__init__(state["store"])
+
+    @property
+    def columns(self) -> pd.Index:
+        """The columns of the isochrones, without the (logAge, MH) index"""
+        return pd.Index([name for name in self.store.columns if name not in ("logAge", "MH", "index")])
+
+    @property
+    def _numeric_columns(self) -> list[str]:
+        """The columns interpolated by default: stores only hold numeric columns"""
+        return list(self.columns)
+
+    def _nodes(self, nodes: Sequence[tuple[Number, Number]]) -> pd.DataFrame:
+        """The isochrones of (logAge, MH) grid nodes, loaded from the store"""
+        return self.store.get(nodes)
+
+    def _stars_lookup(self, logAge: np.ndarray, MH: np.ndarray) -> dict:
+        """The lookup arrays of the isochrones contributing to a chunk of stars
+
+        Only the corners of non-zero weight are loaded, as the others do not
+        contribute (see :meth:`_interpolate_stars`). The memory used therefore
+        scales with the number of grid cells spanned by a chunk of stars.
+        """
+        a0, a1, wa = self._bracket_many(logAge, self.coords["logAge"])
+        m0, m1, wm = self._bracket_many(MH, self.coords["MH"])
+        cells = np.concatenate([
+            np.stack([a, m], axis=1)[weight > 0]
+            for a, m, weight in (
+                (a0, m0, (1 - wa) * (1 - wm)), (a0, m1, (1 - wa) * wm),
+                (a1, m0, wa * (1 - wm)), (a1, m1, wa * wm),
+            )
+        ])
+        nodes = [
+            node for node in (
+                (self.coords["logAge"][a], self.coords["MH"][m]) for a, m in np.unique(cells, axis=0)
+            ) if node in self.store
+        ]
+        return self._nodes_lookup(nodes)
+
+    def _nodes_lookup(self, nodes: Sequence[tuple[Number, Number]]) -> dict:
+        """The lookup arrays of (logAge, MH) grid nodes, loaded from the store"""
+        return self._build_lookup(self.store.get(nodes))
+
+
+# grid of the current worker process of a SharedInterpolatorPool
+_worker_state = {}
+
+
+def _attach_shared_grid(name: str, shape: tuple[int, int], columns: Sequence[str]):
+    """Build the interpolator of a worker process over the shared grid"""
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+    values = np.ndarray(shape, dtype=float, buffer=shm.buf)
+    data = pd.DataFrame(
+        values[:, 2:],
+        index=pd.MultiIndex.from_arrays([values[:, 0], values[:, 1]], names=["logAge", "MH"]),
+        columns=list(columns[2:]),
+        copy=False,
+    )
+    interp = QuickInterpolator.__new__(QuickInterpolator)
+    interp.data = data
+    interp.coords = {"logAge": np.unique(values[:, 0]), "MH": np.unique(values[:, 1])}
+    interp.ndim = len(interp.coords)
+    interp.interpolation_keys = "logAge", "MH", "evol"
+    interp._prepare()
+    # keep the segment mapped for the lifetime of the worker
+    _worker_state.update(shm=shm, interp=interp)
+
+
+def _interpolate_batch(
+    points: Sequence[tuple[float, float]], what: Sequence[str] | None
+) -> list[pd.DataFrame]:
+    """Interpolate a batch of (logAge, MH) in a worker process"""
+    interp = _worker_state["interp"]
+    return [interp(logAge, MH, what=what) for logAge, MH in points]
+
+
+@final
+class SharedInterpolatorPool:
+    """Process pool evaluating a :class:`QuickInterpolator` in parallel.
+
+    The numeric grid of the interpolator is copied once into a
+    :mod:`multiprocessing.shared_memory` segment, which every worker maps
+    without copying. Tasks only transfer the requested (logAge, MH) values and
+    the resulting isochrones.
+
+    The pool should be used as a context manager, or closed with
+    :meth:`close`, to release the shared memory.
+    """
+
+    def __init__(
+        self,
+        interpolator: QuickInterpolator | pd.DataFrame | str,
+        workers: int | None = None,
+        mp_context=None,
+    ):
+        """
+        Start the worker processes.
+
+        Parameters
+        ----------
+        interpolator : QuickInterpolator | pd.DataFrame | str
+            The interpolator, or the isochrones to build it from. A
+            :class:`LazyInterpolator` cannot be shared, as its grid is not in memory.
+        workers : int, optional
+            Number of worker processes. Default to the number of CPUs.
+        mp_context : multiprocessing context, optional
+            Start method of the workers (see :class:`concurrent.futures.ProcessPoolExecutor`).
+        """
+        if isinstance(interpolator, LazyInterpolator):
+            raise TypeError("The grid of a LazyInterpolator is not in memory and cannot be shared.")
+        if not isinstance(interpolator, QuickInterpolator):
+            interpolator = QuickInterpolator(interpolator)
+        # grouped by isochrone, the workers interpolate from views of the segment
+        table = interpolator.data[interpolator._numeric_columns].reset_index()
+        table = table.sort_values(["logAge", "MH"], kind="stable")
+        columns = list(table.columns)
+        values = table.to_numpy(dtype=float)
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        try:
+            np.ndarray(values.shape, dtype=float, buffer=self._shm.buf)[:] = values
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp_context,
+                initializer=_attach_shared_grid,
+                initargs=(self._shm.name, values.shape, columns),
+            )
+        except BaseException:
+            self._shm.close()
+            self._shm.unlink()
+            raise
+        self.workers = self._executor._max_workers
+
+    def map(
+        self,
+        points: Iterable[tuple[float, float]],
+        what: Sequence[str] | None = None,
+        batch_size: int | None = None,
+    ) -> list[pd.DataFrame]:
+        """
+        Interpolate isochrones at many (logAge, MH).
+
+        Parameters
+        ----------
+        points : Iterable[tuple[float, float]]
+            The (logAge, MH) values.
+        what : Sequence[str], optional
+            Columns to interpolate (see :meth:`QuickInterpolator.__call__`).
+        batch_size : int, optional
+            Number of points per task. Default to an even split of the points
+            over 4 tasks per worker.
+
+        Returns
+        -------
+        list[pd.DataFrame]
+            The interpolated isochrones, in the order of `points`.
+        """
+        points = [(float(logAge), float(MH)) for logAge, MH in points]
+        if batch_size is None:
+            batch_size = max(1, -(-len(points) // (4 * self.workers)))
+        batches = [points[k:k + batch_size] for k in range(0, len(points), batch_size)]
+        what = None if what is None else list(what)
+        results = self._executor.map(_interpolate_batch, batches, [what] * len(batches))
+        return list(chain.from_iterable(results))
+
+    def close(self):
+        """Stop the workers and release the shared memory"""
+        if self._shm is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self) -> SharedInterpolatorPool:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,296 @@
+"""On-disk store of isochrone grids, loaded node by node.
+
+A :class:`NodeStore` keeps each (logAge, MH) isochrone of a grid in its own
+`.npy` file in a directory, next to a small JSON index of the nodes. Opening
+a store only reads the index: isochrones are read when requested and kept in
+a least-recently-used cache bounded in bytes, so that grids larger than the
+memory are used with a bounded footprint.
+
+Stores are built once from a CMD table (possibly compressed, see
+:func:`ezpadova.parsec.parse_result`), which is read by chunks and never
+loaded as a whole:
+
+>>> store = NodeStore.build("parsec_full.dat.gz", "parsec_full")
+>>> store = NodeStore("parsec_full", max_bytes=2**30)
+>>> iso = store.get([(8.3, -0.2), (8.35, -0.2)])
+
+:class:`ezpadova.interpolate.LazyInterpolator` interpolates isochrones and
+stars over a store.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from io import BytesIO
+from typing import BinaryIO
+
+import numpy as np
+import pandas as pd
+
+from .tools import NODE_KEYS, SingleFlight, open_decompressed, read_header, write_atomic
+
+#: name of the index of a store in its directory
+INDEX_FILE = "index.json"
+
+#: (logAge, MH) coordinates of an isochrone
+Node = tuple[float, float]
+
+
+def _node_runs(table: pd.DataFrame) -> Iterator[pd.DataFrame]:
+    """Split a table into runs of consecutive rows of the same isochrone"""
+    coords = table[list(NODE_KEYS)].to_numpy(dtype=float)
+    starts = np.flatnonzero(np.r_[True, np.any(coords[1:] != coords[:-1], axis=1)])
+    for start, stop in zip(starts, np.r_[starts[1:], len(table)]):
+        yield table.iloc[start:stop]
+
+
+def _table_chunks(
+    source: str | os.PathLike | bytes | BinaryIO | pd.DataFrame, chunksize: int, comment: str
+) -> Iterator[tuple[pd.DataFrame, str]]:
+    """Read a table by chunks of rows, with the comment lines of its header"""
+    if isinstance(source, pd.DataFrame):
+        yield source, source.attrs.get("comment", "")
+        return
+    with open_decompressed(source) as stream:
+        header, info = read_header(stream, comment)
+        for chunk in pd.read_csv(stream, sep=r"\s+", names=header, comment=comment, chunksize=chunksize):
+            yield chunk, info
+
+
+class NodeStore:
+    """Isochrone grid stored node by node, with a byte-bounded LRU cache.
+
+    Attributes
+    ----------
+    directory : str
+        The directory of the store.
+    max_bytes : int
+        The maximum size of the cached isochrones. The isochrones of a single
+        :meth:`get` call are always kept until it returns, even if they exceed it.
+    columns : list[str]
+        The columns of the isochrone tables, including `logAge` and `MH`.
+    comment : str
+        The comment lines of the original table.
+    nodes : pd.DataFrame
+        The `logAge`, `MH`, number of `rows`, and in-memory `bytes` of each
+        isochrone, sorted by (logAge, MH).
+    nbytes : int
+        The current size of the cached isochrones.
+    hits, misses : int
+        The number of requests served from the cache and read from disk.
+    """
+
+    def __init__(self, directory: str | os.PathLike, max_bytes: int = 2**30):
+        """
+        Open a store, reading only its index.
+
+        Parameters
+        ----------
+        directory : str | os.PathLike
+            The directory of a store created by :meth:`build`.
+        max_bytes : int
+            The maximum size of the cached isochrones, in bytes.
+        """
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be positive.")
+        self.directory = os.fspath(directory)
+        self.max_bytes = int(max_bytes)
+        with open(os.path.join(self.directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.columns = list(index["columns"])
+        self.comment = index.get("comment", "")
+        entries = index["nodes"]
+        self.nodes = pd.DataFrame({
+            "logAge": [float(e["logAge"]) for e in entries],
+            "MH": [float(e["MH"]) for e in entries],
+            "rows": [int(e["rows"]) for e in entries],
+            "bytes": [int(e["bytes"]) for e in entries],
+        })
+        self._files = {(float(e["logAge"]), float(e["MH"])): list(e["files"]) for e in entries}
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.nbytes = 0
+        self.hits = self.misses = 0
+
+    @classmethod
+    def build(
+        cls,
+        source: str | os.PathLike | bytes | BinaryIO | pd.DataFrame,
+        directory: str | os.PathLike,
+        chunksize: int = 100_000,
+        comment: str = "#",
+        **kwargs,
+    ) -> NodeStore:
+        """
+        Write a grid of isochrones into a store, one file per isochrone.
+
+        Tables are read by chunks of `chunksize` rows, so that only one chunk
+        and one isochrone are in memory at a time. The rows of an isochrone
+        are expected to be consecutive, as in the CMD outputs; isochrones split
+        across the table are stored in several files.
+
+        Parameters
+        ----------
+        source : str | os.PathLike | bytes | BinaryIO | pd.DataFrame
+            The grid: the path, content, or binary stream of a CMD table,
+            possibly compressed, or a table with `logAge` and `MH` columns.
+        directory : str | os.PathLike
+            The directory of the store, created if needed. The index of a
+            previous store in the same directory is replaced.
+        chunksize : int
+            The number of rows read at once.
+        comment : str
+            The character denoting the comment lines of the table.
+        **kwargs
+            Passed to :class:`NodeStore` to open the new store.
+
+        Returns
+        -------
+        NodeStore
+            The new store.
+        """
+        directory = os.fspath(directory)
+        os.makedirs(directory, exist_ok=True)
+        entries, columns, info = {}, None, ""
+
+        def _write(run: pd.DataFrame):
+            key = (float(run["logAge"].iloc[0]), float(run["MH"].iloc[0]))
+            entry = entries.setdefault(key, {"id": len(entries), "rows": 0, "bytes": 0, "files": []})
+            records = run.to_records(index=False)
+            name = f"node-{entry['id']:06d}-{len(entry['files'])}.npy"
+            buf = BytesIO()
+            np.save(buf, records, allow_pickle=False)
+            write_atomic(os.path.join(directory, name), buf.getvalue())
+            entry["rows"] += len(run)
+            entry["bytes"] += int(records.nbytes)
+            entry["files"].append(name)
+
+        # the last isochrone of a chunk may continue in the next one
+        pending = None
+        for chunk, info in _table_chunks(source, max(1, int(chunksize)), comment):
+            if columns is None:
+                columns = list(chunk.columns)
+                for name in NODE_KEYS:
+                    if name not in columns:
+                        raise KeyError(f"Column {name} is required.")
+            if pending is not None:
+                chunk = pd.concat([pending, chunk], ignore_index=True)
+            runs = list(_node_runs(chunk))
+            for run in runs[:-1]:
+                _write(run)
+            pending = runs[-1] if runs else None
+        if pending is not None:
+            _write(pending)
+        if columns is None:
+            raise ValueError("The grid has no isochrone.")
+
+        nodes = [
+            {"logAge": key[0], "MH": key[1], "rows": e["rows"], "bytes": e["bytes"], "files": e["files"]}
+            for key, e in sorted(entries.items())
+        ]
+        index = {"columns": columns, "comment": info, "nodes": nodes}
+        write_atomic(os.path.join(directory, INDEX_FILE), json.dumps(index).encode("utf-8"))
+        return cls(directory, **kwargs)
+
+    def __len__(self) -> int:
+        """The number of isochrones of the store"""
+        return len(self._files)
+
+    def __contains__(self, node: Node) -> bool:
+        """Whether the store has the isochrone of (logAge, MH)"""
+        return (float(node[0]), float(node[1])) in self._files
+
+    def __getstate__(self) -> dict:
+        """Only the location and settings of the store, without its cache"""
+        return {"directory": self.directory, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state: dict):
+        """Reopen the store from :meth:`__getstate__`"""
+        self.__init__(**state)
+
+    @property
+    def coords(self) -> dict:
+        """The sorted unique `logAge` and `MH` of the isochrones"""
+        return {key: np.unique(self.nodes[key].to_numpy()) for key in NODE_KEYS}
+
+    def _read(self, node: Node) -> pd.DataFrame:
+        """Read the isochrone of a node from disk"""
+        try:
+            files = self._files[node]
+        except KeyError:
+            raise KeyError(f"No isochrone at (logAge, MH) = {node} in the store.") from None
+        parts = [np.load(os.path.join(self.directory, name), allow_pickle=False) for name in files]
+        with self._lock:
+            self.misses += 1
+        return pd.DataFrame(parts[0] if len(parts) == 1 else np.concatenate(parts))
+
+    def load(self, logAge: float, MH: float) -> pd.DataFrame:
+        """
+        Return the isochrone of a node, from the cache or from disk.
+
+        Concurrent requests of the same node from several threads read it once.
+
+        Parameters
+        ----------
+        logAge, MH : float
+            The coordinates of the node.
+
+        Returns
+        -------
+        pd.DataFrame
+            The isochrone table, shared with the cache: it must not be modified.
+        """
+        node = (float(logAge), float(MH))
+        with self._lock:
+            table = self._cache.get(node)
+            if table is not None:
+                self._cache.move_to_end(node)
+                self.hits += 1
+                return table
+        table, shared = self._flight.do(node, self._read, node)
+        if not shared:
+            self._insert(node, table)
+        return table
+
+    def _insert(self, node: Node, table: pd.DataFrame):
+        """Cache a table, evicting the least recently used ones over `max_bytes`"""
+        with self._lock:
+            if node in self._cache:
+                return
+            self._cache[node] = table
+            self.nbytes += int(table.memory_usage(index=True).sum())
+            while self.nbytes > self.max_bytes and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self.nbytes -= int(evicted.memory_usage(index=True).sum())
+
+    def get(self, nodes: Iterable[Node]) -> pd.DataFrame:
+        """
+        Return the isochrones of several nodes.
+
+        Parameters
+        ----------
+        nodes : Iterable[tuple[float, float]]
+            The (logAge, MH) coordinates of the nodes.
+
+        Returns
+        -------
+        pd.DataFrame
+            The isochrones in the order of `nodes`, indexed by (logAge, MH) as
+            :attr:`ezpadova.interpolate.QuickInterpolator.data`.
+        """
+        tables = [self.load(*node) for node in nodes]
+        if not tables:
+            return pd.DataFrame(columns=self.columns).set_index(list(NODE_KEYS))
+        return pd.concat(tables, ignore_index=True).set_index(list(NODE_KEYS))
+
+    def clear(self):
+        """Empty the cache"""
+        with self._lock:
+            self._cache.clear()
+            self.nbytes = 0
@@ -1,26 +1,37 @@
 """Module for querying the CMD website and parsing the results."""
 
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import random
 import re
-import ssl
-import zlib
-from io import BufferedReader, BytesIO
-from typing import Tuple, Union
-from urllib.request import urlopen
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from io import BytesIO
+from typing import BinaryIO
 
-import pandas as pd
 import numpy as np
+import pandas as pd
 import requests
+import urllib3
+
+from . import cache, planner, ratelimit
+from .config import configuration, validate_query_parameter
+from .instrument import emit, request_scope, timed
+from .tools import SingleFlight, get_file_archive_type, open_decompressed, read_header
 
 # Disable SSL warnings when certificate verification is disabled
-try:
-    import urllib3
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-except ImportError:
-    pass
+logger = logging.getLogger(__name__)
 
-from .config import configuration, validate_query_parameter
-from .tools import get_file_archive_type
+# identical queries in flight at the same time share a single network round trip
+_inflight = SingleFlight()
 
 
 def build_query(**kwargs) -> dict:
@@ -54,46 +65,214 @@ def build_query(**kwargs) -> dict:
     return kw
 
 
+def normalize_query(**kwargs) -> dict:
+    """
+    Return the website query parameters in a canonical form.
+
+    The parameters are completed as by :func:`build_query`, sorted by name,
+    and every numerical value is written in the same way (e.g., `6`, `"6.0"`
+    and `"6e0"` are all normalized to `"6.0"`), so that identical queries
+    give identical dictionaries.
+
+    Parameters
+    ----------
+    kwargs : dict
+        Arbitrary keyword arguments passed to :func:`build_query`.
+
+    Returns
+    -------
+    dict
+        The normalized query parameters.
+    """
+
+    def _normalize(value) -> str:
+        try:
+            return repr(float(value))
+        except (TypeError, ValueError):
+            return str(value)
+
+    kw = build_query(**kwargs)
+    return {key: _normalize(kw[key]) for key in sorted(kw)}
+
+
+def query_key(**kwargs) -> str:
+    """
+    Return a string identifying a query (see :func:`normalize_query`).
+
+    Parameters
+    ----------
+    kwargs : dict
+        Arbitrary keyword arguments passed to :func:`build_query`.
+
+    Returns
+    -------
+    str
+        The JSON representation of the normalized query.
+    """
+    return json.dumps(normalize_query(**kwargs), sort_keys=True)
+
+
 def parse_result(
-    data: Union[str, bytes, BufferedReader], comment: str = "#"
+    data: str | bytes | BinaryIO, comment: str = "#"
 ) -> pd.DataFrame:
     """
     Parses the input data and returns a pandas DataFrame.
 
     Parameters:
-        data (str | bytes | BufferedReader): The input data to be parsed. It can be a string, bytes, or a BufferedReader object.
+        data (str | bytes | BinaryIO): The input data to be parsed: the text of the table, its bytes, or a binary stream (e.g., an open file).
+            Bytes and streams compressed with gzip, bzip2, or zip are decompressed on the fly (see :func:`ezpadova.tools.open_decompressed`).
         comment (str): The character used to denote comment lines in the input data. Default is '#'.
 
     Returns:
         pd.DataFrame: A pandas DataFrame containing the parsed data. The DataFrame will have an attribute 'comment' which contains the comment lines from the input data.
 
+    Raises:
+        ValueError: If the data does not start with a commented header line.
+
     .. note::
 
-        - If the input data is a BufferedReader, it will be read and decoded as 'utf-8'.
-        - The function assumes that the header line is the first non-comment line in the input data.
+        - Streams are read (and decompressed) incrementally, without holding the whole table in memory. They are not closed.
+        - The function assumes that the header line is the last line of the leading comment lines.
         - The DataFrame is created by reading the input data with pandas.read_csv, using whitespace as the delimiter.
         - The comment lines from the input data are stored in the 'comment' attribute of the DataFrame.
 
     """
 
-    if isinstance(data, BufferedReader):
-        data = data.read()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
 
-    split_txt = data.decode("utf-8").split("\n")
-    for num, line in enumerate(split_txt):
-        if line[0] != comment:
-            break
-    start = num - 1
-    header = split_txt[start].replace("#", "").strip().split()
-    df = pd.read_csv(
-        BytesIO(data), skiprows=start + 1, sep=r"\s+", names=header, comment="#"
-    )
-    df.attrs["comment"] = "\n".join(
-        k.replace("#", "").strip() for k in split_txt[:start]
-    )
+    with open_decompressed(data) as stream:
+        header, info = read_header(stream, comment)
+        df = pd.read_csv(stream, sep=r"\s+", names=header, comment=comment)
+    df.attrs["comment"] = info
     return df
 
 
+class _TransientError(RuntimeError):
+    """Error of a query step that may succeed if attempted again"""
+
+
+# errors triggering a retry of the failed query step
+_TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    urllib3.exceptions.HTTPError,
+    _TransientError,
+)
+
+# HTTP status codes of temporary server-side failures
+_TRANSIENT_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+def _with_retries(step: str, func: Callable, *args, **kwargs):
+    """
+    Call `func` and retry it on transient network errors.
+
+    Retries follow an exponential backoff with full jitter: the n-th retry
+    waits a random delay between 0 and
+    `min(backoff_max, backoff_factor * 2 ** n)` seconds.
+    The number of retries and backoff parameters are taken from
+    `configuration['network']`.
+
+    Args:
+        step (str): Name of the query step, for reporting.
+        func (Callable): The function to call.
+        *args, **kwargs: Arguments passed to `func`.
+
+    Returns:
+        The value returned by `func`.
+
+    Raises:
+        The last error raised by `func` once the retries are exhausted.
+    """
+    network = configuration["network"]
+    retries = int(network["retries"])
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except _TRANSIENT_ERRORS as error:
+            if attempt >= retries:
+                raise
+            delay = random.uniform(
+                0, min(float(network["backoff_max"]), float(network["backoff_factor"]) * 2**attempt)
+            )
+            logger.warning(
+                "%s failed (%s), retrying in %.1fs [%d/%d]", step, error, delay, attempt + 1, retries
+            )
+            emit("retry", delay, step=step, attempt=attempt + 1, error=repr(error))
+            time.sleep(delay)
+
+
+def _timeout() -> tuple[float, float]:
+    """Return the (connect, read) timeouts from `configuration['network']`"""
+    network = configuration["network"]
+    return float(network["connect_timeout"]), float(network["read_timeout"])
+
+
+def _throttle():
+    """Wait for a token of the host-wide rate limiter, if enabled"""
+    limiter = ratelimit.configured_limiter()
+    if limiter is not None:
+        delay = limiter.acquire()
+        if delay > 0:
+            emit("throttled", delay)
+
+
+def _submit(kw: dict) -> requests.Response:
+    """Submit the form and return the response page"""
+    _throttle()
+    with timed("submit") as info:
+        req = requests.post(
+            configuration["url"], params=kw, timeout=_timeout(), allow_redirects=True, verify=False
+        )
+        info.update(status_code=req.status_code, bytes=len(req.content))
+    emit("server_wait", req.elapsed.total_seconds())
+    if req.status_code in _TRANSIENT_STATUS:
+        raise _TransientError(f"Server Response is incorrect (HTTP {req.status_code})")
+    if req.status_code != 200:
+        raise RuntimeError("Server Response is incorrect")
+    return req
+
+
+def _download(data_url: str, buffer: bytearray):
+    """
+    Download `data_url` into `buffer`.
+
+    If the buffer already contains the beginning of the file (e.g., from a
+    previous interrupted attempt), only the remaining bytes are requested
+    through an HTTP Range request. The content is stored as transferred,
+    without any content-encoding decoding.
+    """
+    headers = {"Range": f"bytes={len(buffer)}-"} if buffer else {}
+    _throttle()
+    with timed("download", url=data_url, offset=len(buffer)) as info, requests.get(
+        data_url, headers=headers, stream=True, timeout=_timeout(), verify=False
+    ) as resp:
+        info["status_code"] = resp.status_code
+        if resp.status_code == 416 and buffer:
+            # nothing left to transfer
+            info["bytes"] = 0
+            return
+        if resp.status_code in _TRANSIENT_STATUS:
+            raise _TransientError(f"Download failed (HTTP {resp.status_code})")
+        if resp.status_code == 200:
+            # the server ignored the range request
+            buffer.clear()
+        elif resp.status_code != 206:
+            raise RuntimeError(f"Download failed (HTTP {resp.status_code})")
+        expected = resp.headers.get("Content-Length")
+        received = 0
+        for chunk in resp.raw.stream(1 << 16, decode_content=False):
+            buffer.extend(chunk)
+            received += len(chunk)
+        info["bytes"] = received
+        if expected is not None and received < int(expected):
+            raise _TransientError(
+                f"Incomplete download ({received} of {expected} bytes)"
+            )
+
+
 def query(**kwargs) -> bytes:
     """
     Query the CMD webpage with the given parameters.
@@ -103,6 +282,13 @@ def query(**kwargs) -> bytes:
     and returned as bytes. If the server response is incorrect or if there is
     an issue with the data retrieval, a RuntimeError is raised.
 
+    Transient network failures are retried step by step with exponential
+    backoff (see `configuration['network']`): a failed download does not
+    resubmit the form, and resumes a partial transfer where it stopped.
+
+    Progress is reported through the `ezpadova.parsec` logger and the timings
+    of each stage are emitted through :mod:`ezpadova.instrument`.
+
     Args:
         **kwargs: Arbitrary keyword arguments to be included in the query.
 
@@ -113,46 +299,49 @@ def query(**kwargs) -> bytes:
         RuntimeError: If the server response is incorrect or if there is an
                       issue with data retrieval.
     """
-    print(f"Querying {configuration['url']}...")
-    kw = build_query(**kwargs)
-    req = requests.post(
-        configuration["url"], params=kw, timeout=120, allow_redirects=True, verify=False
-    )
-    if req.status_code != 200:
-        raise RuntimeError("Server Response is incorrect")
-    else:
-        print("Retrieving data...")
-
-    fname = re.compile(r"output\d+").findall(req.text)
-    domain = "/".join(configuration["url"].split("/")[:3])
-    if len(fname) > 0:
-        data_url = f"{domain}/tmp/{fname[0]}.dat"
-        print(f"Downloading data...{data_url}")
-        # Create SSL context that doesn't verify certificates
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        bf = urlopen(data_url, context=ssl_context)
-        r = bf.read()
-        typ = get_file_archive_type(r, stream=True)
-        if typ is not None:
-            r = zlib.decompress(bytes(r), 15 + 32)
-        return r
-    else:
-        print("URL:" + configuration["url"] + req.request.path_url + "\n")
-        print(req.text)
-        raise RuntimeError("Server Response not expected. Error in data retrieval.")
+    limiter = ratelimit.configured_limiter()
+    with request_scope(), (nullcontext(0.0) if limiter is None else limiter.slot()) as waited:
+        if waited > 0:
+            emit("queued", waited)
+        logger.info("Querying %s...", configuration["url"])
+        kw = build_query(**kwargs)
+        req = _with_retries("submit", _submit, kw)
+        logger.info("Retrieving data...")
+
+        fname = re.compile(r"output\d+").findall(req.text)
+        domain = "/".join(configuration["url"].split("/")[:3])
+        if len(fname) > 0:
+            data_url = f"{domain}/tmp/{fname[0]}.dat"
+            logger.info("Downloading data...%s", data_url)
+            buffer = bytearray()
+            _with_retries("download", _download, data_url, buffer)
+            r = bytes(buffer)
+            typ = get_file_archive_type(r, stream=True)
+            if typ is not None:
+                with timed("decompress", format=typ, bytes_in=len(r)) as info:
+                    with open_decompressed(BytesIO(r)) as stream:
+                        r = stream.read()
+                    info["bytes"] = len(r)
+            return r
+        else:
+            logger.error(
+                "Server Response not expected.\nURL: %s\n%s",
+                configuration["url"] + req.request.path_url,
+                req.text,
+            )
+            raise RuntimeError("Server Response not expected. Error in data retrieval.")
 
 
 def get_isochrones(
-    age_yr: Union[Tuple[float, float, float], None] = None,
-    Z: Union[Tuple[float, float, float], None] = None,
-    logage: Union[Tuple[float, float, float], None] = None,
-    MH: Union[Tuple[float, float, float], None] = None,
+    age_yr: tuple[float, float, float] | None = None,
+    Z: tuple[float, float, float] | None = None,
+    logage: tuple[float, float, float] | None = None,
+    MH: tuple[float, float, float] | None = None,
     default_ranges: bool = False,
     return_df: bool = True,
+    use_cache: bool | None = None,
     **kwargs,
-) -> Union[pd.DataFrame, bytes]:
+) -> pd.DataFrame | bytes:
     """
     Retrieve isochrones based on specified parameters.
 
@@ -173,6 +362,9 @@ def get_isochrones(
             If True, use the default parameter ranges. Default is False.
         return_df (bool, optional):
             If True, return the result as a pandas DataFrame. If False, return the raw bytes. Default is True.
+        use_cache (bool | None, optional):
+            If True, look up and store the result in the local cache (see :mod:`ezpadova.cache`).
+            Default to `configuration['cache']['enabled']`.
         kwargs (dict):
             Additional keyword arguments to pass to the query.
 
@@ -181,8 +373,231 @@ def get_isochrones(
 
     Raises:
         ValueError: If the provided parameters are inconsistent or invalid.
+
+    .. note::
+
+        Concurrent calls with identical parameters (see :func:`normalize_query`)
+        share a single query and parsing. Each caller receives its own copy of
+        the resulting DataFrame.
+
+    .. note::
+
+        Any of `age_yr`, `Z`, `logage`, or `MH` can also be an arbitrary list
+        (or array) of nodes, e.g., `logage=[6.1, 6.3, 7.0, 8.2]`. The nodes are
+        decomposed into a few arithmetic ranges (see :func:`ezpadova.planner.decompose`),
+        queried concurrently, and only the requested nodes are returned,
+        sorted by age and metallicity. Sequences of 3 numbers are always
+        triplets: use a NumPy array for exactly 3 nodes.
+    """
+    if use_cache is None:
+        use_cache = bool(configuration["cache"]["enabled"])
+    if any(_is_node_list(param) for param in (age_yr, Z, logage, MH)):
+        if not return_df:
+            raise ValueError("Lists of nodes require return_df=True.")
+        return _get_node_isochrones(age_yr, Z, logage, MH, use_cache, **kwargs)
+    kw = _query_parameters(age_yr, Z, logage, MH, default_ranges, **kwargs)
+
+    with request_scope():
+        # concurrent identical requests are served by a single query
+        start = time.perf_counter()
+        res, shared = _inflight.do(
+            (query_key(**kw), return_df, use_cache), _fetch, kw, return_df, use_cache
+        )
+        if shared:
+            emit("coalesced", time.perf_counter() - start)
+        if return_df:
+            # each caller gets its own table, including the one that ran the
+            # query: the shared result is never handed out
+            res = res.copy()
+        return res
+
+
+def _is_node_list(param) -> bool:
+    """Whether an age or metallicity argument is a list of nodes rather than a triplet"""
+    if param is None or np.ndim(param) != 1:
+        return False
+    return isinstance(param, np.ndarray) or len(param) != 3
+
+
+def _node_queries(age_yr=None, Z=None, logage=None, MH=None, **kwargs) -> tuple:
+    """Decompose lists of nodes into validated range queries of :func:`get_isochrones`
+
+    Returns the names and nodes (None for triplets) of the age and metallicity
+    arguments, and the keyword arguments of each range query.
+    """
+    age_name, age = ("age_yr", age_yr) if age_yr is not None else ("logage", logage)
+    metal_name, metal = ("Z", Z) if Z is not None else ("MH", MH)
+    if age is None or metal is None:
+        raise ValueError("Either age_yr or logage, and either Z or MH must be provided.")
+    if age_yr is not None and logage is not None:
+        raise ValueError("Only one of age_yr or logage can be provided.")
+    if Z is not None and MH is not None:
+        raise ValueError("Only one of Z or MH can be provided.")
+
+    def _ranges(name, param):
+        if not _is_node_list(param):
+            return None, [tuple(param)]
+        nodes = np.unique(np.asarray(param, dtype=float))
+        if len(nodes) == 0:
+            raise ValueError(f"Parameter {name} has no nodes.")
+        resolution = None
+        if name in ("age_yr", "Z") and np.any(nodes != 0):
+            # linear ages and Z are compared relatively
+            resolution = 0.1 * cache.NODE_TOLERANCE * np.abs(nodes[nodes != 0]).min()
+        return nodes, planner.decompose(nodes, resolution=resolution)
+
+    age_nodes, age_ranges = _ranges(age_name, age)
+    metal_nodes, metal_ranges = _ranges(metal_name, metal)
+    specs = [
+        {age_name: age_range, metal_name: metal_range, **kwargs}
+        for age_range in age_ranges for metal_range in metal_ranges
+    ]
+    # validate everything before any network access
+    for spec in specs:
+        _query_parameters(**spec)
+    return age_name, age_nodes, metal_name, metal_nodes, specs
+
+
+def _spec_queries(spec: dict) -> list[dict]:
+    """Validated form parameters of the queries of a set of :func:`get_isochrones` arguments"""
+    if any(_is_node_list(spec.get(name)) for name in ("age_yr", "Z", "logage", "MH")):
+        return [_query_parameters(**query) for query in _node_queries(**spec)[-1]]
+    return [_query_parameters(**spec)]
+
+
+def _get_node_isochrones(age_yr, Z, logage, MH, use_cache: bool, **kwargs) -> pd.DataFrame:
+    """Retrieve the isochrones of lists of nodes with a few range queries"""
+    age_name, age_nodes, metal_name, metal_nodes, specs = _node_queries(age_yr, Z, logage, MH, **kwargs)
+    with ThreadPoolExecutor(max_workers=min(4, len(specs))) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, get_isochrones, use_cache=use_cache, **spec)
+            for spec in specs
+        ]
+        tables = [future.result() for future in futures]
+    data = pd.concat(tables, ignore_index=True)
+
+    metal_column = "Zini" if metal_name == "Z" else "MH"
+    ages = data["logAge"].to_numpy(dtype=float)
+    metals = data[metal_column].to_numpy(dtype=float)
+    selected = np.ones(len(data), dtype=bool)
+    if age_nodes is not None:
+        targets = age_nodes if age_name == "logage" else np.log10(age_nodes)
+        selected &= cache.match_nodes(ages, targets)
+    if metal_nodes is not None:
+        selected &= cache.match_nodes(metals, metal_nodes, relative=metal_name == "Z")
+    order = np.lexsort((np.arange(len(data)), metals, ages))
+    order = order[selected[order]]
+    result = data.iloc[order].reset_index(drop=True)
+    result.attrs = dict(tables[0].attrs)
+    return result
+
+
+def _photsys_name(photsys_file: str) -> str:
+    """Short name of a photometric system, e.g., `2mass` for `YBC_tab_mag_odfnew/tab_mag_2mass.dat`"""
+    match = re.search(r"tab_mag_(.+)\.dat$", photsys_file)
+    return match.group(1) if match else photsys_file
+
+
+def get_multi_isochrones(
+    photsys_files: Sequence[str],
+    workers: int | None = None,
+    **kwargs,
+) -> pd.DataFrame:
     """
+    Retrieve the same isochrones in several photometric systems.
+
+    The systems are queried concurrently (see :func:`get_isochrones`) with
+    otherwise identical parameters. The tables then share the same rows, and
+    are joined by position into a single wide table.
 
+    Parameters:
+        photsys_files (Sequence[str]): The photometric systems (`photsys_file` values).
+        workers (int | None, optional):
+            Maximum number of concurrent queries. Default to one per system.
+        kwargs (dict):
+            Arguments of :func:`get_isochrones` (except `photsys_file` and `return_df`).
+
+    Returns:
+        pd.DataFrame: The columns of the first table, followed by the
+        photometric columns of the other systems. Columns that appear in
+        several tables with different values (e.g., same band names in two
+        systems) are suffixed with `_<system>`.
+
+    Raises:
+        ValueError: If the tables do not have the same rows, i.e., different
+        numbers of rows or different (logAge, MH, Mini) values.
+    """
+    photsys_files = list(photsys_files)
+    if not photsys_files:
+        raise ValueError("At least one photometric system is required.")
+    if len(set(photsys_files)) != len(photsys_files):
+        raise ValueError("Photometric systems must be unique.")
+    for name in ("photsys_file", "return_df"):
+        if name in kwargs:
+            raise ValueError(f"{name} cannot be used with get_multi_isochrones.")
+    # fail early on invalid parameters, including lists of nodes
+    spec = {key: value for key, value in kwargs.items() if key != "use_cache"}
+    for photsys_file in photsys_files:
+        _spec_queries({**spec, "photsys_file": photsys_file})
+
+    with request_scope(), ThreadPoolExecutor(max_workers=workers or len(photsys_files)) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, get_isochrones,
+                        photsys_file=photsys_file, **kwargs)
+            for photsys_file in photsys_files
+        ]
+        tables = [future.result() for future in futures]
+
+    # positional alignment, verified on the grid coordinates
+    reference = tables[0]
+    for photsys_file, table in zip(photsys_files[1:], tables[1:]):
+        if len(table) != len(reference):
+            raise ValueError(
+                f"{photsys_file} returned {len(table)} rows instead of {len(reference)}."
+            )
+        for key in ("logAge", "MH", "Mini"):
+            if key in reference.columns and not np.allclose(
+                table[key].to_numpy(), reference[key].to_numpy(), rtol=1e-9, atol=0, equal_nan=True
+            ):
+                raise ValueError(f"{photsys_file} and {photsys_files[0]} rows differ in {key}.")
+
+    # columns present in several tables are kept once if identical, and
+    # suffixed with the system otherwise
+    owners = {}
+    for k, table in enumerate(tables):
+        for name in table.columns:
+            owners.setdefault(name, []).append(k)
+    identical = {
+        name: all(
+            tables[k][name].equals(tables[ks[0]][name]) for k in ks[1:]
+        )
+        for name, ks in owners.items()
+    }
+    columns = {}
+    for k, table in enumerate(tables):
+        for name in table.columns:
+            if identical[name]:
+                if owners[name][0] == k:
+                    columns[name] = table[name].to_numpy()
+            else:
+                columns[f"{name}_{_photsys_name(photsys_files[k])}"] = table[name].to_numpy()
+    return pd.DataFrame(columns)
+
+
+def _query_parameters(
+    age_yr: tuple[float, float, float] | None = None,
+    Z: tuple[float, float, float] | None = None,
+    logage: tuple[float, float, float] | None = None,
+    MH: tuple[float, float, float] | None = None,
+    default_ranges: bool = False,
+    **kwargs,
+) -> dict:
+    """
+    Translate the arguments of :func:`get_isochrones` into validated form parameters.
+
+    Raises:
+        ValueError: If the provided parameters are inconsistent or invalid.
+    """
     kw = configuration["defaults"].copy()
     kw.update(kwargs)
 
@@ -231,15 +646,269 @@ def get_isochrones(
 
     # check parameters validity
     validate_query_parameter(**kw)
+    return kw
 
-    # do the actual query
-    res = query(**kw)
+
+def _load_cached(meta: dict) -> pd.DataFrame | None:
+    """Read the table of a cache entry of the configured layout"""
+    if "columns" in meta:
+        return cache.get_table(meta["query"])
+    data = cache.get(meta["query"])
+    return None if data is None else parse_result(data)
+
+
+def _from_cached_grids(kw: dict, workers: int = 4) -> pd.DataFrame | None:
+    """Assemble the grid of a query from the cached grids sharing some of its nodes
+
+    Only the nodes that are not cached are queried, grouped into few requests
+    (see :func:`ezpadova.planner.plan_queries`) fetched concurrently. Returns
+    None if no node is cached.
+    """
+    query_params = normalize_query(**kw)
+    ages, metal_column, metals = cache.grid_nodes(query_params)
+    relative = metal_column == "Zini"
+    missing = np.ones((len(ages), len(metals)), dtype=bool)
+    parts = []
+    for meta in cache.related_grids(query_params):
+        if not (missing & meta["covered"]).any():
+            continue
+        table = _load_cached(meta)
+        if table is None or not {"logAge", metal_column} <= set(table.columns):
+            continue
+        # the nodes actually in the table, that are still needed
+        age_id = cache.node_index(table["logAge"].to_numpy(dtype=float), ages)
+        metal_id = cache.node_index(table[metal_column].to_numpy(dtype=float), metals, relative)
+        rows = (age_id >= 0) & (metal_id >= 0)
+        rows[rows] = missing[age_id[rows], metal_id[rows]]
+        if not rows.any():
+            continue
+        parts.append(table[rows])
+        missing[age_id[rows], metal_id[rows]] = False
+        if not missing.any():
+            break
+    if not parts:
+        return None
+
+    if missing.any():
+        queries = planner.plan_queries(kw, missing)
+        logger.info("fetching %d missing nodes in %d queries", missing.sum(), len(queries))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(queries)))) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, _fetch, query_kw, True, True)
+                for query_kw in queries
+            ]
+            parts.extend(future.result() for future in futures)
+
+    merged = pd.concat(parts, ignore_index=True)
+    order = np.lexsort((
+        np.arange(len(merged)),
+        merged[metal_column].to_numpy(dtype=float),
+        merged["logAge"].to_numpy(dtype=float),
+    ))
+    merged = merged.iloc[order].reset_index(drop=True)
+    merged.attrs = dict(parts[0].attrs)
+    return merged
+
+
+def _check_size(kw: dict) -> list[dict]:
+    """Apply `configuration['limits']` to a query before submitting it
+
+    Returns the parts of the query if it has to be split, otherwise an empty list.
+
+    Raises:
+        ValueError: If the query is too large and the limits action is `"raise"`.
+    """
+    max_isochrones = planner.max_isochrones_per_query()
+    if max_isochrones is None:
+        return []
+    estimate = planner.estimate_query(kw)
+    if estimate["isochrones"] <= max_isochrones:
+        return []
+    action = configuration["limits"].get("action", "split")
+    if action == "raise":
+        raise ValueError(
+            f"The query would compute {estimate['isochrones']} isochrones (~{estimate['rows']} rows, "
+            f"~{estimate['bytes'] / 1e6:.0f} MB), more than allowed by configuration['limits']."
+        )
+    if action != "split":
+        raise ValueError(f"Unknown limits action {action!r}, expecting 'split' or 'raise'.")
+    parts = planner.split_query(kw, max_isochrones)
+    logger.info("splitting a query of %d isochrones into %d parts", estimate["isochrones"], len(parts))
+    return parts
+
+
+def _join_outputs(outputs: list[bytes]) -> bytes:
+    """Concatenate CMD outputs, keeping the header of the first one only"""
+    lines = [outputs[0].rstrip(b"\n")]
+    for data in outputs[1:]:
+        lines.extend(line for line in data.split(b"\n") if line.strip() and not line.startswith(b"#"))
+    return b"\n".join(lines) + b"\n"
+
+
+def _fetch(kw: dict, return_df: bool, use_cache: bool = False) -> pd.DataFrame | bytes:
+    """Query the website (or the cache) and parse the result if requested"""
+    # the normalized layout stores parsed tables instead of the website outputs
+    normalized = use_cache and cache.layout() == "normalized"
+    if normalized and return_df:
+        with timed("cache_read") as info:
+            df = cache.get_table(normalize_query(**kw))
+            info.update(hit=df is not None, rows=0 if df is None else len(df))
+        if df is not None:
+            return df
+
+    res = None
+    if use_cache and not normalized:
+        with timed("cache_read") as info:
+            res = cache.get(normalize_query(**kw))
+            info.update(hit=res is not None, bytes=0 if res is None else len(res))
+
+    if res is None and use_cache and return_df:
+        with timed("cache_grids") as info:
+            df = _from_cached_grids(kw)
+            info.update(hit=df is not None, rows=0 if df is None else len(df))
+        if df is not None:
+            return df
+
+    split = False
+    if res is None:
+        parts = _check_size(kw)
+        if parts:
+            # too large: each part is fetched (and cached) on its own
+            with ThreadPoolExecutor(max_workers=min(4, len(parts))) as pool:
+                futures = [
+                    pool.submit(contextvars.copy_context().run, _fetch, part, False, use_cache)
+                    for part in parts
+                ]
+                res = _join_outputs([future.result() for future in futures])
+            split = True
+
+    if res is None:
+        # do the actual query
+        res = query(**kw)
+        if use_cache and not normalized:
+            with timed("cache_write", bytes=len(res)):
+                cache.put(normalize_query(**kw), res)
 
     # parse to dataframe if requested (default)
-    if return_df:
-        return parse_result(res)
-    else:
-        return res
+    if return_df or normalized:
+        with timed("parse", bytes=len(res)) as info:
+            df = parse_result(res)
+            info["rows"] = len(df)
+        if normalized and not split:
+            with timed("cache_write", rows=len(df)):
+                cache.put_table(normalize_query(**kw), df)
+        if return_df:
+            return df
+    return res
+
+
+def prefetch(
+    specs: Sequence[dict],
+    workers: int = 4,
+    progress: Callable[[dict], None] | None = None,
+    verify: bool = False,
+    wait: bool = True,
+) -> list[dict] | Future:
+    """
+    Fill the local cache with the isochrones of many queries.
+
+    All the queries are validated before any network access. Queries that
+    already have a valid cache entry are skipped, the others are fetched
+    concurrently with at most `workers` simultaneous queries.
+
+    Parameters:
+        specs (Sequence[dict]): The keyword arguments of :func:`get_isochrones`
+            for each query, e.g., `{"logage": (6, 10, 0.1), "MH": (0, 0, 0), "photsys_file": "gaiaEDR3"}`.
+            Lists of nodes are decomposed into the range queries :func:`get_isochrones` would run.
+        workers (int, optional): The maximum number of concurrent queries. Default is 4.
+        progress (Callable[[dict], None] | None, optional): Function called with the
+            report of each query once it completes (see below).
+        verify (bool, optional): If True, read existing cache entries entirely to check their
+            integrity before skipping them. Default is False.
+        wait (bool, optional): If False, run in the background and return a
+            :class:`concurrent.futures.Future` of the reports. Default is True.
+
+    Returns:
+        list[dict] | Future: The report of each range query, in the order of `specs`, with keys
+            `index`, `spec`, `status` (`"cached"`, `"fetched"`, or `"failed"`),
+            `seconds`, `error`, and `done` / `total` progress counts. The range
+            queries of a spec with lists of nodes each have a report with that spec.
+
+    Raises:
+        ValueError: If any of the queries is invalid.
+    """
+    # lists of nodes expand into several range queries that share their spec
+    expanded = [(dict(spec), _spec_queries(dict(spec))) for spec in specs]
+    specs = [spec for spec, queries in expanded for _ in queries]
+    queries = [query for _, queries in expanded for query in queries]
+
+    if not wait:
+        future = Future()
+        context = contextvars.copy_context()
+
+        def _background():
+            try:
+                future.set_result(context.run(_prefetch, specs, queries, workers, progress, verify))
+            except BaseException as error:  # noqa: BLE001 - raised by the future
+                future.set_exception(error)
+
+        threading.Thread(target=_background, name="ezpadova-prefetch", daemon=True).start()
+        return future
+    return _prefetch(specs, queries, workers, progress, verify)
+
+
+def _prefetch(
+    specs: list[dict],
+    queries: list[dict],
+    workers: int,
+    progress: Callable[[dict], None] | None,
+    verify: bool,
+) -> list[dict]:
+    """Run the queries of :func:`prefetch` that are not cached yet"""
+    total = len(specs)
+    reports = [None] * total
+    lock = threading.Lock()
+    done = 0
+
+    def _report(index: int, status: str, seconds: float, error: str | None = None):
+        nonlocal done
+        with lock:
+            done += 1
+            report = {"index": index, "spec": specs[index], "status": status, "seconds": seconds,
+                      "error": error, "done": done, "total": total}
+            reports[index] = report
+        logger.info("prefetch [%d/%d] %s %s", done, total, status, specs[index])
+        if progress is not None:
+            progress(report)
+
+    def _run(index: int):
+        start = time.perf_counter()
+        try:
+            _fetch(queries[index], return_df=False, use_cache=True)
+        except Exception as error:  # noqa: BLE001 - a failed query is reported, the others go on
+            logger.warning("prefetch of %s failed: %s", specs[index], error)
+            _report(index, "failed", time.perf_counter() - start, repr(error))
+        else:
+            _report(index, "fetched", time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        pending = {}
+        for index, kw in enumerate(queries):
+            if cache.contains(normalize_query(**kw), verify=verify):
+                _report(index, "cached", 0.0)
+                continue
+            # identical specs are only fetched once and share the same outcome
+            key = query_key(**kw)
+            if key in pending:
+                first, future = pending[key]
+                future.add_done_callback(
+                    lambda _, index=index, first=first: _report(
+                        index, reports[first]["status"], 0.0, reports[first]["error"]
+                    )
+                )
+                continue
+            pending[key] = index, pool.submit(contextvars.copy_context().run, _run, index)
+    return reports
 
 
 def resample_evolution_label(data: pd.DataFrame) -> pd.DataFrame:
@@ -0,0 +1,317 @@
+"""Planning of the CMD queries of (logAge, MH) isochrone grids.
+
+The CMD form only accepts arithmetic `(low, high, step)` ranges of ages and
+metallicities, and returns every node of the rectangle they span. When only
+some nodes of a grid are needed (e.g., those missing from the local cache),
+the planner groups them into few such rectangles that cover exactly the
+needed nodes.
+
+>>> missing = np.zeros((21, 5), dtype=bool)
+>>> missing[1::2] = True                 # a refinement of the age step
+>>> plan_rectangles(missing)
+[((1, 20, 2), (0, 5, 1))]
+
+Arbitrary lists of nodes are decomposed into arithmetic ranges that balance
+the number of isochrones computed by the server and the number of requests:
+
+>>> decompose([6.0, 6.1, 6.2, 6.3, 6.6, 8.0, 8.5])
+[(6.0, 6.6, 0.1), (8.0, 8.5, 0.5)]
+
+Queries are sized before submission (:func:`estimate_query`), and those
+exceeding `configuration['limits']` are refused or split
+(:func:`split_query`) by :func:`ezpadova.get_isochrones`.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from math import gcd
+
+import numpy as np
+
+from .cache import NODE_TOLERANCE, _arithmetic_nodes
+from .config import configuration
+
+#: cost of a request, in number of isochrones computed by the server
+REQUEST_COST = 5.0
+
+#: (low, high, step) form fields of the ages, by value of `isoc_isagelog`
+AGE_FIELDS = {
+    1: ("isoc_lagelow", "isoc_lageupp", "isoc_dlage"),
+    0: ("isoc_agelow", "isoc_ageupp", "isoc_dage"),
+}
+
+#: (low, high, step) form fields of the metallicities, by value of `isoc_ismetlog`
+METAL_FIELDS = {
+    1: ("isoc_metlow", "isoc_metupp", "isoc_dmet"),
+    0: ("isoc_zlow", "isoc_zupp", "isoc_dz"),
+}
+
+#: a run of indices `range(start, stop, stride)`
+Run = tuple[int, int, int]
+
+
+def index_runs(indices: Sequence[int]) -> list[Run]:
+    """
+    Split sorted indices into maximal arithmetic runs.
+
+    Parameters
+    ----------
+    indices : Sequence[int]
+        Sorted, unique indices.
+
+    Returns
+    -------
+    list[tuple[int, int, int]]
+        `(start, stop, stride)` runs such that the `range(start, stop, stride)`
+        partition the indices. Single indices have a stride of 1.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    runs, first = [], 0
+    while first < len(indices):
+        last = first + 1
+        if last < len(indices):
+            stride = indices[last] - indices[first]
+            while last + 1 < len(indices) and indices[last + 1] - indices[last] == stride:
+                last += 1
+            last += 1
+        else:
+            stride = 1
+        runs.append((int(indices[first]), int(indices[last - 1]) + 1, int(stride)))
+        first = last
+    return runs
+
+
+def plan_rectangles(missing: np.ndarray) -> list[tuple[Run, Run]]:
+    """
+    Cover the needed nodes of a grid with few arithmetic rectangles.
+
+    Metallicities that need the same ages are grouped, then the ages and the
+    metallicities of each group are split into arithmetic runs.
+
+    Parameters
+    ----------
+    missing : np.ndarray
+        Boolean array of shape (n_ages, n_metals) of the needed nodes.
+
+    Returns
+    -------
+    list[tuple[tuple[int, int, int], tuple[int, int, int]]]
+        `(age_run, metal_run)` index runs (see :func:`index_runs`) whose
+        products cover each needed node exactly once, and no other node.
+    """
+    missing = np.asarray(missing, dtype=bool)
+    patterns = {}
+    for metal in np.flatnonzero(missing.any(axis=0)):
+        patterns.setdefault(missing[:, metal].tobytes(), []).append(metal)
+    rectangles = []
+    for metals in patterns.values():
+        ages = np.flatnonzero(missing[:, metals[0]])
+        rectangles.extend(
+            (age_run, metal_run) for metal_run in index_runs(metals) for age_run in index_runs(ages)
+        )
+    return rectangles
+
+
+def decompose(
+    values: Sequence[float],
+    request_cost: float = REQUEST_COST,
+    resolution: float | None = None,
+) -> list[tuple[float, float, float]]:
+    """
+    Cover arbitrary nodes with arithmetic ranges at a minimal cost.
+
+    The cost of a set of ranges is the total number of their nodes (including
+    the nodes that were not requested) plus `request_cost` per range. The
+    optimum over the ranges covering contiguous groups of the sorted values is
+    found by dynamic programming.
+
+    Parameters
+    ----------
+    values : Sequence[float]
+        The requested nodes.
+    request_cost : float
+        Cost of a range, in number of nodes.
+    resolution : float, optional
+        Precision of the values: the steps are multiples of it. Default to a
+        tenth of :data:`ezpadova.cache.NODE_TOLERANCE`.
+
+    Returns
+    -------
+    list[tuple[float, float, float]]
+        Sorted `(low, high, step)` ranges, with a step of 0 for single nodes.
+        Every value is a node of exactly one range.
+    """
+    values = np.unique(np.asarray(values, dtype=float))
+    if len(values) == 0:
+        raise ValueError("At least one node is required.")
+    resolution = 0.1 * NODE_TOLERANCE if resolution is None else float(resolution)
+    if resolution <= 0:
+        raise ValueError("resolution must be positive.")
+    units = np.round((values - values[0]) / resolution).astype(np.int64).tolist()
+
+    n = len(values)
+    best = [0.0] + [np.inf] * n
+    choice = [(0, 0)] * (n + 1)
+    for first in range(n):
+        step = 0
+        for last in range(first, n):
+            if last > first:
+                step = gcd(step, units[last] - units[last - 1])
+            nodes = (units[last] - units[first]) // step + 1 if step else 1
+            # longer ranges have at least as many nodes: stop when they cost
+            # more than requesting all the remaining values one by one
+            if nodes + request_cost > (n - first) * (1 + request_cost):
+                break
+            cost = best[first] + nodes + request_cost
+            if cost < best[last + 1]:
+                best[last + 1] = cost
+                choice[last + 1] = (first, step)
+
+    ranges, last = [], n
+    while last > 0:
+        first, step = choice[last]
+        ranges.append((_clean(values[first]), _clean(values[last - 1]), _clean(step * resolution)))
+        last = first
+    return ranges[::-1]
+
+
+def _clean(value: float) -> float:
+    """Remove the floating point noise of range bounds computed from nodes"""
+    return float(f"{value:.12g}")
+
+
+def grid_axes(kw: dict) -> tuple:
+    """
+    Return the form fields and nodes of the ages and metallicities of a query.
+
+    Parameters
+    ----------
+    kw : dict
+        The website query parameters (see :func:`ezpadova.parsec.build_query`).
+
+    Returns
+    -------
+    tuple
+        `(age_fields, ages, metal_fields, metals)`, the nodes being in the
+        units of the form fields (linear or logarithmic).
+    """
+    age_fields = AGE_FIELDS[int(float(kw["isoc_isagelog"]))]
+    metal_fields = METAL_FIELDS[int(float(kw["isoc_ismetlog"]))]
+    ages = _arithmetic_nodes(*(kw[field] for field in age_fields))
+    metals = _arithmetic_nodes(*(kw[field] for field in metal_fields))
+    return age_fields, ages, metal_fields, metals
+
+
+def plan_queries(kw: dict, missing: np.ndarray) -> list[dict]:
+    """
+    Build the queries of the needed nodes of the grid of a query.
+
+    Parameters
+    ----------
+    kw : dict
+        The website query parameters of the whole grid.
+    missing : np.ndarray
+        Boolean array of shape (n_ages, n_metals) of the needed nodes.
+
+    Returns
+    -------
+    list[dict]
+        The website query parameters of each request, see :func:`plan_rectangles`.
+    """
+    _age_fields, ages, _metal_fields, metals = grid_axes(kw)
+    if missing.shape != (len(ages), len(metals)):
+        raise ValueError(f"Expecting a mask of shape {(len(ages), len(metals))}, got {missing.shape}.")
+    return _rectangle_queries(kw, plan_rectangles(missing))
+
+
+def _rectangle_queries(kw: dict, rectangles: list[tuple[Run, Run]]) -> list[dict]:
+    """The website query parameters of (age_run, metal_run) rectangles of the grid of a query"""
+    age_fields, ages, metal_fields, metals = grid_axes(kw)
+
+    def _range(nodes, run):
+        start, stop, stride = run
+        last = start + (stop - 1 - start) // stride * stride
+        step = nodes[start + stride] - nodes[start] if last > start else 0.0
+        return _clean(nodes[start]), _clean(nodes[last]), _clean(step)
+
+    queries = []
+    for age_run, metal_run in rectangles:
+        query = dict(kw)
+        query.update(zip(age_fields, _range(ages, age_run)))
+        query.update(zip(metal_fields, _range(metals, metal_run)))
+        queries.append(query)
+    return queries
+
+
+def estimate_query(kw: dict) -> dict:
+    """
+    Predict the size of the output of a query before submitting it.
+
+    The number of isochrones follows from the grid ranges; the rows and bytes
+    use the typical `rows_per_isochrone` and `bytes_per_row` of
+    `configuration['limits']`.
+
+    Parameters
+    ----------
+    kw : dict
+        The (normalized) website query parameters.
+
+    Returns
+    -------
+    dict
+        The predicted number of `isochrones`, `rows`, and `bytes`.
+    """
+    _, ages, _, metals = grid_axes(kw)
+    limits = configuration["limits"]
+    isochrones = len(ages) * len(metals)
+    rows = isochrones * int(limits["rows_per_isochrone"])
+    return {"isochrones": isochrones, "rows": rows, "bytes": rows * int(limits["bytes_per_row"])}
+
+
+def max_isochrones_per_query() -> int | None:
+    """The largest number of isochrones of a query allowed by `configuration['limits']`"""
+    limits = configuration["limits"]
+    per_isochrone = {
+        "max_isochrones": 1,
+        "max_rows": int(limits["rows_per_isochrone"]),
+        "max_bytes": int(limits["rows_per_isochrone"]) * int(limits["bytes_per_row"]),
+    }
+    allowed = [int(limits[key]) // size for key, size in per_isochrone.items() if limits.get(key) is not None]
+    return max(1, min(allowed)) if allowed else None
+
+
+def split_query(kw: dict, max_isochrones: int) -> list[dict]:
+    """
+    Split the grid of a query into queries of at most `max_isochrones` isochrones.
+
+    The ages are split into contiguous blocks spanning all the metallicities,
+    or into single ages and blocks of metallicities if a single age has too
+    many metallicities.
+
+    Parameters
+    ----------
+    kw : dict
+        The website query parameters.
+    max_isochrones : int
+        The maximum number of isochrones of each query.
+
+    Returns
+    -------
+    list[dict]
+        The website query parameters of each part, in the order of the grid.
+    """
+    _, ages, _, metals = grid_axes(kw)
+    max_isochrones = max(1, int(max_isochrones))
+    if len(metals) <= max_isochrones:
+        block = max_isochrones // len(metals)
+        rectangles = [
+            ((start, min(start + block, len(ages)), 1), (0, len(metals), 1))
+            for start in range(0, len(ages), block)
+        ]
+    else:
+        rectangles = [
+            ((age, age + 1, 1), (start, min(start + max_isochrones, len(metals)), 1))
+            for age in range(len(ages)) for start in range(0, len(metals), max_isochrones)
+        ]
+    return _rectangle_queries(kw, rectangles)
@@ -0,0 +1,312 @@
+"""Synthetic stellar populations from PARSEC isochrone tables.
+
+The CMD tables list, for each isochrone, the initial mass `Mini` and the
+cumulative integral of the IMF by number `int_IMF` (normalized to 1 Msun of
+initially born stars). The difference of `int_IMF` between two rows is the
+number of stars per unit of formed mass in between, which makes the
+isochrones directly usable to draw stars without any server round trip.
+
+>>> iso = get_isochrones(logage=(8, 9, 0.5), MH=(0, 0, 0), photsys_file="gaiaEDR3")
+>>> stars = sample_stars(iso, total_mass=1e4, columns=["Gmag", "G_BPmag", "G_RPmag"], seed=42)
+>>> lf = luminosity_function(iso, bands=["Gmag"], maginf=-5, magsup=15, deltamag=0.1)
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .config import configuration
+from .tools import NODE_KEYS
+
+
+def _group_isochrones(isochrones: pd.DataFrame) -> tuple:
+    """Group the rows of a table by isochrone.
+
+    Returns
+    -------
+    data : pd.DataFrame
+        The table sorted by isochrone, keeping the order of the rows within each.
+    starts, stops : np.ndarray
+        The row ranges of each isochrone in `data`.
+    node_id : np.ndarray
+        The isochrone index of each row of `data`.
+    nodes : pd.DataFrame
+        The (logAge, MH) coordinates of each isochrone.
+    """
+    for name in NODE_KEYS:
+        if name not in isochrones.columns:
+            raise KeyError(f"Column {name} is required.")
+    data = isochrones.sort_values(list(NODE_KEYS), kind="stable")
+    coords = data[list(NODE_KEYS)].to_numpy(dtype=float)
+    new_node = np.r_[True, np.any(coords[1:] != coords[:-1], axis=1)]
+    starts = np.flatnonzero(new_node)
+    stops = np.r_[starts[1:], len(data)]
+    nodes = pd.DataFrame(coords[starts], columns=list(NODE_KEYS))
+    node_id = np.cumsum(new_node) - 1
+    return data, starts, stops, node_id, nodes
+
+
+class _IsochroneCDF:
+    """Inverse cumulative distribution of the IMF along a set of isochrones.
+
+    All the isochrones are concatenated into a single increasing array
+    `node + F(row)`, where `F` is the normalized cumulative IMF of the row
+    within its isochrone, so that the stars of every isochrone are located
+    with a single `np.searchsorted` call.
+    """
+
+    def __init__(self, isochrones: pd.DataFrame, columns: Sequence[str]):
+        for name in ("Mini", "int_IMF"):
+            if name not in isochrones.columns:
+                raise KeyError(f"Column {name} is required to sample stars.")
+        data, self.starts, self.stops, node_id, self.nodes = _group_isochrones(isochrones)
+
+        int_imf = data["int_IMF"].to_numpy(dtype=float)
+        first = int_imf[self.starts]
+        #: number of (living) stars per unit of formed mass of each isochrone
+        self.weights = int_imf[self.stops - 1] - first
+        width = np.where(self.weights > 0, self.weights, 1.0)
+        frac = np.clip((int_imf - first[node_id]) / width[node_id], 0.0, 1.0)
+        # enforce monotonicity against rounding noise in the tables
+        self.cdf = np.maximum.accumulate(node_id + frac)
+
+        self.columns = list(columns)
+        self.values = data[self.columns].to_numpy(dtype=float)
+        self.label = data["label"].to_numpy() if "label" in data.columns else None
+
+    def draw(self, node: np.ndarray, u: np.ndarray) -> dict:
+        """Return the interpolated columns of stars at quantiles `u` of isochrones `node`"""
+        target = node + u
+        idx = np.searchsorted(self.cdf, target, side="right") - 1
+        idx = np.clip(idx, self.starts[node], np.maximum(self.starts[node], self.stops[node] - 2))
+        nxt = np.minimum(idx + 1, self.stops[node] - 1)
+        delta = self.cdf[nxt] - self.cdf[idx]
+        t = np.where(delta > 0, (target - self.cdf[idx]) / np.where(delta > 0, delta, 1.0), 0.0)
+        lo = self.values[idx]
+        values = lo + t[:, None] * (self.values[nxt] - lo)
+        out = {key: self.nodes[key].to_numpy()[node] for key in NODE_KEYS}
+        out.update(zip(self.columns, values.T))
+        if self.label is not None:
+            out["label"] = self.label[idx]
+        return out
+
+
+def _seed_sequence(seed: int | np.random.SeedSequence | None) -> np.random.SeedSequence:
+    """Return the root seed sequence of a sampling"""
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def iter_sample_stars(
+    isochrones: pd.DataFrame,
+    n_stars: int | Sequence[int] | None = None,
+    total_mass: float | Sequence[float] | None = None,
+    columns: Sequence[str] | None = None,
+    seed: int | np.random.SeedSequence | None = None,
+    chunk_size: int = 10_000_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Draw stars from isochrones, by chunks.
+
+    Stars are drawn by inverse transform sampling of the IMF, using the
+    `int_IMF` column of each isochrone, and all the requested columns are
+    linearly interpolated between the two bracketing rows. Only living stars
+    are drawn, i.e., between the first and last rows of each isochrone.
+
+    Each chunk uses its own random stream derived from `seed` and the chunk
+    number, so that a sampling is reproducible for a given `seed` and
+    `chunk_size`, and chunks can be generated independently.
+
+    Parameters
+    ----------
+    isochrones : pd.DataFrame
+        Isochrone table(s) with at least `logAge`, `MH`, `Mini`, and `int_IMF`
+        columns, e.g., from :func:`ezpadova.parsec.get_isochrones`.
+    n_stars : int | Sequence[int], optional
+        Number of stars to draw per isochrone (or for each isochrone in the
+        order of sorted (logAge, MH)).
+    total_mass : float | Sequence[float], optional
+        Total initial mass of the population of each isochrone, in Msun.
+        The number of living stars is drawn from a Poisson distribution.
+        Exactly one of `n_stars` and `total_mass` must be given.
+    columns : Sequence[str], optional
+        Columns to interpolate. Default to all the numerical columns except
+        the isochrone coordinates and `label`.
+    seed : int | np.random.SeedSequence, optional
+        Seed of the random streams.
+    chunk_size : int
+        Maximum number of stars per chunk.
+
+    Yields
+    ------
+    pd.DataFrame
+        Chunks of stars with `logAge`, `MH`, `label` (of the lower bracketing
+        row, if available), and the requested columns.
+    """
+    if (n_stars is None) == (total_mass is None):
+        raise ValueError("Exactly one of n_stars or total_mass must be provided.")
+    if columns is None:
+        columns = [
+            name
+            for name in isochrones.select_dtypes("number").columns
+            if name not in (*NODE_KEYS, "label")
+        ]
+    elif "Mini" not in columns:
+        columns = ["Mini", *columns]
+    cdf = _IsochroneCDF(isochrones, columns)
+    n_nodes = len(cdf.starts)
+    root = _seed_sequence(seed)
+
+    if n_stars is not None:
+        counts = np.broadcast_to(np.asarray(n_stars, dtype=np.int64), (n_nodes,))
+    else:
+        expected = np.asarray(total_mass, dtype=float) * cdf.weights
+        stream = np.random.SeedSequence(root.entropy, spawn_key=(*root.spawn_key, 0))
+        counts = np.random.default_rng(stream).poisson(expected)
+    # isochrones without any mass range cannot host stars
+    counts = np.where(cdf.weights > 0, counts, 0)
+    offsets = np.cumsum(counts)
+    total = int(offsets[-1]) if n_nodes else 0
+
+    for chunk, start in enumerate(range(0, total, int(chunk_size))):
+        stop = min(start + int(chunk_size), total)
+        stream = np.random.SeedSequence(root.entropy, spawn_key=(*root.spawn_key, 1, chunk))
+        rng = np.random.default_rng(stream)
+        node = np.searchsorted(offsets, np.arange(start, stop), side="right")
+        yield pd.DataFrame(cdf.draw(node, rng.random(stop - start)))
+
+
+def sample_stars(
+    isochrones: pd.DataFrame,
+    n_stars: int | Sequence[int] | None = None,
+    total_mass: float | Sequence[float] | None = None,
+    columns: Sequence[str] | None = None,
+    seed: int | np.random.SeedSequence | None = None,
+    chunk_size: int = 10_000_000,
+) -> pd.DataFrame:
+    """
+    Draw stars from isochrones.
+
+    This is the in-memory version of :func:`iter_sample_stars`, which
+    describes the parameters. Prefer the latter for samples that do not fit
+    in memory (e.g., 10^8 stars).
+
+    Returns
+    -------
+    pd.DataFrame
+        The stars with `logAge`, `MH`, `label` (if available), and the requested columns.
+    """
+    chunks = list(iter_sample_stars(isochrones, n_stars, total_mass, columns, seed, chunk_size))
+    if not chunks:
+        return pd.DataFrame(columns=[*NODE_KEYS, *(columns or [])])
+    return pd.concat(chunks, ignore_index=True)
+
+
+def luminosity_function(
+    isochrones: pd.DataFrame,
+    bands: Sequence[str] | None = None,
+    maginf: float | None = None,
+    magsup: float | None = None,
+    deltamag: float | None = None,
+    total_mass: float = 1.0,
+) -> pd.DataFrame:
+    """
+    Compute the luminosity functions of isochrones.
+
+    This is the local equivalent of the luminosity functions of the CMD
+    website (`output_kind=1`): each interval between two consecutive rows of
+    an isochrone contributes its number of stars, the difference of
+    `int_IMF`. Stars are spread uniformly in magnitude over the interval,
+    consistently with the linear interpolation of :func:`sample_stars`, so the
+    result does not depend on the sampling of the isochrones relative to the
+    bins. All isochrones and bands are binned at once with `np.bincount`.
+
+    Parameters
+    ----------
+    isochrones : pd.DataFrame
+        Isochrone table(s) with at least `logAge`, `MH`, `int_IMF`, and the
+        magnitude columns.
+    bands : Sequence[str], optional
+        Magnitude columns. Default to all columns ending with `mag`.
+    maginf, magsup, deltamag : float, optional
+        Bright and faint limits of the bins and the bin width. Default to the
+        `lf_maginf`, `lf_magsup`, and `lf_deltamag` values of
+        `configuration['defaults']`.
+    total_mass : float
+        Total initial mass of the population in Msun. The default gives the
+        number of stars per unit of formed mass.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per isochrone and magnitude bin with the `logAge`, `MH`, and
+        `mag` (bin center) columns followed by the number of stars in each band.
+    """
+    defaults = configuration["defaults"]
+    maginf = float(defaults["lf_maginf"] if maginf is None else maginf)
+    magsup = float(defaults["lf_magsup"] if magsup is None else magsup)
+    deltamag = float(defaults["lf_deltamag"] if deltamag is None else deltamag)
+    if deltamag <= 0 or magsup <= maginf:
+        raise ValueError("Magnitude bins must have maginf < magsup and deltamag > 0.")
+    if "int_IMF" not in isochrones.columns:
+        raise KeyError("Column int_IMF is required to compute luminosity functions.")
+    if bands is None:
+        bands = [name for name in isochrones.columns if name.endswith("mag")]
+    bands = list(bands)
+
+    data, _starts, _stops, node_id, nodes = _group_isochrones(isochrones)
+    n_nodes, n_bands = len(nodes), len(bands)
+    n_bins = int(np.ceil((magsup - maginf) / deltamag - 1e-9))
+
+    # intervals between consecutive rows of the same isochrone
+    same = node_id[1:] == node_id[:-1]
+    int_imf = data["int_IMF"].to_numpy(dtype=float)
+    weights = np.clip(np.diff(int_imf)[same], 0.0, None) * total_mass
+    mags = data[bands].to_numpy(dtype=float)
+    lo = np.minimum(mags[1:], mags[:-1])[same]
+    hi = np.maximum(mags[1:], mags[:-1])[same]
+    group = np.arange(n_bands)[None, :] * n_nodes + node_id[1:][same][:, None]
+    weights = np.broadcast_to(weights[:, None], lo.shape)
+    finite = np.isfinite(lo) & np.isfinite(hi)
+    n_groups = n_bands * n_nodes
+
+    # The cumulative counts G(m) are piecewise linear, with slope changes of
+    # +w/(hi-lo) at lo and -w/(hi-lo) at hi. At each bin edge e, G(e) is the
+    # sum of slope * (e - m) over the changes at m < e, which only needs the
+    # cumulative sums of slope and slope * m sorted into the edge intervals.
+    edges = maginf + deltamag * np.arange(n_bins + 1)
+    flat = finite & (hi - lo > 1e-9 * deltamag)
+    slope = weights[flat] / (hi - lo)[flat]
+    kinks = np.concatenate([lo[flat], hi[flat]])
+    slopes = np.concatenate([slope, -slope])
+    slot = np.clip(np.floor((kinks - maginf) / deltamag) + 1, 0, n_bins + 1).astype(np.int64)
+    index = np.concatenate([group[flat], group[flat]]) * (n_bins + 2) + slot
+    size = n_groups * (n_bins + 2)
+    S = np.bincount(index, weights=slopes, minlength=size).reshape(n_groups, n_bins + 2)
+    P = np.bincount(index, weights=slopes * kinks, minlength=size).reshape(n_groups, n_bins + 2)
+    S = np.cumsum(S, axis=1)[:, : n_bins + 1]
+    P = np.cumsum(P, axis=1)[:, : n_bins + 1]
+    counts = np.clip(np.diff(edges * S - P, axis=1), 0.0, None)
+
+    # (nearly) constant magnitude: all the stars fall in a single bin
+    point = finite & ~flat
+    bins = np.floor((lo[point] - maginf) / deltamag).astype(np.int64)
+    valid = (bins >= 0) & (bins < n_bins)
+    counts += np.bincount(
+        group[point][valid] * n_bins + bins[valid],
+        weights=weights[point][valid],
+        minlength=n_groups * n_bins,
+    ).reshape(n_groups, n_bins)
+    counts = counts.reshape(n_bands, n_nodes * n_bins)
+
+    result = pd.DataFrame({
+        key: np.repeat(nodes[key].to_numpy(), n_bins) for key in NODE_KEYS
+    })
+    result["mag"] = np.tile(maginf + deltamag * (np.arange(n_bins) + 0.5), n_nodes)
+    for k, band in enumerate(bands):
+        result[band] = counts[k]
+    return result
@@ -0,0 +1,212 @@
+"""Host-wide rate limiting of the requests to the CMD website.
+
+Independent processes on the same host (e.g., the workers of a batch system)
+each query the CMD website on their own. :class:`HostRateLimiter` shares a
+token bucket and a set of job slots between all of them through files in a
+common directory, locked with `fcntl.flock` (or `msvcrt.locking` on Windows):
+
+* every HTTP request takes a token from the bucket, which refills at
+  `requests_per_second` up to `burst` tokens;
+* every query (form submission and download) holds one of `max_concurrent`
+  slots for its whole duration.
+
+Locks are released by the operating system when a process dies, so crashed
+workers never hold a slot. The limiter is configured through
+`configuration['rate_limit']` and used by :func:`ezpadova.parsec.query`:
+
+>>> from ezpadova.config import configuration
+>>> configuration["rate_limit"].update(enabled=True, requests_per_second=0.5, max_concurrent=4)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import time
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+
+from .config import configuration
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock(f, blocking: bool = True) -> bool:
+    """Lock an open file, return False if it is already locked and not `blocking`"""
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    while True:  # pragma: no cover - Windows
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.01)
+
+
+def _unlock(f):
+    """Release the lock of an open file"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:  # pragma: no cover - Windows
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class HostRateLimiter:
+    """Token bucket and concurrency slots shared by all the processes of a host.
+
+    Attributes
+    ----------
+    directory : str
+        The directory of the shared state and lock files.
+    requests_per_second : float | None
+        The refill rate of the bucket, None for no rate limit.
+    burst : int
+        The capacity of the bucket.
+    max_concurrent : int | None
+        The number of slots, None for no concurrency limit.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        requests_per_second: float | None = 1.0,
+        burst: int = 1,
+        max_concurrent: int | None = None,
+    ):
+        """
+        Set up a limiter sharing its state through `directory`.
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the shared files, created if needed. All the
+            processes using the same directory share the same limits.
+        requests_per_second : float | None
+            Maximum sustained rate of requests, None for no limit.
+        burst : int
+            Maximum number of requests sent at once after an idle period.
+        max_concurrent : int | None
+            Maximum number of concurrent jobs, None for no limit.
+        """
+        if requests_per_second is not None and requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive.")
+        if burst < 1:
+            raise ValueError("burst must be at least 1.")
+        if max_concurrent is not None and max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1.")
+        self.directory = os.path.expanduser(directory)
+        self.requests_per_second = requests_per_second
+        self.burst = int(burst)
+        self.max_concurrent = max_concurrent
+        os.makedirs(self.directory, exist_ok=True)
+        self._bucket = os.path.join(self.directory, "bucket.json")
+
+    def acquire(self) -> float:
+        """
+        Take a token from the shared bucket, waiting for it if needed.
+
+        Tokens are reserved in order: a request arriving when the bucket is
+        empty takes a future token and sleeps until it is due, so waiting
+        requests are served first come, first served and at the full rate.
+
+        Returns
+        -------
+        float
+            The time waited, in seconds.
+        """
+        if self.requests_per_second is None:
+            return 0.0
+        with open(self._bucket, "a+") as f:
+            _lock(f)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                    tokens, updated = float(state["tokens"]), float(state["updated"])
+                except (ValueError, KeyError, TypeError):
+                    tokens, updated = float(self.burst), 0.0
+                now = time.time()
+                tokens = min(float(self.burst), tokens + max(0.0, now - updated) * self.requests_per_second)
+                tokens -= 1.0
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "updated": now}))
+                f.flush()
+            finally:
+                _unlock(f)
+        delay = max(0.0, -tokens / self.requests_per_second)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    @contextmanager
+    def slot(self) -> Iterator[float]:
+        """
+        Hold one of the shared job slots.
+
+        Yields
+        ------
+        float
+            The time waited for the slot, in seconds.
+        """
+        if self.max_concurrent is None:
+            yield 0.0
+            return
+        start = time.perf_counter()
+        paths = [os.path.join(self.directory, f"slot-{k}.lock") for k in range(self.max_concurrent)]
+        pause = 0.01
+        while True:
+            # try the slots in a random order to spread the contention
+            for path in random.sample(paths, len(paths)):
+                with ExitStack() as stack:
+                    f = stack.enter_context(open(path, "a+"))
+                    if _lock(f, blocking=False):
+                        # the file stays open as long as the slot is held
+                        held = stack.pop_all()
+                        break
+            else:
+                time.sleep(pause * random.uniform(0.5, 1.5))
+                pause = min(2 * pause, 0.25)
+                continue
+            break
+        with held:
+            try:
+                yield time.perf_counter() - start
+            finally:
+                _unlock(f)
+
+
+def configured_limiter() -> HostRateLimiter | None:
+    """
+    Return the limiter described by `configuration['rate_limit']`.
+
+    Returns
+    -------
+    HostRateLimiter | None
+        The limiter, or None if rate limiting is disabled.
+    """
+    settings = configuration["rate_limit"]
+    if not settings.get("enabled"):
+        return None
+    directory = settings.get("directory") or os.path.join(
+        os.path.expanduser(configuration["cache"]["directory"]), "rate-limit"
+    )
+    return HostRateLimiter(
+        directory,
+        requests_per_second=settings.get("requests_per_second"),
+        burst=int(settings.get("burst", 1)),
+        max_concurrent=settings.get("max_concurrent"),
+    )
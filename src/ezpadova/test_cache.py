@@ -0,0 +1,218 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from . import cache
+from .cli import _write_output, main
+from .config import configuration
+from .parsec import _query_parameters, get_isochrones, normalize_query, prefetch
+from .testing import FakeCMDServer
+
+
+@pytest.fixture(autouse=True)
+def enabled_cache(monkeypatch):
+    """The cache is opt-in: enable it for these tests"""
+    monkeypatch.setitem(configuration["cache"], "enabled", True)
+
+
+def test_cache_disabled_by_default(isolated_cache, monkeypatch):
+    monkeypatch.undo()
+    monkeypatch.setitem(configuration["cache"], "directory", str(isolated_cache))
+    assert configuration["cache"]["enabled"] is False
+    with FakeCMDServer() as server:
+        get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0))
+        get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0))
+    assert len(server.queries) == 2
+    assert not os.path.exists(isolated_cache)
+
+
+def test_cache_roundtrip(isolated_cache, monkeypatch):
+    query = normalize_query(isoc_lagelow=6)
+    assert cache.get(query) is None
+    assert not cache.contains(query)
+
+    cache.put(query, b"some table")
+    assert cache.get(query) == b"some table"
+    assert cache.contains(query, verify=True)
+    assert [meta["query"] for meta in cache.entries()] == [query]
+
+    # expired entries are ignored
+    monkeypatch.setitem(configuration["cache"], "max_age", -1)
+    assert cache.get(query) is None
+    monkeypatch.setitem(configuration["cache"], "max_age", None)
+
+    # corrupted entries are ignored
+    data_path = os.path.join(isolated_cache, cache.entry_name(query) + ".dat.gz")
+    with open(data_path, "r+b") as f:
+        f.truncate(10)
+    assert cache.contains(query)
+    assert not cache.contains(query, verify=True)
+
+    cache.clear()
+    assert list(cache.entries()) == []
+
+
+def test_get_isochrones_cache():
+    with FakeCMDServer() as server:
+        first = get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0))
+        second = get_isochrones(logage=(6.0, 7, 0.5), MH=(0, 0, 0))
+        get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0), use_cache=False)
+    assert len(server.queries) == 2
+    assert first.equals(second)
+
+
+def test_prefetch():
+    specs = [
+        {"logage": (6, 7, 0.5), "MH": (0, 0, 0)},
+        {"logage": (6, 7, 0.5), "MH": (-1, -1, 0)},
+        {"logage": (6, 7, 0.5), "MH": (0, 0, 0)},
+    ]
+    reports = []
+    with FakeCMDServer() as server:
+        result = prefetch(specs, workers=2, progress=reports.append)
+        assert [r["status"] for r in result] == ["fetched", "fetched", "fetched"]
+        assert len(server.queries) == 2
+        assert sorted(r["done"] for r in reports) == [1, 2, 3]
+
+        # everything is cached now
+        future = prefetch(specs, wait=False)
+        assert [r["status"] for r in future.result()] == ["cached"] * 3
+        get_isochrones(logage=(6, 7, 0.5), MH=(-1, -1, 0))
+        assert len(server.queries) == 2
+
+
+def test_prefetch_node_lists():
+    spec = {"logage": [6.0, 6.5, 8.0, 9.5], "MH": [0.0]}
+    with FakeCMDServer() as server:
+        reports = prefetch([spec])
+        assert len(reports) == len(server.queries)
+        assert all(r["status"] == "fetched" and r["spec"] == spec for r in reports)
+        assert [r["status"] for r in prefetch([spec])] == ["cached"] * len(reports)
+        df = get_isochrones(**spec)
+        assert len(server.queries) == len(reports)
+    assert sorted(set(df["logAge"])) == [6.0, 6.5, 8.0, 9.5]
+
+
+def test_cli_prefetch(tmp_path, capsys):
+    spec_file = tmp_path / "specs.json"
+    # the specifications of `download` are accepted, with their job names
+    spec_file.write_text(json.dumps([{"name": "solar", "logage": [6, 7, 0.5], "MH": [0, 0, 0]}]))
+    with FakeCMDServer() as server:
+        assert main(["prefetch", str(spec_file), "--workers", "2"]) == 0
+    assert len(server.queries) == 1 and "name" not in server.queries[0]
+    assert "fetched" in capsys.readouterr().out
+
+
+def test_normalized_layout(isolated_cache, monkeypatch):
+    monkeypatch.setitem(configuration["cache"], "layout", "normalized")
+    systems = ["gaiaEDR3", "2mass", "ubvrijhk"]
+    with FakeCMDServer() as server:
+        tables = [get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0), photsys_file=s) for s in systems]
+        cached = [get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0), photsys_file=s) for s in systems]
+    assert len(server.queries) == len(systems)
+    for table, again in zip(tables, cached):
+        pd.testing.assert_frame_equal(table, again)
+        assert again.attrs["comment"] == table.attrs["comment"]
+
+    # one physical block shared by all the photometric systems
+    assert len(list(isolated_cache.glob("phys-*.npz"))) == 1
+    assert len(list(isolated_cache.glob("mags-*.npz"))) == len(systems)
+    assert len(list(cache.entries())) == len(systems)
+    query = normalize_query(**_query_parameters(logage=(6, 7, 0.5), MH=(0, 0, 0), photsys_file="2mass"))
+    assert cache.contains(query, verify=True)
+
+    # a rewritten physical block invalidates the groups that do not match it
+    other = tables[0].copy()
+    other["logL"] += 1.0
+    first = normalize_query(**_query_parameters(logage=(6, 7, 0.5), MH=(0, 0, 0), photsys_file="gaiaEDR3"))
+    cache.put_table(first, other)
+    pd.testing.assert_frame_equal(cache.get_table(first), other)
+    assert cache.get_table(query) is None
+    assert not cache.contains(query, verify=True)
+
+    cache.clear()
+    assert list(isolated_cache.iterdir()) == []
+
+
+def test_subgrid_from_cached_superset():
+    grid = {"logage": (6, 10, 0.25), "MH": (-2, 0.3, 0.1)}
+    with FakeCMDServer() as server:
+        get_isochrones(**grid)
+        subgrid = get_isochrones(logage=(8, 9, 0.5), MH=(-1, 0, 0.2))
+        assert len(server.queries) == 1
+        expected = get_isochrones(logage=(8, 9, 0.5), MH=(-1, 0, 0.2), use_cache=False)
+        pd.testing.assert_frame_equal(subgrid, expected)
+
+        # other parameters
+        get_isochrones(logage=(8, 9, 0.5), MH=(-1, 0, 0.2), photsys_file="2mass")
+        assert len(server.queries) == 3
+
+
+def test_subgrid_from_other_layout(monkeypatch):
+    with FakeCMDServer() as server:
+        get_isochrones(logage=(6, 10, 0.25), MH=(-2, 0.3, 0.1))
+        # the raw entry is not reused by the normalized layout
+        monkeypatch.setitem(configuration["cache"], "layout", "normalized")
+        get_isochrones(logage=(8, 9, 0.5), MH=(-1, 0, 0.2))
+        assert len(server.queries) == 2
+        get_isochrones(logage=(8, 8, 0), MH=(0, 0, 0))
+        assert len(server.queries) == 2
+
+
+def test_extend_cached_grid():
+    with FakeCMDServer() as server:
+        get_isochrones(logage=(6, 7, 0.2), MH=(-1, 0, 0.5))
+        # finer ages and a wider metallicity range
+        extended = get_isochrones(logage=(6, 7, 0.1), MH=(-1, 0.5, 0.5))
+        # the refined ages of the cached metallicities, and the new metallicity
+        ranges = sorted(
+            tuple(q[key] for key in ("isoc_lagelow", "isoc_lageupp", "isoc_dlage", "isoc_metlow", "isoc_metupp"))
+            for q in server.queries[1:]
+        )
+        assert ranges == [("6.0", "7.0", "0.1", "0.5", "0.5"), ("6.1", "6.9", "0.2", "-1.0", "0.0")]
+        expected = get_isochrones(logage=(6, 7, 0.1), MH=(-1, 0.5, 0.5), use_cache=False)
+        pd.testing.assert_frame_equal(extended, expected)
+
+
+def test_cli_download(tmp_path, capsys):
+    spec_file = tmp_path / "specs.json"
+    spec_file.write_text(json.dumps([
+        {"name": "solar", "logage": [6, 7, 0.5], "MH": [0, 0, 0]},
+        {"logage": [6, 7, 0.5], "MH": [-1, -1, 0]},
+    ]))
+    output = tmp_path / "grids"
+    with FakeCMDServer() as server:
+        assert main(["download", str(spec_file), "-o", str(output), "--dry-run"]) == 0
+        assert not output.exists()
+        assert "2 of 2 jobs to download, 6 isochrones" in capsys.readouterr().out
+
+        assert main(["download", str(spec_file), "-o", str(output), "-j", "2"]) == 0
+        assert len(server.queries) == 2
+        assert sorted(p.name for p in output.iterdir()) == ["job-0001.csv", "progress.jsonl", "solar.csv"]
+        table = pd.read_csv(output / "solar.csv")
+        assert set(table.MH) == {0.0}
+        assert "seconds per job" in capsys.readouterr().out
+
+        # completed jobs are skipped, removed outputs are downloaded again
+        os.remove(output / "solar.csv")
+        assert main(["download", str(spec_file), "-o", str(output), "--cache-dir", str(tmp_path / "empty")]) == 0
+        assert len(server.queries) == 3
+        assert "1 downloaded, 1 skipped" in capsys.readouterr().out
+
+    # invalid specifications are all reported before any download
+    spec_file.write_text(json.dumps([{"logage": [6, 7, 0.5], "MH": [0, 0, 0], "photsys_file": "none"}, {"MH": [0, 0, 0]}]))
+    assert main(["download", str(spec_file), "-o", str(output)]) == 2
+    assert capsys.readouterr().err.count("invalid") == 2
+
+    # lists of nodes are only available as parsed tables
+    spec_file.write_text(json.dumps([{"logage": [6, 6.5, 7, 8], "MH": [0, 0, 0]}]))
+    assert main(["download", str(spec_file), "-o", str(output), "--format", "raw"]) == 2
+    assert "raw format" in capsys.readouterr().err
+    assert main(["download", str(spec_file), "-o", str(output), "--dry-run"]) == 0
+
+    # failed writes leave no partial file
+    with pytest.raises(TypeError):
+        _write_output("not bytes", str(output / "failed.dat"), "raw")
+    assert not (output / "failed.dat.part").exists()
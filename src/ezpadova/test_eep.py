@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from .eep import EEPGrid
+from .parsec import resample_evolution_label
+from .testing import make_isochrone_grid
+
+
+@pytest.fixture(scope="module")
+def grid():
+    return make_isochrone_grid(logage=[7, 7.5, 8], MH=[-1, 0], rows_per_isochrone=120)
+
+
+def test_eep_resampling(grid):
+    eep = EEPGrid(grid, points_per_label=20, columns=["Mini", "Vmag", "logTe"])
+    labels = np.unique(grid.label)
+    assert eep.values.shape == (3, 2, 20 * len(labels), 3)
+    assert eep["Vmag"].shape == (3, 2, 20 * len(labels))
+
+    # same as interpolating along the evolution coordinate of each phase
+    evol = resample_evolution_label(grid.copy())
+    for (logAge, MH), iso in evol.groupby(["logAge", "MH"]):
+        i, j = np.searchsorted(eep.logAge, logAge), np.searchsorted(eep.MH, MH)
+        for label in labels:
+            sub = iso[iso.label == label]
+            points = (eep.eep >= label) & (eep.eep < label + 1)
+            expected = np.interp(eep.eep[points], sub.evol, sub.Vmag)
+            np.testing.assert_allclose(eep["Vmag"][i, j, points], expected)
+
+    # phases can have different resolutions, missing ones are NaN
+    eep = EEPGrid(grid, points_per_label={0: 10, 1: 5})
+    assert len(eep.eep) == 15 and "label" not in eep.columns
+
+
+def test_eep_interpolation(grid):
+    eep = EEPGrid(grid, points_per_label=20)
+    np.testing.assert_allclose(eep.interpolate(7.5, 0), eep.values[1, 1])
+    expected = 0.25 * (eep.values[0, 0] + eep.values[0, 1] + eep.values[1, 0] + eep.values[1, 1])
+    np.testing.assert_allclose(eep.interpolate(7.25, -0.5), expected)
+    # vectorized and clipped to the grid
+    res = eep.interpolate([7.25, 9.0], [-0.5, 1.0], columns=["Vmag"])
+    assert res.shape == (2, len(eep.eep), 1)
+    np.testing.assert_allclose(res[1, :, 0], eep["Vmag"][-1, -1])
+
+    iso = eep(7.25, -0.5, what=["Vmag", "Kmag"])
+    assert list(iso.columns) == ["Vmag", "Kmag", "logAge", "MH", "evol"]
+    np.testing.assert_allclose(iso.Vmag, expected[:, eep.columns.index("Vmag")])
+
+    table = eep.to_frame()
+    assert len(table) == 3 * 2 * len(eep.eep)
+    np.testing.assert_allclose(table.Vmag, eep["Vmag"].ravel())
+
+
+def test_eep_xarray(grid):
+    pytest.importorskip("xarray")
+    cube = EEPGrid(grid, points_per_label=10).to_xarray()
+    assert cube.dims == ("logAge", "MH", "eep", "column")
+
+
+def test_eep_interpolation_at_nodes(grid):
+    # only the oldest isochrones have the last phase
+    last = grid.label.max()
+    partial = grid[(grid.label < last) | (grid.logAge == 8)]
+    eep = EEPGrid(partial, points_per_label=10)
+    phases = (eep.eep >= last) & (eep.eep < last + 1)
+    assert np.all(np.isnan(eep.values[1, :, phases]))
+
+    # at a node or clipped to it, the phases of the other bracketing nodes do not matter
+    for logAge in (8.0, 9.0):
+        iso = eep(logAge, 0.0, what=["Vmag"])
+        assert set(np.floor(iso.evol).astype(int)) == set(np.unique(grid.label))
+        np.testing.assert_allclose(iso.Vmag, eep["Vmag"][-1, -1])
+    # between nodes, the phases missing from any bracketing isochrone are dropped
+    assert np.floor(eep(7.9, 0.0).evol).max() == last - 1
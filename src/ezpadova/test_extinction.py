@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from . import extinction
+from .extinction import (
+    apply_extinction,
+    extinction_coefficients,
+    get_reddened_isochrones,
+    magnitude_columns,
+)
+from .parsec import get_isochrones
+from .testing import EXTINCTION_COEFFICIENTS, FakeCMDServer
+
+
+@pytest.fixture(autouse=True)
+def forget_coefficients(monkeypatch):
+    monkeypatch.setattr(extinction, "_coefficients", {})
+
+
+def test_extinction_coefficients():
+    with FakeCMDServer() as server:
+        coeffs = extinction_coefficients(photsys_file="ubvrijhk")
+        assert len(server.queries) == 2
+        assert [q["extinction_av"] for q in server.queries] == ["0.0", "1.0"]
+        # kept in memory, per photometric system
+        assert extinction_coefficients(photsys_file="ubvrijhk").equals(coeffs)
+        assert len(server.queries) == 2
+        extinction_coefficients(photsys_file="2mass")
+        assert len(server.queries) == 4
+
+    assert list(coeffs.index) == list(EXTINCTION_COEFFICIENTS)
+    np.testing.assert_allclose(coeffs, list(EXTINCTION_COEFFICIENTS.values()), atol=1e-3)
+
+
+def test_apply_extinction():
+    with FakeCMDServer():
+        iso = get_isochrones(logage=(7, 8, 0.5), MH=(0, 0, 0))
+        expected = get_isochrones(logage=(7, 8, 0.5), MH=(0, 0, 0), extinction_av=2.0)
+
+    av = [0.0, 0.5, 2.0]
+    res = apply_extinction(iso, av, EXTINCTION_COEFFICIENTS)
+    assert len(res) == 3 * len(iso)
+    assert list(res.columns) == ["Av", *iso.columns]
+    np.testing.assert_array_equal(res.Av, np.repeat(av, len(iso)))
+
+    bands = magnitude_columns(iso)
+    assert "mbolmag" not in bands
+    last = res[res.Av == 2.0].reset_index(drop=True)
+    np.testing.assert_allclose(last[bands], expected[bands], atol=1e-4)
+    np.testing.assert_array_equal(last.mbolmag, iso.mbolmag)
+    np.testing.assert_allclose(res[res.Av == 0.0][bands], iso[bands])
+
+    with pytest.raises(ValueError):
+        apply_extinction(iso, [[1.0]], EXTINCTION_COEFFICIENTS)
+
+
+def test_get_reddened_isochrones():
+    with FakeCMDServer() as server:
+        res = get_reddened_isochrones([0.0, 1.0, 3.0], logage=(7, 8, 0.5), MH=(0, 0, 0),
+                                      photsys_file="ubvrijhk", extinction_av=5.0)
+        assert {q["extinction_av"] for q in server.queries} == {"0.0", "1.0"}
+    assert res.Av.unique().tolist() == [0.0, 1.0, 3.0]
+    assert res.groupby("Av").size().nunique() == 1
+
+    # the coefficients are those of the same models
+    with FakeCMDServer() as server:
+        get_reddened_isochrones(1.0, logage=(7, 8, 0.5), MH=(0, 0, 0), dust_sourceM="sil")
+        assert len(server.queries) == 3 and {q["dust_sourceM"] for q in server.queries} == {"sil"}
+        get_reddened_isochrones(1.0, logage=(7, 8, 0.5), MH=(0, 0, 0), dust_sourceM="nodustM")
+        assert len(server.queries) == 6
+        get_reddened_isochrones(1.0, logage=(7, 8, 0.5), MH=(0, 0, 0), dust_sourceM="sil", use_cache=False)
+        assert len(server.queries) == 7
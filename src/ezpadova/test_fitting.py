@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from .fitting import grid_likelihood
+from .interpolate import QuickInterpolator
+from .population import sample_stars
+from .testing import EXTINCTION_COEFFICIENTS, make_isochrone_grid
+
+
+@pytest.fixture(scope="module")
+def cluster():
+    grid = make_isochrone_grid(logage=[7.5, 8, 8.5], MH=[-0.5, 0], rows_per_isochrone=150)
+    iso = grid[(grid.logAge == 8) & (grid.MH == 0)]
+    stars = sample_stars(iso, n_stars=300, columns=["Vmag", "Bmag"], seed=3)
+    rng = np.random.default_rng(4)
+    av, mu = 0.5, 10.0
+    catalog = pd.DataFrame({
+        "Vmag": stars.Vmag + mu + av * EXTINCTION_COEFFICIENTS["Vmag"] + rng.normal(0, 0.05, 300),
+        "Bmag": stars.Bmag + mu + av * EXTINCTION_COEFFICIENTS["Bmag"] + rng.normal(0, 0.05, 300),
+    })
+    return grid, catalog
+
+
+def _brute_force(grid, points, sigma, mu, av, columns):
+    """Direct evaluation of the likelihood of one isochrone"""
+    shift = np.array([mu + av * EXTINCTION_COEFFICIENTS["Vmag"],
+                      av * (EXTINCTION_COEFFICIENTS["Bmag"] - EXTINCTION_COEFFICIENTS["Vmag"])])
+    model = np.column_stack([grid.Vmag, grid.Bmag - grid.Vmag]) + shift
+    imf = grid.int_IMF.to_numpy()
+    w = np.zeros(len(imf))
+    w[:-1] += 0.5 * np.diff(imf)
+    w[1:] += 0.5 * np.diff(imf)
+    w /= w.sum()
+    total = 0.0
+    for x in points:
+        dens = np.exp(-0.5 * np.sum(((x - model) / sigma) ** 2, axis=1)) / (2 * np.pi * sigma**2)
+        # points with missing values do not contribute
+        total += np.log(np.nansum(w * dens))
+    return total
+
+
+def test_grid_likelihood(cluster):
+    grid, catalog = cluster
+    columns = ["Vmag", ("Bmag", "Vmag")]
+    mu, av = [9.5, 10.0, 10.5], [0.0, 0.5, 1.0]
+    res = grid_likelihood(grid, catalog, columns, errors=0.07, distance_modulus=mu, av=av,
+                          coefficients=EXTINCTION_COEFFICIENTS)
+    assert len(res) == 6 * 9
+    assert list(res.columns) == ["logAge", "MH", "distance_modulus", "Av", "loglike", "posterior"]
+    np.testing.assert_allclose(res.posterior.sum(), 1.0)
+    best = res.loc[res.loglike.idxmax()]
+    assert (best.logAge, best.MH, best.distance_modulus, best.Av) == (8.0, 0.0, 10.0, 0.5)
+
+    # same as a direct evaluation
+    points = np.column_stack([catalog.Vmag, catalog.Bmag - catalog.Vmag])
+    iso = grid[(grid.logAge == 7.5) & (grid.MH == -0.5)]
+    row = res[(res.logAge == 7.5) & (res.MH == -0.5) & (res.distance_modulus == 10) & (res.Av == 1)]
+    np.testing.assert_allclose(row.loglike, _brute_force(iso, points, 0.07, 10, 1, columns))
+
+    # independent of the chunking and parallelism
+    small = grid_likelihood(grid, catalog, columns, errors=0.07, distance_modulus=mu, av=av,
+                            coefficients=EXTINCTION_COEFFICIENTS, max_elements=300 * 200,
+                            workers=2)
+    np.testing.assert_allclose(small.loglike, res.loglike)
+
+
+def test_grid_likelihood_options(cluster):
+    grid, catalog = cluster
+    columns = ["Vmag", ("Bmag", "Vmag")]
+    kwargs = {"distance_modulus": np.arange(9.5, 11, 0.25), "av": 0.5,
+              "coefficients": EXTINCTION_COEFFICIENTS}
+    res = grid_likelihood(grid, catalog, columns, **kwargs)
+    interp = grid_likelihood(QuickInterpolator(grid), catalog, columns, **kwargs)
+    pd.testing.assert_frame_equal(interp, res)
+
+    # missing values, per-star errors, and field stars
+    catalog = catalog.copy()
+    catalog.loc[:10, "Bmag"] = np.nan
+    errors = np.full((len(catalog), 2), 0.07)
+    res = grid_likelihood(grid, catalog, columns, errors=errors, outlier_fraction=0.1, **kwargs)
+    assert np.isfinite(res.loglike).all()
+    assert res.loc[res.loglike.idxmax(), "distance_modulus"] == 10.0
+
+    # isochrones with missing values: the points are ignored, and isochrones
+    # without any point cannot produce the cluster
+    partial = grid.copy()
+    partial.loc[(partial.logAge == 7.5) & (partial.MH == -0.5), "Bmag"] = np.nan
+    half = np.flatnonzero((partial.logAge == 8).to_numpy() & (partial.MH == 0).to_numpy())[::2]
+    partial.loc[partial.index[half], "Vmag"] = np.nan
+    for fraction in (0.0, 0.1):
+        res = grid_likelihood(partial, catalog, columns, outlier_fraction=fraction, **kwargs)
+        empty = (res.logAge == 7.5) & (res.MH == -0.5)
+        assert np.isneginf(res.loglike[empty]).all() and (res.posterior[empty] == 0).all()
+        assert np.isfinite(res.loglike[~empty]).all()
+    points = np.column_stack([catalog.Vmag, catalog.Bmag - catalog.Vmag])[11:]
+    res = grid_likelihood(partial, catalog.iloc[11:], columns, errors=0.07, distance_modulus=10.0, av=0.5,
+                          coefficients=EXTINCTION_COEFFICIENTS)
+    iso = partial[(partial.logAge == 8) & (partial.MH == 0)]
+    np.testing.assert_allclose(res[(res.logAge == 8) & (res.MH == 0)].loglike,
+                               _brute_force(iso, points, 0.07, 10.0, 0.5, columns))
+
+    with pytest.raises(ValueError, match="coefficients"):
+        grid_likelihood(grid, catalog, ["Vmag"], av=[0, 1])
+    with pytest.raises(ValueError, match="errors"):
+        grid_likelihood(grid, catalog, ["Vmag"], errors=0)
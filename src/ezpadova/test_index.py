@@ -0,0 +1,72 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .index import CMDIndex
+from .testing import make_isochrone_grid
+
+
+@pytest.fixture(scope="module")
+def grid():
+    return make_isochrone_grid(logage=[7, 8, 9], MH=[-1, 0], rows_per_isochrone=200)
+
+
+def _brute_force(index, points):
+    return np.sqrt(((points[:, None, :] - index.tree.data[None, :, :]) ** 2).sum(axis=2))
+
+
+def test_nearest(grid):
+    index = CMDIndex(grid, ["Vmag", ("Bmag", "Vmag")], extra_columns=["logTe"])
+    assert index.names == ["Vmag", "Bmag-Vmag"]
+
+    rng = np.random.default_rng(0)
+    stars = grid.sample(500, random_state=1)
+    catalog = pd.DataFrame({
+        "Vmag": stars.Vmag + rng.normal(0, 0.05, 500),
+        "Bmag": stars.Bmag + rng.normal(0, 0.05, 500),
+    })
+
+    res = index.nearest(catalog)
+    assert len(res) == 500
+    assert list(res.columns) == ["star", "distance", "row", "node", "logAge", "MH",
+                                 "Mini", "label", "logTe"]
+    brute = _brute_force(index, index.coordinates(catalog))
+    np.testing.assert_allclose(res.distance, brute.min(axis=1))
+
+    # matched grid node and values are consistent
+    matched = index.data.iloc[res.row]
+    np.testing.assert_array_equal(res.Mini, matched.Mini)
+    np.testing.assert_array_equal(res.logAge, index.nodes.logAge.to_numpy()[res.node])
+
+    # colors can also be given directly, k > 1 and max_distance
+    res2 = index.nearest(catalog.assign(**{"Bmag-Vmag": catalog.Bmag - catalog.Vmag})
+                         .drop(columns="Bmag"), k=3, max_distance=0.1)
+    assert len(res2) == 1500
+    unmatched = ~np.isfinite(res2.distance)
+    assert (res2.row[unmatched] == -1).all() and res2.Mini[unmatched].isna().all()
+    assert (res2.distance[~unmatched] <= 0.1).all()
+
+
+def test_within_and_per_node(grid):
+    index = CMDIndex(grid, ["Vmag", ("Bmag", "Vmag")], scale=[0.1, 0.05])
+    points = np.array([[0.0, 0.5], [5.0, 0.6], [100.0, 0.0]])
+    brute = _brute_force(index, points / index.scale)
+
+    res = index.within(points, radius=2.0)
+    for k in range(3):
+        expected = np.flatnonzero(brute[k] <= 2.0)
+        np.testing.assert_array_equal(res.row[res.star == k], expected)
+    np.testing.assert_allclose(res.distance, brute[res.star, res.row])
+
+    distance, row = index.nearest_per_node(points)
+    assert distance.shape == row.shape == (3, len(index.nodes))
+    node = index.data.node.to_numpy()
+    for j in range(len(index.nodes)):
+        np.testing.assert_allclose(distance[:, j], brute[:, node == j].min(axis=1))
+        assert (node[row[:, j]] == j).all()
+
+    # reusable after pickling
+    clone = pickle.loads(pickle.dumps(index))
+    pd.testing.assert_frame_equal(clone.within(points, radius=2.0), res)
@@ -0,0 +1,140 @@
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .interpolate import QuickInterpolator, SharedInterpolatorPool
+from .testing import make_isochrone_grid
+
+
+@pytest.fixture(scope="module")
+def interpolator():
+    grid = make_isochrone_grid(logage=[7, 7.5, 8], MH=[-1, -0.5, 0], rows_per_isochrone=100)
+    return QuickInterpolator(grid)
+
+
+def test_shared_interpolator_pool(interpolator):
+    points = [(7.2, -0.8), (7.9, -0.1), (7.5, -0.5), (7.1, -0.3), (7.6, -0.9)]
+    with SharedInterpolatorPool(interpolator, workers=2) as pool:
+        name = pool._shm.name
+        results = pool.map(points, what=["Vmag", "Kmag"], batch_size=2)
+        assert pool.map([]) == []
+    assert len(results) == len(points)
+    for (logAge, MH), res in zip(points, results):
+        pd.testing.assert_frame_equal(res, interpolator(logAge, MH, what=["Vmag", "Kmag"]))
+
+    # the shared memory is released
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_pickle(interpolator):
+    for kwargs in ({}, {"protocol": 5}):
+        clone = pickle.loads(pickle.dumps(interpolator, **kwargs))
+        pd.testing.assert_frame_equal(clone.data, interpolator.data)
+
+    # out-of-band buffers
+    buffers = []
+    payload = pickle.dumps(interpolator, protocol=5, buffer_callback=buffers.append)
+    assert len(payload) < 10_000 and len(buffers) >= len(interpolator.data.columns)
+    clone = pickle.loads(payload, buffers=buffers)
+    pd.testing.assert_frame_equal(clone.data, interpolator.data)
+    assert clone.ndim == interpolator.ndim
+    pd.testing.assert_frame_equal(clone(7.2, -0.8, what=["Vmag"]), interpolator(7.2, -0.8, what=["Vmag"]))
+
+
+def test_interpolate_stars(interpolator):
+    grid = interpolator.data.reset_index()
+    rng = np.random.default_rng(0)
+    n = 2000
+    logAge = rng.uniform(6.8, 8.2, n)
+    MH = rng.uniform(-1.2, 0.2, n)
+    Mini = rng.uniform(0.05, 5, n)
+    res = interpolator.interpolate_stars(Mini, logAge, MH, what=["Vmag", "logTe", "label"])
+    assert list(res.columns) == ["Vmag", "logTe", "label"] and len(res) == n
+
+    # bilinear combination of the interpolation in Mini along each isochrone
+    coords = interpolator.coords
+    for k in range(0, n, 97):
+        a = np.clip(logAge[k], coords["logAge"][0], coords["logAge"][-1])
+        m = np.clip(MH[k], coords["MH"][0], coords["MH"][-1])
+        a0, a1 = interpolator._bracket(a, coords["logAge"])
+        m0, m1 = interpolator._bracket(m, coords["MH"])
+        wa = 0 if a1 == a0 else (a - a0) / (a1 - a0)
+        wm = 0 if m1 == m0 else (m - m0) / (m1 - m0)
+        expected, alive = 0.0, True
+        for age, mh, w in ((a0, m0, (1 - wa) * (1 - wm)), (a0, m1, (1 - wa) * wm),
+                           (a1, m0, wa * (1 - wm)), (a1, m1, wa * wm)):
+            iso = grid[(grid.logAge == age) & (grid.MH == mh)]
+            if w > 0:
+                alive &= iso.Mini.min() <= Mini[k] <= iso.Mini.max()
+                expected += w * np.interp(Mini[k], iso.Mini, iso.Vmag)
+        if alive:
+            np.testing.assert_allclose(res.Vmag[k], expected)
+        else:
+            assert np.isnan(res.Vmag[k]) and np.isnan(res.label[k])
+    assert res.Vmag.notna().mean() > 0.5
+    assert set(res.label.dropna().unique()) <= set(grid.label.unique())
+
+    # independent of the chunking
+    chunked = interpolator.interpolate_stars(Mini, logAge, MH, what=["Vmag", "logTe", "label"],
+                                             chunk_size=300)
+    pd.testing.assert_frame_equal(chunked, res)
+
+
+def test_concurrent_calls(interpolator):
+    rng = np.random.default_rng(2)
+    points = list(zip(rng.uniform(7, 8, 12), rng.uniform(-1, 0, 12)))
+    stars = rng.uniform(0.05, 5, 500), rng.uniform(7, 8, 500), rng.uniform(-1, 0, 500)
+    expected = [interpolator(logAge, MH, what=["Vmag", "label"]) for logAge, MH in points]
+    expected_stars = interpolator.interpolate_stars(*stars, what=["Vmag"])
+
+    # the arrays used by the interpolation cannot be modified
+    with pytest.raises(ValueError):
+        interpolator._lookup["columns"]["Vmag"][0] = 0.0
+    with pytest.raises(ValueError):
+        interpolator.coords["logAge"][0] = 0.0
+
+    # many threads hammering a single instance
+    n_threads = 6
+    barrier = threading.Barrier(n_threads)
+
+    def _work(k):
+        barrier.wait()
+        order = np.random.default_rng(k).permutation(len(points))
+        results = {}
+        for i in order:
+            results[i] = interpolator(*points[i], what=["Vmag", "label"])
+        return results, interpolator.interpolate_stars(*stars, what=["Vmag"], chunk_size=100)
+
+    with ThreadPoolExecutor(n_threads) as pool:
+        for results, res_stars in pool.map(_work, range(n_threads)):
+            for i, res in results.items():
+                pd.testing.assert_frame_equal(res, expected[i])
+            pd.testing.assert_frame_equal(res_stars, expected_stars)
+
+    results = interpolator.map(points, what=["Vmag", "label"], workers=4)
+    for res, exp in zip(results, expected):
+        pd.testing.assert_frame_equal(res, exp)
+    assert interpolator.map([]) == []
+
+
+def test_non_numeric_columns():
+    grid = make_isochrone_grid(logage=[7, 7.5], MH=[-1, 0], rows_per_isochrone=50)
+    grid["phase"] = np.where(grid["label"] < 2, "MS", "RGB")
+    interp = QuickInterpolator(grid)
+    expected = QuickInterpolator(grid.drop(columns="phase"))
+
+    # text columns are not interpolated, nor copied into the lookup arrays
+    assert "phase" in interp.columns and "phase" not in interp._lookup["columns"]
+    pd.testing.assert_frame_equal(interp(7.2, -0.4), expected(7.2, -0.4))
+    stars = [1.0, 2.0], [7.2, 7.4], [-0.5, -0.1]
+    pd.testing.assert_frame_equal(interp.interpolate_stars(*stars), expected.interpolate_stars(*stars))
+    with pytest.raises(KeyError, match="phase"):
+        interp(7.2, -0.4, what=["Vmag", "phase"])
+    with SharedInterpolatorPool(interp, workers=1) as pool:
+        pd.testing.assert_frame_equal(pool.map([(7.2, -0.4)])[0], expected(7.2, -0.4))
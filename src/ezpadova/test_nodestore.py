@@ -0,0 +1,86 @@
+import gzip
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .fitting import grid_likelihood
+from .interpolate import LazyInterpolator, QuickInterpolator, SharedInterpolatorPool
+from .nodestore import NodeStore
+from .parsec import parse_result
+from .testing import format_cmd_output, make_isochrone_grid
+
+
+@pytest.fixture(scope="module")
+def grid():
+    return make_isochrone_grid(logage=[7, 7.5, 8], MH=[-1, -0.5, 0], rows_per_isochrone=100)
+
+
+def test_build_store(tmp_path, grid):
+    data = gzip.compress(format_cmd_output(grid))
+    expected = parse_result(data)
+    # chunks smaller than an isochrone and not aligned on them
+    store = NodeStore.build(data, tmp_path / "store", chunksize=70)
+    assert len(store) == 9 and (7.5, -0.5) in store and (7.5, -0.4) not in store
+    assert store.columns == list(expected.columns) and store.comment == expected.attrs["comment"]
+    assert store.nodes.rows.tolist() == [100] * 9
+    np.testing.assert_array_equal(store.coords["logAge"], [7, 7.5, 8])
+
+    # only the index is read when opening a store
+    store = NodeStore(tmp_path / "store")
+    assert store.nbytes == 0
+    table = store.get([(8.0, -1.0), (7.0, 0.0)])
+    assert table.index.names == ["logAge", "MH"]
+    for node in [(8.0, -1.0), (7.0, 0.0)]:
+        pd.testing.assert_frame_equal(
+            table.loc[[node]].reset_index(),
+            expected.set_index(["logAge", "MH"]).loc[[node]].reset_index(),
+        )
+    with pytest.raises(KeyError):
+        store.load(7.5, -0.4)
+
+
+def test_lru_eviction(tmp_path, grid):
+    store = NodeStore.build(grid, tmp_path / "store")
+    size = int(store.load(7.0, -1.0).memory_usage(index=True).sum())
+    store = NodeStore(tmp_path / "store", max_bytes=2 * size)
+    for node in [(7.0, -1.0), (7.0, -0.5), (7.0, -1.0), (8.0, 0.0)]:
+        store.load(*node)
+    # (7.0, -0.5) is the least recently used
+    assert store.nbytes <= 2 * size
+    assert list(store._cache) == [(7.0, -1.0), (8.0, 0.0)]
+    assert (store.hits, store.misses) == (1, 3)
+    assert pickle.loads(pickle.dumps(store)).nbytes == 0
+
+
+def test_lazy_interpolator(tmp_path, grid):
+    data = format_cmd_output(grid)
+    NodeStore.build(data, tmp_path / "store", chunksize=1000)
+    quick = QuickInterpolator(parse_result(data))
+    lazy = LazyInterpolator(tmp_path / "store", max_bytes=50_000)
+    assert list(lazy.columns) == list(quick.columns)
+
+    for logAge, MH in [(7.2, -0.8), (7.5, -0.5), (7.9, -0.1)]:
+        pd.testing.assert_frame_equal(
+            lazy(logAge, MH, what=["Vmag", "logTe"]), quick(logAge, MH, what=["Vmag", "logTe"])
+        )
+    pd.testing.assert_frame_equal(lazy.get_closest(7.4, -0.6), quick.get_closest(7.4, -0.6))
+
+    rng = np.random.default_rng(1)
+    Mini, logAge, MH = rng.uniform(0.05, 5, 3000), rng.uniform(6.8, 8.2, 3000), rng.uniform(-1.2, 0.2, 3000)
+    pd.testing.assert_frame_equal(
+        lazy.interpolate_stars(Mini, logAge, MH, what=["Vmag", "label"], chunk_size=500),
+        quick.interpolate_stars(Mini, logAge, MH, what=["Vmag", "label"]),
+    )
+    assert lazy.store.nbytes <= 50_000
+
+    clone = pickle.loads(pickle.dumps(lazy))
+    assert clone.store.nbytes == 0
+    pd.testing.assert_frame_equal(clone(7.2, -0.8), quick(7.2, -0.8))
+
+    # the whole grid is never loaded
+    with pytest.raises(TypeError, match="LazyInterpolator"):
+        SharedInterpolatorPool(lazy)
+    with pytest.raises(TypeError, match="LazyInterpolator"):
+        grid_likelihood(lazy, np.zeros((3, 1)), ["Vmag"])
@@ -1,8 +1,29 @@
+import bz2
+import gzip
+import io
 import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-from .config import generate_doc, update_config
-from .parsec import build_query, get_file_archive_type, get_isochrones
+import numpy as np
+import pandas as pd
+import pytest
+
+from .config import configuration, generate_doc, update_config
+from .instrument import instrumentation
+from .interpolate import QuickInterpolator
+from .parsec import (
+    build_query,
+    get_file_archive_type,
+    get_isochrones,
+    get_multi_isochrones,
+    normalize_query,
+    parse_result,
+    query_key,
+)
+from .testing import FakeCMDServer, format_cmd_output, grid_from_query, make_cmd_output
 
 
 def test_get_file_archive_type():
@@ -77,3 +98,203 @@ def test_end_to_end():
 
 def test_readme_example():
     get_isochrones(photsys_file='gaiaEDR3', logage=(6, 10, 0.2), MH=(-2, 1, 0.4))
+
+
+def test_end_to_end_fake_server():
+    with FakeCMDServer() as server:
+        df = get_isochrones(logage=(6, 7, 0.5), MH=(-1, 0, 0.5))
+    assert len(server.queries) == 1
+    assert server.downloads == 1
+    assert len(df.groupby(["logAge", "MH"])) == 9
+
+
+def test_fake_server_bz2_payload():
+    events = []
+    server = FakeCMDServer(payload=lambda params: bz2.compress(grid_from_query(params)), compress=False)
+    with server, instrumentation(events.append):
+        df = get_isochrones(logage=(6, 7, 0.5), MH=(-1, 0, 0.5), use_cache=False)
+    assert len(server.queries) == 1
+    assert len(df.groupby(["logAge", "MH"])) == 9
+    decompress = [event for event in events if event["stage"] == "decompress"]
+    assert decompress[0]["format"] == "bz2"
+
+
+def test_instrumentation():
+    events = []
+    with FakeCMDServer(), instrumentation(events.append):
+        df = get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0), use_cache=False)
+    stages = [event["stage"] for event in events]
+    assert stages == ["submit", "server_wait", "download", "decompress", "parse"]
+    assert len({event["request"] for event in events}) == 1
+    assert all(event["status"] == "ok" for event in events)
+    assert events[-1]["rows"] == len(df)
+    assert events[3]["bytes"] == events[-1]["bytes"]
+
+
+def test_query_retries(monkeypatch):
+    monkeypatch.setitem(configuration["network"], "backoff_factor", 0.0)
+    events = []
+    with FakeCMDServer(fail_submit=1, fail_download=2) as server, instrumentation(events.append):
+        df = get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0))
+    assert len(df) > 0
+    # the form is only submitted again when the submission failed
+    assert len(server.queries) == 1
+    assert server.downloads == 3
+    # interrupted downloads resume where they stopped
+    assert len(server.ranges) == 2 and 0 < server.ranges[0] < server.ranges[1]
+    assert [event["step"] for event in events if event["stage"] == "retry"] == [
+        "submit", "download", "download"]
+
+
+def test_query_retries_exhausted(monkeypatch):
+    monkeypatch.setitem(configuration["network"], "backoff_factor", 0.0)
+    monkeypatch.setitem(configuration["network"], "retries", 1)
+    with FakeCMDServer(fail_submit=2), pytest.raises(RuntimeError, match="HTTP 503"):
+        get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0))
+
+
+def test_normalize_query():
+    assert normalize_query(isoc_lagelow=6) == normalize_query(isoc_lagelow="6.0")
+    assert query_key(isoc_lagelow=6) != query_key(isoc_lagelow=6.1)
+    assert normalize_query(photsys_file="ugriz")["photsys_file"].endswith("tab_mag_ugriz.dat")
+
+
+def test_coalesced_queries():
+    def slow_payload(params):
+        time.sleep(0.5)
+        return grid_from_query(params)
+
+    with FakeCMDServer(payload=slow_payload) as server, ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(get_isochrones, logage=(6, 7, 0.5), MH=(0, 0, 0))
+                   for _ in range(6)]
+        futures.append(pool.submit(get_isochrones, logage=(6, 7, 0.5), MH=(-1, -1, 0)))
+        results = [future.result() for future in futures]
+    assert len(server.queries) == 2
+    expected = results[0].copy()
+    # whichever caller ran the query, modifying a result does not affect the others
+    results[0]["Mini"] = -1.0
+    for res in results[1:-1]:
+        pd.testing.assert_frame_equal(res, expected)
+    assert len({id(res) for res in results}) == len(results)
+    assert (results[-1]["MH"] == -1).all()
+
+
+def test_get_multi_isochrones():
+    def _payload(params):
+        # same rows in all systems, with system-dependent magnitudes
+        data = parse_result(grid_from_query(params))
+        offset = 1.0 if "2mass" in params["photsys_file"] else 0.0
+        data[["Jmag", "Hmag", "Kmag"]] += offset
+        if "2mass" in params["photsys_file"]:
+            data = data.drop(columns=["Umag", "Bmag"])
+        return format_cmd_output(data)
+
+    with FakeCMDServer(_payload) as server:
+        res = get_multi_isochrones(["ubvrijhk", "2mass"], logage=(7, 8, 0.5), MH=(0, 0, 0))
+        assert len(server.queries) == 2
+        single = get_isochrones(logage=(7, 8, 0.5), MH=(0, 0, 0), photsys_file="ubvrijhk")
+
+    assert len(res) == len(single)
+    # shared columns once, differing ones suffixed by system
+    assert res.columns.tolist().count("Mini") == 1
+    assert {"Vmag", "Jmag_ubvrijhk", "Jmag_2mass", "Umag"} <= set(res.columns)
+    assert "Jmag" not in res.columns
+    np.testing.assert_allclose(res.Jmag_2mass - res.Jmag_ubvrijhk, 1.0, atol=1e-4)
+    pd.testing.assert_series_equal(res.Vmag, single.Vmag)
+
+    with pytest.raises(ValueError, match="unique"):
+        get_multi_isochrones(["2mass", "2mass"], logage=(7, 8, 0.5), MH=(0, 0, 0))
+
+    # lists of nodes, validated before any query
+    with FakeCMDServer(_payload) as server:
+        nodes = get_multi_isochrones(["ubvrijhk", "2mass"], logage=[7.0, 8.0], MH=[0.0], use_cache=False)
+        assert len(server.queries) == 2
+        with pytest.raises(ValueError):
+            get_multi_isochrones(["ubvrijhk", "2mass"], logage=[7.0, 8.0], MH=[0.0], photsys_version="none")
+        assert len(server.queries) == 2
+    assert sorted(set(nodes.logAge)) == [7.0, 8.0]
+    assert {"Jmag_ubvrijhk", "Jmag_2mass"} <= set(nodes.columns)
+
+
+def test_get_multi_isochrones_mismatch():
+    def _payload(params):
+        rows = 40 if "2mass" in params["photsys_file"] else 50
+        return grid_from_query(params, rows_per_isochrone=rows)
+
+    with FakeCMDServer(_payload), pytest.raises(ValueError, match="rows"):
+        get_multi_isochrones(["ubvrijhk", "2mass"], logage=(7, 8, 0.5), MH=(0, 0, 0))
+
+
+def test_get_isochrones_node_lists():
+    logage = [6.0, 6.1, 6.2, 6.3, 6.6, 8.0, 8.5]
+    MH = np.array([-1.0, 0.0, 0.5])
+    with FakeCMDServer() as server:
+        iso = get_isochrones(logage=logage, MH=MH)
+        # 2 age ranges x 1 metallicity range
+        assert len(server.queries) == 2
+        ages, metals = np.unique(iso.logAge), np.unique(iso.MH)
+        np.testing.assert_allclose(ages, logage)
+        np.testing.assert_allclose(metals, MH)
+        assert np.all(np.diff(iso.logAge) >= 0)
+
+        single = get_isochrones(logage=(6.6, 6.6, 0), MH=(0.5, 0.5, 0), use_cache=False)
+        selected = iso[(iso.logAge == 6.6) & (iso.MH == 0.5)].reset_index(drop=True)
+        pd.testing.assert_frame_equal(selected, single)
+
+        with pytest.raises(ValueError):
+            get_isochrones(logage=logage, MH=MH, return_df=False)
+
+
+def test_query_size_limits(monkeypatch):
+    monkeypatch.setitem(configuration["limits"], "max_isochrones", 10)
+    with FakeCMDServer() as server:
+        monkeypatch.setitem(configuration["limits"], "action", "raise")
+        with pytest.raises(ValueError, match="isochrones"):
+            get_isochrones(logage=(6, 7, 0.1), MH=(-1, 0, 0.5))
+        assert len(server.queries) == 0
+
+        monkeypatch.setitem(configuration["limits"], "action", "split")
+        iso = get_isochrones(logage=(6, 7, 0.1), MH=(-1, 0, 0.5))
+        assert len(server.queries) == 4
+        monkeypatch.setitem(configuration["limits"], "max_isochrones", None)
+        expected = get_isochrones(logage=(6, 7, 0.1), MH=(-1, 0, 0.5), use_cache=False)
+        pd.testing.assert_frame_equal(iso, expected)
+
+
+@pytest.mark.parametrize("compression", [None, "gz", "bz2", "zip"])
+def test_parse_compressed(tmp_path, compression):
+    data = make_cmd_output(500, rows_per_isochrone=50)
+    expected = parse_result(data)
+    if compression == "gz":
+        data = gzip.compress(data)
+    elif compression == "bz2":
+        data = bz2.compress(data)
+    elif compression == "zip":
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("isochrones.dat", data)
+        data = buffer.getvalue()
+
+    class _Pipe(io.RawIOBase):
+        """A non-seekable stream, as a socket or a pipe"""
+
+        def __init__(self, data):
+            self._data = BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            return self._data.readinto(b)
+
+    path = tmp_path / "isochrones.dat"
+    path.write_bytes(data)
+    stream = _Pipe(data)
+    with open(path, "rb") as f:
+        for source in (data, f, stream):
+            df = parse_result(source)
+            pd.testing.assert_frame_equal(df, expected)
+            assert df.attrs == expected.attrs
+        assert not f.closed and not stream.closed
+    pd.testing.assert_frame_equal(QuickInterpolator(path).data, QuickInterpolator(expected).data)
+    pd.testing.assert_frame_equal(QuickInterpolator(str(path)).data, QuickInterpolator(expected).data)
@@ -0,0 +1,78 @@
+import numpy as np
+
+from .config import configuration
+from .parsec import build_query
+from .planner import (
+    decompose,
+    estimate_query,
+    index_runs,
+    max_isochrones_per_query,
+    plan_queries,
+    plan_rectangles,
+    split_query,
+)
+
+
+def test_index_runs():
+    assert index_runs([]) == []
+    assert index_runs([4]) == [(4, 5, 1)]
+    assert index_runs([0, 1, 2, 3]) == [(0, 4, 1)]
+    assert index_runs([1, 3, 5, 6, 7, 10]) == [(1, 6, 2), (6, 8, 1), (10, 11, 1)]
+
+
+def test_plan_rectangles_cover_missing_nodes():
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        missing = rng.random((15, 6)) < 0.4
+        covered = np.zeros_like(missing, dtype=int)
+        for (a0, a1, da), (m0, m1, dm) in plan_rectangles(missing):
+            covered[np.ix_(np.arange(a0, a1, da), np.arange(m0, m1, dm))] += 1
+        np.testing.assert_array_equal(covered, missing.astype(int))
+
+
+def test_plan_queries():
+    kw = build_query(isoc_isagelog=1, isoc_lagelow=6, isoc_lageupp=7, isoc_dlage=0.1,
+                     isoc_ismetlog=1, isoc_metlow=-1, isoc_metupp=0, isoc_dmet=0.5)
+    missing = np.zeros((11, 3), dtype=bool)
+    missing[1::2, :2] = True
+    missing[:, 2] = True
+    queries = plan_queries(kw, missing)
+    ranges = sorted(
+        tuple(q[key] for key in ("isoc_lagelow", "isoc_lageupp", "isoc_dlage", "isoc_metlow", "isoc_metupp", "isoc_dmet"))
+        for q in queries
+    )
+    assert ranges == [(6.0, 7.0, 0.1, 0.0, 0.0, 0.0), (6.1, 6.9, 0.2, -1.0, -0.5, 0.5)]
+
+
+def test_decompose():
+    assert decompose([8.0]) == [(8.0, 8.0, 0.0)]
+    assert decompose([6.0, 6.1, 6.2, 6.3, 6.6, 8.0, 8.5]) == [(6.0, 6.6, 0.1), (8.0, 8.5, 0.5)]
+    # requests are cheap: no extra node
+    ranges = decompose([6.0, 6.1, 6.2, 6.3, 6.6], request_cost=0.5)
+    assert sum(round((high - low) / step) + 1 if step else 1 for low, high, step in ranges) == 5
+    # every value is a node of one range
+    values = np.sort(np.random.default_rng(2).choice(np.round(np.arange(6, 10.01, 0.05), 2), 30, replace=False))
+    nodes = np.concatenate([
+        low + step * np.arange(round((high - low) / step) + 1) if step else [low]
+        for low, high, step in decompose(values)
+    ])
+    assert np.all(np.min(np.abs(values[:, None] - nodes[None, :]), axis=1) < 1e-9)
+
+
+def test_estimate_and_split_query(monkeypatch):
+    kw = build_query(isoc_isagelog=1, isoc_lagelow=6, isoc_lageupp=10, isoc_dlage=0.05,
+                     isoc_ismetlog=1, isoc_metlow=-2, isoc_metupp=0.3, isoc_dmet=0.1)
+    monkeypatch.setitem(configuration["limits"], "rows_per_isochrone", 100)
+    monkeypatch.setitem(configuration["limits"], "bytes_per_row", 10)
+    assert estimate_query(kw) == {"isochrones": 81 * 24, "rows": 81 * 24 * 100, "bytes": 81 * 24 * 1000}
+
+    monkeypatch.setitem(configuration["limits"], "max_isochrones", None)
+    assert max_isochrones_per_query() is None
+    monkeypatch.setitem(configuration["limits"], "max_rows", 50_000)
+    assert max_isochrones_per_query() == 500
+
+    for max_isochrones in (500, 10):
+        parts = split_query(kw, max_isochrones)
+        sizes = [estimate_query(part)["isochrones"] for part in parts]
+        assert max(sizes) <= max_isochrones
+        assert sum(sizes) == 81 * 24
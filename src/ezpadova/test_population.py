@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from .population import iter_sample_stars, luminosity_function, sample_stars
+from .testing import make_isochrone_grid
+
+
+def test_sample_stars_n_stars():
+    grid = make_isochrone_grid(logage=[7, 8, 9], MH=[-1, 0], rows_per_isochrone=100)
+    stars = sample_stars(grid, n_stars=20_000, columns=["Vmag", "logTe"], seed=1)
+    assert len(stars) == 6 * 20_000
+    assert list(stars.columns) == ["logAge", "MH", "Mini", "Vmag", "logTe", "label"]
+    assert (stars.groupby(["logAge", "MH"]).size() == 20_000).all()
+
+    # the initial masses follow the IMF of each isochrone
+    for (logAge, MH), iso in grid.groupby(["logAge", "MH"]):
+        sub = stars[(stars.logAge == logAge) & (stars.MH == MH)]
+        assert iso.Mini.min() <= sub.Mini.min() and sub.Mini.max() <= iso.Mini.max()
+        imf = iso.int_IMF.to_numpy()
+        expected = (np.interp(1.0, iso.Mini, imf) - imf[0]) / (imf[-1] - imf[0])
+        assert abs((sub.Mini < 1.0).mean() - expected) < 0.01
+
+    # interpolated quantities follow the isochrone
+    iso = grid[(grid.logAge == 8) & (grid.MH == 0)]
+    sub = stars[(stars.logAge == 8) & (stars.MH == 0)]
+    np.testing.assert_allclose(sub.Vmag, np.interp(sub.Mini, iso.Mini, iso.Vmag), atol=0.05)
+
+
+def test_sample_stars_reproducible():
+    grid = make_isochrone_grid(logage=[7, 8], MH=[0], rows_per_isochrone=50)
+    first = sample_stars(grid, n_stars=1000, seed=3, chunk_size=300)
+    second = sample_stars(grid, n_stars=1000, seed=3, chunk_size=300)
+    assert first.equals(second)
+    chunks = list(iter_sample_stars(grid, n_stars=1000, seed=3, chunk_size=300))
+    assert [len(chunk) for chunk in chunks] == [300] * 6 + [200]
+    assert chunks[-1].equals(first.iloc[-200:].reset_index(drop=True))
+
+
+def test_sample_stars_total_mass():
+    grid = make_isochrone_grid(logage=[7, 9], MH=[0], rows_per_isochrone=50)
+    stars = sample_stars(grid, total_mass=[1e4, 1e5], seed=5)
+    counts = stars.groupby("logAge").size()
+    widths = grid.groupby("logAge").int_IMF.agg(lambda x: x.iloc[-1] - x.iloc[0])
+    expected = widths.to_numpy() * [1e4, 1e5]
+    assert np.all(np.abs(counts.to_numpy() - expected) < 5 * np.sqrt(expected))
+
+    with pytest.raises(ValueError):
+        sample_stars(grid, n_stars=10, total_mass=1e4)
+
+
+def test_luminosity_function():
+    grid = make_isochrone_grid(logage=[7, 8, 9], MH=[-1, 0], rows_per_isochrone=100)
+    lf = luminosity_function(grid, bands=["Vmag", "Kmag"], maginf=-15, magsup=20, deltamag=0.5)
+    assert len(lf) == 6 * 70
+    assert list(lf.columns) == ["logAge", "MH", "mag", "Vmag", "Kmag"]
+
+    # all the stars of each isochrone are counted once in each band
+    totals = lf.groupby(["logAge", "MH"])[["Vmag", "Kmag"]].sum()
+    widths = grid.groupby(["logAge", "MH"]).int_IMF.agg(lambda x: x.iloc[-1] - x.iloc[0])
+    np.testing.assert_allclose(totals.Vmag, widths)
+    np.testing.assert_allclose(totals.Kmag, widths)
+
+    # consistent with the number counts of a synthetic population
+    iso = grid[(grid.logAge == 8) & (grid.MH == 0)]
+    stars = sample_stars(iso, total_mass=1e5, columns=["Vmag"], seed=2)
+    lf = luminosity_function(iso, bands=["Vmag"], maginf=-10, magsup=20, deltamag=2,
+                             total_mass=1e5)
+    hist, _ = np.histogram(stars.Vmag, bins=np.arange(-10, 20.1, 2))
+    assert np.all(np.abs(hist - lf.Vmag) < 5 * np.sqrt(lf.Vmag) + 0.02 * lf.Vmag + 5)
+
+    # default bins from the configuration
+    assert len(luminosity_function(iso, bands=["Vmag"])) == 70
@@ -0,0 +1,57 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .config import configuration
+from .parsec import get_isochrones
+from .ratelimit import HostRateLimiter, configured_limiter
+from .testing import FakeCMDServer
+
+
+def _take_tokens(directory, count):
+    limiter = HostRateLimiter(directory, requests_per_second=20.0, burst=1)
+    for _ in range(count):
+        limiter.acquire()
+    return time.time()
+
+
+def test_token_bucket_is_shared_across_processes(tmp_path):
+    directory = str(tmp_path / "limits")
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        ends = list(pool.map(_take_tokens, [directory] * 2, [5, 5]))
+    # 10 requests at 20 per second, the first one immediately
+    assert 9 / 20.0 - 0.02 <= max(ends) - start < 3.0
+
+
+def test_concurrent_slots(tmp_path):
+    limiter = HostRateLimiter(str(tmp_path), requests_per_second=None, max_concurrent=2)
+    lock = threading.Lock()
+    active, peak = 0, 0
+
+    def _job(_):
+        nonlocal active, peak
+        with limiter.slot():
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(_job, range(6)))
+    assert peak == 2
+
+
+def test_configured_limiter(tmp_path, monkeypatch):
+    assert configured_limiter() is None
+    monkeypatch.setitem(configuration["rate_limit"], "enabled", True)
+    monkeypatch.setitem(configuration["rate_limit"], "directory", str(tmp_path))
+    monkeypatch.setitem(configuration["rate_limit"], "requests_per_second", 100.0)
+    limiter = configured_limiter()
+    assert limiter.directory == str(tmp_path) and limiter.max_concurrent == 4
+    with FakeCMDServer() as server:
+        get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0))
+    assert len(server.queries) == 1
+    assert (tmp_path / "bucket.json").exists()
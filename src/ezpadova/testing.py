@@ -0,0 +1,383 @@
+"""Helpers to exercise ezpadova without the CMD website.
+
+This module provides synthetic PARSEC-like isochrone grids and a local fake
+CMD server. They are used by the test suite and the benchmarks, but can also
+be handy to develop against ezpadova offline.
+
+>>> from ezpadova import get_isochrones
+>>> from ezpadova.testing import FakeCMDServer
+>>> with FakeCMDServer() as server:
+...     df = get_isochrones(logage=(6, 7, 0.5), MH=(0, 0, 0))
+"""
+
+from __future__ import annotations
+
+import gzip
+import re
+import threading
+from collections.abc import Callable, Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from typing import final
+from urllib.parse import parse_qsl, urlparse
+
+import numpy as np
+import pandas as pd
+
+from .config import configuration, reload_configuration
+
+#: photometric bands of the synthetic grids and their bolometric corrections slopes
+DEFAULT_BANDS = {
+    "Umag": 3.2,
+    "Bmag": 2.1,
+    "Vmag": 1.0,
+    "Rmag": 0.2,
+    "Imag": -0.6,
+    "Jmag": -1.8,
+    "Hmag": -2.4,
+    "Kmag": -2.6,
+}
+
+#: extinction coefficients A_band / A_V of the synthetic grids
+EXTINCTION_COEFFICIENTS = {
+    "Umag": 1.57,
+    "Bmag": 1.32,
+    "Vmag": 1.0,
+    "Rmag": 0.75,
+    "Imag": 0.48,
+    "Jmag": 0.28,
+    "Hmag": 0.18,
+    "Kmag": 0.12,
+}
+
+
+def _grid_shape(n_rows: int, rows_per_isochrone: int) -> tuple:
+    """Split a number of rows into a (n_ages, n_mh) grid of isochrones"""
+    n_iso = max(1, int(n_rows) // rows_per_isochrone)
+    n_mh = max(1, round(np.sqrt(n_iso / 4)))
+    n_age = int(np.ceil(n_iso / n_mh))
+    return n_age, n_mh
+
+
+def make_isochrone_grid(
+    n_rows: int = 10_000,
+    rows_per_isochrone: int = 200,
+    logage: Sequence[float] | None = None,
+    MH: Sequence[float] | None = None,
+    bands: dict | None = None,
+) -> pd.DataFrame:
+    """Generate a synthetic grid of PARSEC-like isochrones.
+
+    The values are not physical but follow the structure of the CMD outputs:
+    `Mini` and `int_IMF` increase monotonically along each isochrone, `label`
+    increases in contiguous blocks, and each (logAge, MH) node has the same
+    number of rows.
+
+    Parameters
+    ----------
+    n_rows : int
+        Approximate total number of rows of the grid. Ignored if both `logage`
+        and `MH` are provided.
+    rows_per_isochrone : int
+        Number of rows of each isochrone.
+    logage : Sequence[float], optional
+        Explicit log(age/yr) nodes. Default spans 6 to 10.
+    MH : Sequence[float], optional
+        Explicit [M/H] nodes. Default spans -2 to 0.3.
+    bands : dict, optional
+        Mapping of magnitude column names to a bolometric correction slope.
+        Default to :data:`DEFAULT_BANDS`.
+
+    Returns
+    -------
+    pd.DataFrame
+        The synthetic grid sorted by (logAge, MH, Mini).
+    """
+    bands = DEFAULT_BANDS if bands is None else bands
+    n_age, n_mh = _grid_shape(n_rows, rows_per_isochrone)
+    if logage is None:
+        logage = np.round(np.linspace(6.0, 10.0, n_age), 4)
+    if MH is None:
+        MH = np.round(np.linspace(-2.0, 0.3, n_mh), 4)
+    logage = np.atleast_1d(np.asarray(logage, dtype=float))
+    MH = np.atleast_1d(np.asarray(MH, dtype=float))
+
+    n = rows_per_isochrone
+    age_, mh_ = (k.ravel() for k in np.meshgrid(logage, MH, indexing="ij"))
+    age = np.repeat(age_, n)
+    mh = np.repeat(mh_, n)
+
+    # maximum initial mass still alive, roughly the turn-off mass
+    mmax = np.clip(10 ** ((10.2 - age_) / 2.5), 0.7, 120.0)
+    frac = np.tile(np.linspace(0.0, 1.0, n), len(age_))
+    mini = 0.09 * (np.repeat(mmax, n) / 0.09) ** frac
+    int_imf = 1.3 * (1.0 - (mini / 0.09) ** -1.3)
+    mass = mini * (1.0 - 0.1 * frac**4)
+    logl = 3.8 * np.log10(mini) + 0.1 * mh + 2.0 * frac**3
+    logte = 3.76 + 0.25 * np.log10(mini) - 0.05 * mh - 0.3 * frac**3
+    logg = 4.44 + np.log10(mass) - logl + 4 * (logte - 3.7617)
+
+    # evolutionary phases in contiguous blocks along each isochrone
+    edges = np.array([0.0, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.01])
+    label = np.searchsorted(edges, frac, side="right") - 1
+
+    data = {
+        "Zini": 0.0152 * 10**mh,
+        "MH": mh,
+        "logAge": age,
+        "Mini": mini,
+        "int_IMF": int_imf,
+        "Mass": mass,
+        "logL": logl,
+        "logTe": logte,
+        "logg": logg,
+        "label": label,
+        "mbolmag": 4.77 - 2.5 * logl,
+    }
+    for name, slope in bands.items():
+        data[name] = data["mbolmag"] - slope * (logte - 3.7617)
+    return pd.DataFrame(data)
+
+
+def format_cmd_output(df: pd.DataFrame, comment: str = "") -> bytes:
+    """Format a table the way the CMD website returns isochrone tables.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The table to format.
+    comment : str
+        Additional header lines.
+
+    Returns
+    -------
+    bytes
+        The table as `#`-commented header followed by whitespace separated values.
+    """
+    header = [
+        "# File generated by ezpadova.testing (synthetic isochrones)",
+        "# Synthetic grid, values are not physical",
+    ]
+    header += [f"# {line}" for line in comment.splitlines()]
+    header.append("# " + " ".join(df.columns))
+    # grid coordinates are always written as decimals, as the CMD website does
+    df = df.copy()
+    for name in ("logAge", "MH"):
+        if name in df.columns:
+            df[name] = np.char.mod("%.4f", df[name].to_numpy(dtype=float))
+    buf = StringIO()
+    buf.write("\n".join(header) + "\n")
+    df.to_csv(buf, sep=" ", header=False, index=False, float_format="%.6g")
+    buf.write("#isochrone terminated\n")
+    return buf.getvalue().encode("utf-8")
+
+
+def make_cmd_output(n_rows: int = 10_000, **kwargs) -> bytes:
+    """Generate a synthetic CMD output table (see :func:`make_isochrone_grid`)"""
+    return format_cmd_output(make_isochrone_grid(n_rows, **kwargs))
+
+
+def grid_from_query(params: dict, rows_per_isochrone: int = 50) -> bytes:
+    """Generate a synthetic CMD output matching the grid requested by a query.
+
+    Only log(age) and [M/H] queries are reproduced exactly, linear ages and Z
+    are converted to their logarithmic counterparts. Magnitudes are reddened
+    by `extinction_av` with the :data:`EXTINCTION_COEFFICIENTS`.
+
+    Parameters
+    ----------
+    params : dict
+        The query parameters sent to the CMD website (see :func:`ezpadova.parsec.build_query`)
+    rows_per_isochrone : int
+        Number of rows of each isochrone.
+
+    Returns
+    -------
+    bytes
+        The synthetic CMD output.
+    """
+
+    def _nodes(low, high, step):
+        low, high, step = float(low), float(high), float(step)
+        if step <= 0:
+            return np.array([low])
+        return low + step * np.arange(int(np.floor((high - low) / step + 1e-6)) + 1)
+
+    if int(params.get("isoc_isagelog", 1)) == 1:
+        ages = _nodes(params["isoc_lagelow"], params["isoc_lageupp"], params["isoc_dlage"])
+    else:
+        ages = np.log10(_nodes(params["isoc_agelow"], params["isoc_ageupp"], params["isoc_dage"]))
+    if int(params.get("isoc_ismetlog", 1)) == 1:
+        mh = _nodes(params["isoc_metlow"], params["isoc_metupp"], params["isoc_dmet"])
+    else:
+        mh = np.log10(_nodes(params["isoc_zlow"], params["isoc_zupp"], params["isoc_dz"]) / 0.0152)
+    grid = make_isochrone_grid(
+        rows_per_isochrone=rows_per_isochrone,
+        logage=np.round(ages, 4),
+        MH=np.round(mh, 4),
+    )
+    av = float(params.get("extinction_av", 0.0))
+    for band, coeff in EXTINCTION_COEFFICIENTS.items():
+        grid[band] += av * coeff
+    return format_cmd_output(grid)
+
+
+@final
+class FakeCMDServer:
+    """A local HTTP server mimicking the CMD website.
+
+    The server answers the form submission with a page referring to an
+    `outputNNN.dat` file and serves that file afterwards. While the context
+    is active, `configuration['url']` points to the local server.
+
+    Parameters
+    ----------
+    payload : bytes | Callable[[dict], bytes], optional
+        The table to serve, or a function that generates it from the submitted
+        query parameters. Default to :func:`grid_from_query`.
+    compress : bool
+        If set, serve the table gzip-compressed as the CMD website does.
+    fail_submit : int
+        Number of form submissions answered with an HTTP 503 error before
+        the server behaves normally.
+    fail_download : int
+        Number of downloads interrupted halfway before the server behaves normally.
+
+    Attributes
+    ----------
+    queries : list
+        The query parameters of each successful form submission.
+    downloads : int
+        The number of table downloads served (including interrupted ones).
+    ranges : list
+        The byte offsets of the HTTP Range requests received.
+    """
+
+    def __init__(
+        self,
+        payload: bytes | Callable[[dict], bytes] | None = None,
+        compress: bool = True,
+        fail_submit: int = 0,
+        fail_download: int = 0,
+    ):
+        self.payload = grid_from_query if payload is None else payload
+        self.compress = compress
+        self.fail_submit = fail_submit
+        self.fail_download = fail_download
+        self.queries = []
+        self.downloads = 0
+        self.ranges = []
+        self._outputs = {}
+        self._static = None
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+        self._previous_url = None
+
+    def _static_payload(self) -> bytes:
+        """Return the (compressed) static payload, computed only once"""
+        with self._lock:
+            if self._static is None:
+                self._static = gzip.compress(self.payload) if self.compress else self.payload
+        return self._static
+
+    @property
+    def url(self) -> str:
+        """URL of the fake form"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/cgi-bin/cmd"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: bytes, content_type: str = "text/html"):
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                with server._lock:
+                    failing = server.fail_submit > 0
+                    server.fail_submit -= int(failing)
+                if failing:
+                    self._send(503, b"Service Unavailable")
+                    return
+                params = dict(parse_qsl(urlparse(self.path).query))
+                if callable(server.payload):
+                    body = server.payload(params)
+                    if server.compress:
+                        body = gzip.compress(body)
+                else:
+                    body = server._static_payload()
+                with server._lock:
+                    name = f"output{len(server.queries) + 1000:d}"
+                    server.queries.append(params)
+                    server._outputs[name] = body
+                page = f'<html><body><a href="../tmp/{name}.dat">{name}.dat</a></body></html>'
+                self._send(200, page.encode("utf-8"))
+
+            def do_GET(self):
+                match = re.search(r"/tmp/(output\d+)\.dat", self.path)
+                body = server._outputs.get(match.group(1)) if match else None
+                if body is None:
+                    self._send(404, b"not found")
+                    return
+                offset = 0
+                match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                with server._lock:
+                    server.downloads += 1
+                    if match:
+                        offset = int(match.group(1))
+                        server.ranges.append(offset)
+                    failing = server.fail_download > 0
+                    server.fail_download -= int(failing)
+                self.send_response(206 if offset else 200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(body) - offset))
+                if offset:
+                    self.send_header(
+                        "Content-Range", f"bytes {offset}-{len(body) - 1}/{len(body)}"
+                    )
+                self.end_headers()
+                if failing:
+                    # interrupt the transfer halfway
+                    self.wfile.write(body[offset:offset + (len(body) - offset) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(body[offset:])
+
+        return Handler
+
+    def start(self) -> FakeCMDServer:
+        """Start serving and redirect `configuration['url']` to this server"""
+        if "photsys_file" not in configuration:
+            reload_configuration()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        self._previous_url = configuration["url"]
+        configuration["url"] = self.url
+        return self
+
+    def stop(self):
+        """Stop serving and restore `configuration['url']`"""
+        configuration["url"] = self._previous_url
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> FakeCMDServer:
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,9 +1,24 @@
 """ This module contains utility functions used by the ezpadova package. """
+
+from __future__ import annotations
+
+import bz2
+import gzip
+import os
 import re
+import tempfile
+import threading
 import warnings
+import zipfile
+from collections.abc import Callable, Hashable, Iterator
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager
 from functools import wraps
-from io import BytesIO
-from typing import Union
+from io import BufferedReader, BytesIO
+from typing import Any, BinaryIO
+
+#: columns identifying an isochrone in the tables
+NODE_KEYS = ("logAge", "MH")
 
 
 def dedent(text: str) -> str:
@@ -101,8 +116,8 @@ def deprecated_replacedby(replace_by):
 
 
 def get_file_archive_type(
-    filename: Union[str, BytesIO], stream: bool = False
-) -> Union[str, None]:
+    filename: str | BytesIO, stream: bool = False
+) -> str | None:
     """Detect the type of a potentially compressed file.
 
     This function checks the beginning of a file to determine if it is compressed
@@ -141,3 +156,153 @@ def get_file_archive_type(
             return filetype
 
     return None
+
+
+@contextmanager
+def open_decompressed(
+    source: str | os.PathLike | bytes | BinaryIO
+) -> Iterator[BinaryIO]:
+    """Open a file, bytes, or binary stream, decompressing it on the fly.
+
+    The compression is detected with :func:`get_file_archive_type` from the
+    first bytes of the data, without reading further. gzip and bzip2 data are
+    decompressed as they are read; zip archives must contain a single file
+    (non-seekable zip streams are read into memory first, as the archive
+    directory sits at its end).
+
+    Streams passed in are left open; files opened from a path are closed on exit.
+
+    Args:
+        source (str | os.PathLike | bytes | BinaryIO): A file path, the raw
+            content, or a binary stream, compressed or not.
+
+    Yields:
+        BinaryIO: A binary stream of the decompressed content, with a `peek` method.
+
+    Raises:
+        ValueError: If a zip archive does not contain exactly one file.
+    """
+    with ExitStack() as stack:
+        if isinstance(source, (str, os.PathLike)):
+            source = stack.enter_context(open(source, "rb"))
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            source = BytesIO(source)
+        if not hasattr(source, "peek"):
+            # peeking at the magic bytes must not consume them; detaching the
+            # buffer on exit keeps the caller's stream open
+            source = BufferedReader(source)
+            stack.callback(source.detach)
+
+        typ = get_file_archive_type(source.peek(4)[:4], stream=True)
+        if typ == "gz":
+            stream = stack.enter_context(gzip.GzipFile(fileobj=source, mode="rb"))
+        elif typ == "bz2":
+            stream = stack.enter_context(bz2.BZ2File(source, mode="rb"))
+        elif typ == "zip":
+            if not source.seekable():
+                source = BytesIO(source.read())
+            archive = stack.enter_context(zipfile.ZipFile(source))
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if len(members) != 1:
+                raise ValueError(f"Expecting a zip archive of a single file, got {len(members)} files.")
+            stream = stack.enter_context(archive.open(members[0]))
+        else:
+            stream = source
+        yield stream
+
+
+def read_header(stream: BinaryIO, comment: str = "#") -> tuple[list[str], str]:
+    """Read the leading comment lines of a table, leaving the stream at the first data line.
+
+    Args:
+        stream (BinaryIO): A binary stream with a `peek` method (see :func:`open_decompressed`).
+        comment (str): The character used to denote comment lines.
+
+    Returns:
+        tuple[list[str], str]: The column names from the header line and the other comment lines.
+
+    Raises:
+        ValueError: If the data does not start with a commented header line.
+    """
+    marker = comment.encode("utf-8")
+    lines = []
+    while stream.peek(len(marker))[: len(marker)] == marker:
+        lines.append(stream.readline().decode("utf-8"))
+    if not lines:
+        raise ValueError("Expecting a commented header line at the start of the table.")
+    header = lines[-1].replace(comment, "").strip().split()
+    return header, "\n".join(k.replace(comment, "").strip() for k in lines[:-1])
+
+
+def write_atomic(path: str | os.PathLike, data: bytes):
+    """Write `data` to `path` so that readers never see partial files.
+
+    The data are written to a temporary file of the same directory (created
+    if needed), which then replaces `path` at once.
+
+    Args:
+        path (str | os.PathLike): The destination file.
+        data (bytes): The content of the file.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls sharing the same key.
+
+    While a call for a given key is in progress, any other call with the same
+    key waits for it and receives the same result (or exception) instead of
+    running the function again. Once the call completes, the key is released.
+
+    Example:
+        .. code-block:: python
+
+            flight = SingleFlight()
+            # from many threads at once
+            result, shared = flight.do(key, expensive_function, *args)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> tuple[Any, bool]:
+        """Call `func(*args, **kwargs)` unless a call with the same key is in progress.
+
+        Parameters:
+            key (Hashable): The key identifying identical calls.
+            func (Callable): The function to call.
+            *args, **kwargs: Arguments passed to `func`.
+
+        Returns:
+            tuple[Any, bool]: The result of the call and whether it was shared
+                              with (i.e., computed by) another caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result(), True
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as error:
+            call.set_exception(error)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]